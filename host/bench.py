@@ -0,0 +1,249 @@
+"""
+  ____  _           ____        _
+ |  _ \(_) ___ ___ | __ )  ___ | |_
+ | |_) | |/ __/ _ \|  _ \ / _ \| __|
+ |  __/| | (_| (_) | |_) | (_) | |_
+ |_|   |_|\___\___/|____/ \___/ \__|
+ Host benchmark, runs the real main loop headless against the device models
+
+ Every frame ends in FramePacer.wait(), which is where the frame is measured:
+ host time spent rendering, SPI and I2C traffic, Python allocations and a
+ hash of what the panel now shows. The hashes can be recorded as golden
+ frames and later runs compared against them.
+
+   python3 host/bench.py                        report on 300 frames
+   python3 host/bench.py --golden host/golden.txt   fail on any changed frame
+   python3 host/bench.py --record host/golden.txt   store new golden frames
+   python3 host/bench.py --set COLOUR_MODE=2       change a main.py setting
+
+ The virtual clock is frozen by default so runs are repeatable. Render times
+ are host CPU times and allocations include the stand-in framebuf and
+ devices, so both are only useful compared with other host runs.
+
+ By Matthew Page
+
+"""
+import argparse
+import hashlib
+import os
+import re
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+HOST = os.path.dirname(os.path.abspath(__file__))
+PYTHON = os.path.join(os.path.dirname(HOST), "python")
+sys.path[:0] = [HOST, PYTHON]
+
+import devices
+import machine
+import utime
+
+SCRIPTS = {
+    "knocks": lambda: devices.knocks([1.0, 9.0]),
+    "resting": lambda: devices.resting,
+    "wobble": lambda: devices.wobble(),
+}
+
+
+class Finished(Exception):
+    pass
+
+
+class Frame:
+    """ Measurements for one frame"""
+
+    def __init__(self, render_us, spi_bytes, i2c_transactions, alloc_bytes, digest, state):
+        self.render_us = render_us
+        self.spi_bytes = spi_bytes
+        self.i2c_transactions = i2c_transactions
+        self.alloc_bytes = alloc_bytes
+        self.digest = digest
+        self.state = state
+
+
+class Bench:
+    """ Run main.py until the given number of frames have been shown"""
+
+    def __init__(self, frames, script="knocks", allocations=True, check=False, flash=None, settings=()):
+        self.frames = frames
+        self.settings = settings
+        self.flash = flash
+        self.allocations = allocations
+        self.check = check
+        self.results = []
+        self.mismatched = 0
+        self.namespace = {"__name__": "__main__"}
+        self.panel, self.sensor = devices.install(SCRIPTS[script]())
+
+    def _frame_end(self, pacer):
+        now = time.perf_counter_ns()
+        alloc = 0
+        if self.allocations:
+            current, peak = tracemalloc.get_traced_memory()
+            alloc = peak - self.alloc_start
+        lcd = self.namespace.get("LCD")
+        if self.check and lcd is not None and lcd.front is None:
+            if rgb565(lcd) != bytes(self.panel.gram):
+                self.mismatched += 1
+        self.results.append(Frame(
+            (now - self.started) // 1000,
+            machine.stats["spi_bytes"],
+            machine.stats["i2c_transactions"],
+            alloc,
+            hashlib.md5(self.panel.shown()).hexdigest()[:12],
+            self.namespace.get("state")))
+        if len(self.results) >= self.frames:
+            raise Finished
+
+    def _frame_start(self):
+        machine.reset_stats()
+        if self.allocations:
+            tracemalloc.reset_peak()
+            self.alloc_start = tracemalloc.get_traced_memory()[0]
+        self.started = time.perf_counter_ns()
+
+    def run(self):
+        import pacer
+        wait = pacer.FramePacer.wait
+        bench = self
+
+        def measured_wait(self):
+            bench._frame_end(self)
+            wait(self)
+            bench._frame_start()
+
+        pacer.FramePacer.wait = measured_wait
+        if self.allocations:
+            tracemalloc.start()
+        self._frame_start()
+        path = os.path.join(PYTHON, "main.py")
+
+        # Files the bot saves go in a folder standing in for the flash, a
+        # fresh one each run unless one is given
+        cwd = os.getcwd()
+        flash = self.flash or tempfile.mkdtemp(prefix="picobot-flash-")
+        os.makedirs(flash, exist_ok=True)
+        os.chdir(flash)
+        try:
+            with open(path) as f:
+                source = f.read()
+            for name, value in self.settings:
+                source, found = re.subn(r"^{} = [^#\n]*".format(name), "{} = {} ".format(name, value), source, flags=re.M)
+                if not found:
+                    raise ValueError("main.py has no setting {}".format(name))
+            exec(compile(source, path, "exec"), self.namespace)
+        except Finished:
+            pass
+        finally:
+            os.chdir(cwd)
+            if not self.flash:
+                shutil.rmtree(flash, ignore_errors=True)
+            pacer.FramePacer.wait = wait
+            if self.allocations:
+                tracemalloc.stop()
+        return self.results
+
+
+def rgb565(lcd):
+    """ The frame buffer as the panel should show it, indexed buffers are
+    expanded through the palette"""
+    if lcd.palette is None:
+        return bytes(lcd.buffer)
+    pixels = bytearray(lcd.width * lcd.height * 2)
+    lcd.expand(lcd.buffer, 0, lcd.width * lcd.height, lcd.palette, pixels)
+    return bytes(pixels)
+
+
+def summary(name, values, unit):
+    ordered = sorted(values)
+    mean = sum(ordered) / len(ordered)
+    p95 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+    return "{:<18} mean {:>10.1f}  p95 {:>8}  max {:>8} {}".format(name, mean, p95, ordered[-1], unit)
+
+
+def report(results, bench):
+    # The first frame includes start up, display init and allocating buffers
+    frames = results[1:] if len(results) > 1 else results
+    print("frames {}  states {}".format(len(results), transitions(results)))
+    print(summary("render", [f.render_us for f in frames], "us"))
+    print(summary("spi", [f.spi_bytes for f in frames], "bytes"))
+    print(summary("i2c", [f.i2c_transactions for f in frames], "transactions"))
+    if bench.allocations:
+        print(summary("allocated", [f.alloc_bytes for f in frames], "bytes"))
+    print("start up {} us, {} spi bytes".format(results[0].render_us, results[0].spi_bytes))
+    lcd = bench.namespace.get("LCD")
+    if lcd is not None:
+        print("display init {} us".format(lcd.init_us))
+    latency = bench.namespace.get("wakeLatency")
+    if latency is not None:
+        print("last wake {} us after the motion interrupt".format(latency))
+    if bench.check:
+        print("frames where the panel and frame buffer differ: {}".format(bench.mismatched))
+
+
+def transitions(results):
+    states = []
+    for index, frame in enumerate(results):
+        if not states or states[-1][1] != frame.state:
+            states.append((index, frame.state))
+    return states
+
+
+def load_golden(path):
+    with open(path) as f:
+        return [line.strip() for line in f if line.strip() and not line.startswith("#")]
+
+
+def compare(results, golden):
+    changed = [i for i, (f, g) in enumerate(zip(results, golden)) if f.digest != g]
+    if changed:
+        print("{} frames differ from golden, first {}".format(len(changed), changed[:10]))
+    if len(golden) != len(results):
+        # A truncated or stale golden file fails too, not just the frames both have
+        print("golden has {} frames, ran {}".format(len(golden), len(results)))
+        return False
+    if changed:
+        return False
+    print("golden frames match")
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the bot main loop on the host and measure each frame")
+    parser.add_argument("--frames", type=int, default=300)
+    parser.add_argument("--script", choices=sorted(SCRIPTS), default="knocks")
+    parser.add_argument("--realtime", action="store_true", help="let host time drive the clock, runs are not repeatable")
+    parser.add_argument("--no-alloc", action="store_true", help="skip tracemalloc, it slows rendering")
+    parser.add_argument("--check", action="store_true", help="compare the panel with the frame buffer every frame, single buffered only")
+    parser.add_argument("--golden", help="compare each frame with a golden file")
+    parser.add_argument("--record", help="write the frames to a golden file")
+    parser.add_argument("--flash", help="folder kept between runs for the files the bot saves, such as its calibration")
+    parser.add_argument("--set", action="append", default=[], metavar="NAME=VALUE",
+                        help="replace a main.py setting for this run, can be given more than once")
+    parser.add_argument("--dump", help="write the last frame shown to a PPM image")
+    args = parser.parse_args()
+
+    if not args.realtime:
+        utime.freeze()
+    settings = [setting.split("=", 1) for setting in args.set]
+    bench = Bench(args.frames, args.script, not args.no_alloc, args.check, args.flash, settings)
+    results = bench.run()
+    report(results, bench)
+
+    if args.dump:
+        with open(args.dump, "wb") as f:
+            f.write(bench.panel.ppm())
+    if args.record:
+        with open(args.record, "w") as f:
+            f.write("# frames={} script={}\n".format(args.frames, args.script))
+            f.write("\n".join(frame.digest for frame in results) + "\n")
+        print("recorded {} frames to {}".format(len(results), args.record))
+    if args.golden and not compare(results, load_golden(args.golden)):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,399 @@
+"""
+  ____  _           ____        _
+ |  _ \(_) ___ ___ | __ )  ___ | |_
+ | |_) | |/ __/ _ \|  _ \ / _ \| __|
+ |  __/| | (_| (_) | |_) | (_) | |_
+ |_|   |_|\___\___/|____/ \___/ \__|
+ Device models for the host stand-in layer
+
+ GC9A01 panel fed from the SPI stream, QMI8658 register model driven by a
+ motion script and a battery ADC source.
+
+ By Matthew Page
+
+"""
+import math
+import random
+import utime
+import machine
+
+PANEL_WIDTH = 240
+PANEL_HEIGHT = 240
+
+# Idle mode keeps the top bit of each channel. The high byte of a big endian
+# RGB565 pixel is RRRRRGGG and the low byte GGGBBBBB, the green top bit is in
+# the high byte
+IDLE_RED_GREEN = bytes((0xF8 if b & 0x80 else 0) | (0x07 if b & 0x04 else 0) for b in range(256))
+IDLE_GREEN_LOW = bytes(0xE0 if b & 0x04 else 0 for b in range(256))
+IDLE_BLUE = bytes(0x1F if b & 0x10 else 0 for b in range(256))
+
+
+class GC9A01:
+    """ Panel model, rebuilds the visible image from the commands the driver sends"""
+
+    def __init__(self, dc, cs):
+        self.dc = dc
+        self.cs = cs
+        self.gram = bytearray(PANEL_WIDTH * PANEL_HEIGHT * 2)
+        self.command = None
+        self.params = bytearray()
+        self.window = [0, 0, PANEL_WIDTH - 1, PANEL_HEIGHT - 1]
+        self.cx = 0
+        self.cy = 0
+        self.sleeping = True
+        self.display_on = False
+        self.idle = False
+        self.commands = 0
+        self.pixels_written = 0
+        self.ramwr = 0
+
+    def spi_write(self, data):
+        if machine.Pin(self.cs).value():
+            return
+        if not machine.Pin(self.dc).value():
+            for cmd in data:
+                self._start(cmd)
+            return
+        if self.command in (0x2C, 0x3C):
+            self._pixels(data)
+        else:
+            self.params.extend(data)
+            self._params()
+
+    def _start(self, cmd):
+        self.commands += 1
+        self.command = cmd
+        self.params = bytearray()
+        if cmd == 0x2C:
+            self.ramwr += 1
+            self.cx = self.window[0]
+            self.cy = self.window[1]
+        elif cmd == 0x10:
+            self.sleeping = True
+        elif cmd == 0x11:
+            self.sleeping = False
+        elif cmd == 0x28:
+            self.display_on = False
+        elif cmd == 0x29:
+            self.display_on = True
+        elif cmd == 0x38:
+            self.idle = False
+        elif cmd == 0x39:
+            self.idle = True
+
+    def _params(self):
+        p = self.params
+        if self.command == 0x2A and len(p) >= 4:
+            self.window[0] = (p[0] << 8) | p[1]
+            self.window[2] = (p[2] << 8) | p[3]
+        elif self.command == 0x2B and len(p) >= 4:
+            self.window[1] = (p[0] << 8) | p[1]
+            self.window[3] = (p[2] << 8) | p[3]
+
+    def _pixels(self, data):
+        x0, y0, x1, y1 = self.window
+        i = 0
+        n = len(data) & ~1
+        self.pixels_written += n // 2
+        while i < n:
+            run = min((x1 - self.cx + 1) * 2, n - i)
+            at = (self.cy * PANEL_WIDTH + self.cx) * 2
+            if self.cy < PANEL_HEIGHT and self.cx < PANEL_WIDTH:
+                self.gram[at:at + run] = data[i:i + run]
+            i += run
+            self.cx += run // 2
+            if self.cx > x1:
+                self.cx = x0
+                self.cy += 1
+                if self.cy > y1:
+                    self.cy = y0
+
+    def shown(self):
+        """ What the panel shows, as big endian RGB565 like the GRAM. In idle
+        mode each colour channel is only its top bit, all on or all off, so
+        dim colours go black"""
+        if not self.idle:
+            return bytes(self.gram)
+        high = bytes(self.gram[0::2])
+        low = bytes(self.gram[1::2])
+        out = bytearray(len(self.gram))
+        out[0::2] = high.translate(IDLE_RED_GREEN)
+        green = int.from_bytes(high.translate(IDLE_GREEN_LOW), "big")
+        blue = int.from_bytes(low.translate(IDLE_BLUE), "big")
+        out[1::2] = (green | blue).to_bytes(len(low), "big")
+        return bytes(out)
+
+    def rgb(self, x, y, shown=None):
+        """ Pixel as an (r, g, b) tuple of 8 bit values
+        shown: The panel image from shown(), read from the GRAM if None
+        """
+        at = (y * PANEL_WIDTH + x) * 2
+        image = self.gram if shown is None else shown
+        v = (image[at] << 8) | image[at + 1]
+        return (((v >> 11) & 0x1F) * 255 // 31, ((v >> 5) & 0x3F) * 255 // 63, (v & 0x1F) * 255 // 31)
+
+    def ppm(self):
+        """ The panel contents as a binary PPM image"""
+        out = bytearray(b"P6 240 240 255\n")
+        shown = self.shown()
+        for y in range(PANEL_HEIGHT):
+            for x in range(PANEL_WIDTH):
+                out.extend(self.rgb(x, y, shown))
+        return bytes(out)
+
+
+def resting(t):
+    """ Motion script for a bot sat still on its base, gravity along X"""
+    return (1.0, 0.0, 0.0, 0.0, 0.0, 0.0)
+
+
+def knocks(times, length=0.06):
+    """ Motion script with a sharp knock at each of the given times in seconds"""
+    def script(t):
+        for start in times:
+            if start <= t < start + length:
+                phase = (t - start) / length
+                kick = math.sin(phase * math.pi)
+                return (1.0 + 1.2 * kick, 1.5 * kick, 0.9 * kick, 180 * kick, -120 * kick, 60 * kick)
+        return resting(t)
+    return script
+
+
+def wobble(start=1.0, degrees=20, period=2.0):
+    """ Motion script that rocks the bot from side to side from a time in
+    seconds, the gyro turning the way the accelerometer sees gravity move"""
+    def script(t):
+        if t < start:
+            return resting(t)
+        phase = 2 * math.pi * (t - start) / period
+        angle = math.radians(degrees) * math.sin(phase)
+        rate = degrees * (2 * math.pi / period) * math.cos(phase)
+        return (math.cos(angle), math.sin(angle), 0.0, 0.0, 0.0, -rate)
+    return script
+
+
+class QMI8658Model:
+    """ Register model of the QMI8658 6-axis sensor"""
+
+    def __init__(self, script=resting, noise=0.01, seed=1, int1=None, int2=None):
+        self.script = script
+        self.noise = noise
+        self.random = random.Random(seed)
+        self.int1 = int1
+        self.int2 = int2
+        self.regs = bytearray(0x80)
+        self.regs[0x00] = 0x05
+        self.regs[0x01] = 0x7C
+        self.fifo = bytearray()
+        self.fifo_out = bytearray()
+        self.timestamp = 0
+        self.start = utime.ticks_us()
+        self.next_sample = 0
+        self.events = 0
+        self.wom_threshold = 0
+        self.wom_config = 0
+        self.wom_armed = False
+        self.wom_level = 0
+        self.samples_generated = 0
+        self.tap_settings = [20, 50, 250, 819, 409]
+        self.tap_state = 0
+        self.tap_count = 0
+        self.tap_last = None
+
+    # Sample generation
+
+    def odr(self):
+        rates = {0x03: 1000, 0x04: 500, 0x05: 250, 0x06: 125, 0x0C: 128, 0x0D: 21, 0x0E: 11, 0x0F: 3}
+        return rates.get(self.regs[0x03] & 0x0F, 1000)
+
+    def fifo_capacity(self):
+        return 16 << ((self.regs[0x14] >> 2) & 0x03)
+
+    def _sample(self, t):
+        ax, ay, az, gx, gy, gz = self.script(t)
+        n = self.noise
+        rnd = self.random.gauss
+        values = (
+            int((ax + rnd(0, n)) * 4096), int((ay + rnd(0, n)) * 4096), int((az + rnd(0, n)) * 4096),
+            int((gx + rnd(0, n * 50)) * 64), int((gy + rnd(0, n * 50)) * 64), int((gz + rnd(0, n * 50)) * 64),
+        )
+        out = bytearray(12)
+        for i in range(6):
+            v = max(-32768, min(32767, values[i])) & 0xFFFF
+            out[i * 2] = v & 0xFF
+            out[i * 2 + 1] = v >> 8
+        return out, (ax, ay, az)
+
+    def update(self, now=None):
+        """ Generate every sample due since the last update"""
+        if now is None:
+            now = utime.ticks_us()
+        elapsed = utime.ticks_diff(now, self.start)
+        period = 1_000_000 / self.odr()
+        # Long sleeps only need the last few seconds of samples
+        self.next_sample = max(self.next_sample, elapsed - 5_000_000)
+        enabled = self.regs[0x08] & 0x03
+        fired = False
+        while self.next_sample <= elapsed:
+            t = self.next_sample / 1_000_000
+            self.next_sample += period
+            if not enabled:
+                continue
+            data, accel = self._sample(t)
+            self.samples_generated += 1
+            self.timestamp = (self.timestamp + 1) & 0xFFFFFF
+            self.regs[0x30] = self.timestamp & 0xFF
+            self.regs[0x31] = (self.timestamp >> 8) & 0xFF
+            self.regs[0x32] = self.timestamp >> 16
+            self.regs[0x33] = 0x00
+            self.regs[0x34] = 25
+            self.regs[0x35:0x41] = data
+            if self.regs[0x14] & 0x03:
+                self.fifo.extend(data)
+                overflow = len(self.fifo) - self.fifo_capacity() * 12
+                if overflow > 0:
+                    if (self.regs[0x14] & 0x03) == 2:
+                        del self.fifo[:overflow]
+                    else:
+                        del self.fifo[-overflow:]
+            if self.wom_armed and self._wom(accel):
+                fired = True
+            if self.regs[0x09] & 0x01 and enabled & 0x01:
+                self._tap(accel)
+        return fired
+
+    def _tap(self, accel):
+        """ Tap engine: a peak that is over within the peak window, then quiet
+        for the tap window. A second within the double tap window is double."""
+        peak_window, tap_window, double_window, peak, quiet = self.tap_settings
+        size = math.sqrt((accel[0] - 1.0) ** 2 + accel[1] ** 2 + accel[2] ** 2)
+        loud = size * size * 1024 > peak
+        calm = size * 1024 < quiet
+        self.tap_count += 1
+        if self.tap_state == 0:
+            if loud:
+                self.tap_state = 1
+                self.tap_count = 0
+        elif self.tap_state == 1:
+            if calm:
+                self.tap_state = 2
+                self.tap_count = 0
+            elif self.tap_count > peak_window:
+                self.tap_state = 3
+        elif self.tap_state == 2:
+            if not calm:
+                self.tap_state = 3
+            elif self.tap_count >= tap_window:
+                self.tap_state = 0
+                double = self.tap_last is not None and self.samples_generated - self.tap_last <= double_window
+                self.regs[0x59] = 0x02 if double else 0x01
+                self.regs[0x2F] |= 0x02
+                self.tap_last = None if double else self.samples_generated
+        elif calm:
+            self.tap_state = 0
+
+    def _wom(self, accel):
+        limit = self.wom_threshold / 1000.0
+        moved = abs(accel[0] - 1.0) > limit or abs(accel[1]) > limit or abs(accel[2]) > limit
+        if not moved:
+            return False
+        self.events += 1
+        self.regs[0x2F] |= 0x04
+        self.wom_level ^= 1
+        pin = self.int2 if self.wom_config & 0x80 else self.int1
+        if pin is not None:
+            initial = (self.wom_config >> 6) & 1
+            machine.drive(pin, initial ^ self.wom_level)
+        return True
+
+    def idle_hook(self, now):
+        return self.update(now)
+
+    # Register interface
+
+    def _fifo_status(self):
+        fifo = self.fifo_out if self.regs[0x14] & 0x80 else self.fifo
+        words = len(fifo) // 2
+        status = (words >> 8) & 0x03
+        if fifo:
+            status |= 0x10
+        if len(fifo) // 12 >= max(1, self.regs[0x13]):
+            status |= 0x40
+        if len(fifo) >= self.fifo_capacity() * 12:
+            status |= 0x80
+        self.regs[0x15] = words & 0xFF
+        self.regs[0x16] = status
+
+    def read(self, reg, n):
+        self.update()
+        if reg == 0x17:
+            out = self.fifo_out[:n]
+            del self.fifo_out[:n]
+            return bytes(out) + bytes(n - len(out))
+        self._fifo_status()
+        out = bytes(self.regs[(reg + i) & 0x7F] for i in range(n))
+        if reg <= 0x2F < reg + n:
+            # Reading STATUS1 clears the motion and tap flags
+            self.regs[0x2F] &= ~0x06
+        return out
+
+    def write(self, reg, data):
+        self.update()
+        for value in data:
+            self.regs[reg & 0x7F] = value
+            if reg == 0x0A:
+                self._ctrl9(value)
+            reg += 1
+
+    def _ctrl9(self, cmd):
+        if cmd == 0x00:
+            self.regs[0x2D] &= ~0x80
+            return
+        if cmd == 0x04:
+            self.fifo = bytearray()
+        elif cmd == 0x05:
+            self.regs[0x14] |= 0x80
+            self.fifo_out = bytearray(self.fifo)
+            self.fifo = bytearray()
+        elif cmd == 0x08:
+            self.wom_threshold = self.regs[0x0B]
+            self.wom_config = self.regs[0x0C]
+            self.wom_armed = self.wom_threshold > 0
+            self.wom_level = 0
+        elif cmd == 0x0C:
+            page = self.regs[0x0B:0x13]
+            if page[7] == 0x01:
+                self.tap_settings[0] = page[0]
+                self.tap_settings[1] = page[2] | (page[3] << 8)
+                self.tap_settings[2] = page[4] | (page[5] << 8)
+            elif page[7] == 0x02:
+                self.tap_settings[3] = page[2] | (page[3] << 8)
+                self.tap_settings[4] = page[4] | (page[5] << 8)
+        self.regs[0x2D] |= 0x80
+
+
+class Battery:
+    """ ADC source for the battery divider, a slowly draining cell with noise"""
+
+    def __init__(self, volts=3.9, drain=0.0, noise=0.01, seed=2):
+        self.volts = volts
+        self.drain = drain
+        self.noise = noise
+        self.random = random.Random(seed)
+        self.start = utime.ticks_ms()
+
+    def __call__(self):
+        hours = utime.ticks_diff(utime.ticks_ms(), self.start) / 3_600_000
+        v = self.volts - self.drain * hours + self.random.gauss(0, self.noise)
+        return max(0, min(65535, int(v / 2 / 3.3 * 65535)))
+
+
+def install(script=resting, battery=None):
+    """ Wire up the board: panel on SPI1, sensor on I2C1 and the battery ADC"""
+    panel = GC9A01(dc=8, cs=9)
+    machine.attach_spi(1, panel)
+    sensor = QMI8658Model(script, int1=23, int2=24)
+    machine.attach_i2c(1, 0x6B, sensor)
+    machine.on_idle(sensor.idle_hook)
+    machine.attach_adc(29, battery if battery is not None else Battery())
+    return panel, sensor
@@ -0,0 +1,250 @@
+"""
+  ____  _           ____        _
+ |  _ \(_) ___ ___ | __ )  ___ | |_
+ | |_) | |/ __/ _ \|  _ \ / _ \| __|
+ |  __/| | (_| (_) | |_) | (_) | |_
+ |_|   |_|\___\___/|____/ \___/ \__|
+ Detection latency and false alarms for the motion events
+
+ Runs python/events.py over labelled motion, fed in frame sized batches as
+ the bot reads them, and matches what it finds with the labels. The built in
+ scenes are made from motion scripts with the same noise as the host sensor
+ model. A CSV trace of raw readings can be scored too, one sample a line:
+ ax,ay,az,gx,gy,gz and optionally the name of an event that starts on that
+ sample (tap, double_tap, shake, free_fall, tilt). A binary trace recorded on
+ the bot with TRACE_RECORD, see python/sensortrace.py, is read as it is, at
+ its own rate and with no labels.
+
+   python3 host/events_eval.py
+   python3 host/events_eval.py --trace bench.csv --rate 250
+   python3 host/events_eval.py --trace trace.bin
+
+ Latency is from the labelled start to the sample the event was found on,
+ "seen" adds the wait for the frame that reads it.
+
+ By Matthew Page
+
+"""
+import argparse
+import math
+import os
+import random
+import sys
+from array import array
+
+HOST = os.path.dirname(os.path.abspath(__file__))
+PYTHON = os.path.join(os.path.dirname(HOST), "python")
+sys.path[:0] = [HOST, PYTHON]
+
+import devices
+from sensors import SampleBatch
+import events
+import sensortrace
+
+RATE = 250
+FPS = 20
+NOISE = 0.01
+MATCH_S = 1.5              # Longest an event can be found after its label
+
+# Wake thresholds from main.py
+MOVE_RAW = (int(1.8 * 4096), 4096, int(0.8 * 4096), 50 * 64, 50 * 64, 50 * 64)
+
+# Events that are scored, moves are reported but not scored
+SCORED = (events.EVENT_TAP, events.EVENT_DOUBLE_TAP, events.EVENT_SHAKE, events.EVENT_FREE_FALL, events.EVENT_TILT)
+
+
+def tap(times, g=2.0, length=0.02):
+    """ Motion script with a short sharp tap on Z at each time in seconds"""
+    def script(t):
+        for start in times:
+            if start <= t < start + length:
+                return (1.0, 0.0, g * math.sin(math.pi * (t - start) / length), 0.0, 0.0, 0.0)
+        return devices.resting(t)
+    return script
+
+
+def shake(start, length, g=1.5, hz=4.0):
+    """ Motion script shaken from side to side"""
+    def script(t):
+        if start <= t < start + length:
+            phase = 2 * math.pi * hz * (t - start)
+            return (1.0, g * math.sin(phase), 0.0, 0.0, 0.0, 200 * math.cos(phase))
+        return devices.resting(t)
+    return script
+
+
+def fall(start, length):
+    """ Motion script dropped, weightless for a moment then landing"""
+    def script(t):
+        if start <= t < start + length:
+            return (0.02, 0.0, 0.01, 0.0, 0.0, 0.0)
+        if start + length <= t < start + length + 0.03:
+            return (3.0, 0.5, 0.2, 0.0, 0.0, 0.0)
+        return devices.resting(t)
+    return script
+
+
+def lean(start, degrees, turn=0.3):
+    """ Motion script that leans over and stays there"""
+    def script(t):
+        if t < start:
+            return devices.resting(t)
+        fraction = min(1.0, (t - start) / turn)
+        angle = math.radians(degrees) * fraction
+        rate = degrees / turn if fraction < 1.0 else 0.0
+        return (math.cos(angle), 0.0, math.sin(angle), 0.0, rate, 0.0)
+    return script
+
+
+# Name, motion script, seconds and the labelled events as (seconds, event)
+SCENES = (
+    ("taps", tap([1.0, 3.0, 5.0]), 6.0,
+        [(1.0, events.EVENT_TAP), (3.0, events.EVENT_TAP), (5.0, events.EVENT_TAP)]),
+    ("double taps", tap([1.0, 1.25, 4.0, 4.3]), 6.0,
+        [(1.0, events.EVENT_TAP), (1.25, events.EVENT_TAP), (1.25, events.EVENT_DOUBLE_TAP),
+         (4.0, events.EVENT_TAP), (4.3, events.EVENT_TAP), (4.3, events.EVENT_DOUBLE_TAP)]),
+    ("knocks", devices.knocks([1.0, 3.0]), 5.0,
+        [(1.0, events.EVENT_TAP), (3.0, events.EVENT_TAP)]),
+    ("shake", shake(1.0, 1.5), 4.0, [(1.0, events.EVENT_SHAKE)]),
+    ("free fall", fall(1.0, 0.3), 3.0, [(1.0, events.EVENT_FREE_FALL)]),
+    ("tilt", lean(1.0, 45), 4.0, [(1.0, events.EVENT_TILT)]),
+    ("resting", devices.resting, 60.0, []),
+    ("wobble", devices.wobble(1.0), 20.0, []),
+)
+
+
+def generate(script, seconds, rate, seed=1):
+    """ Raw readings from a motion script, with the host model's noise"""
+    rnd = random.Random(seed)
+    data = array('h')
+    for i in range(int(seconds * rate)):
+        values = script(i / rate)
+        for c in range(6):
+            scale = 4096 if c < 3 else 64
+            spread = NOISE if c < 3 else NOISE * 50
+            data.append(max(-32768, min(32767, int((values[c] + rnd.gauss(0, spread)) * scale))))
+    return data
+
+
+def load_binary_trace(path):
+    """ Raw readings and sample rate from a trace recorded on the bot"""
+    replay = sensortrace.TraceReplay(path, sensortrace.SPEED_STEP)
+    batch = SampleBatch(replay.FIFO_Capacity())
+    data = array('h')
+    while not replay.finished:
+        count = replay.Read_FIFO(batch)
+        data.extend(batch.data[:count * 6])
+    return data, replay.Sample_Rate()
+
+
+def load_trace(path):
+    """ Raw readings and labels from a CSV trace, labels as (sample, event)"""
+    names = {name.replace(" ", "_"): kind for kind, name in enumerate(events.EVENT_NAMES)}
+    data = array('h')
+    labels = []
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            fields = line.split(",")
+            try:
+                values = [int(v) for v in fields[:6]]
+            except ValueError:
+                continue  # A header line
+            if len(fields) > 6 and fields[6].strip():
+                labels.append((len(data) // 6, names[fields[6].strip()]))
+            data.extend(values)
+    return data, labels
+
+
+def detect(data, rate, fps):
+    """ Run the detectors over raw readings a frame at a time, returns the
+    events as (event, sample found on, sample the frame had read to)"""
+    queue = events.EventQueue()
+    engine = events.MotionEvents(rate, queue, MOVE_RAW)
+    per_frame = max(1, rate // fps)
+    batch = SampleBatch(per_frame)
+    found = []
+    total = len(data) // 6
+    for start in range(0, total, per_frame):
+        count = min(per_frame, total - start)
+        batch.data[:count * 6] = data[start * 6:(start + count) * 6]
+        batch.count = count
+        engine.update(batch)
+        kind = queue.get()
+        while kind != events.EVENT_NONE:
+            found.append((kind, queue.sample - 1, start + count))
+            kind = queue.get()
+    return found
+
+
+def score(name, labels, found, rate):
+    """ Match found events with the labels and print the scene's line,
+    returns (labelled, missed, false alarms)"""
+    window = int(MATCH_S * rate)
+    unmatched = [f for f in found if f[0] in SCORED]
+    latencies = []
+    seen = []
+    missed = 0
+    for sample, kind in sorted(labels):
+        match = None
+        for candidate in unmatched:
+            if candidate[0] == kind and sample <= candidate[1] <= sample + window:
+                match = candidate
+                break
+        if match is None:
+            missed += 1
+            continue
+        unmatched.remove(match)
+        latencies.append((match[1] - sample) * 1000 / rate)
+        seen.append((match[2] - sample) * 1000 / rate)
+    moves = sum(1 for f in found if f[0] == events.EVENT_MOVE)
+    latency = "{:>7.0f} {:>7.0f} {:>7.0f}".format(
+        sum(latencies) / len(latencies), max(latencies), max(seen)) if latencies else "{:>7} {:>7} {:>7}".format("-", "-", "-")
+    print("{:<14} {:>5} {:>5} {:>6} {:>6} {} {}".format(
+        name, len(labels), len(labels) - missed, len(unmatched), moves, latency,
+        " ".join(events.EVENT_NAMES[f[0]] for f in unmatched)))
+    return len(labels), missed, len(unmatched)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Score the motion event detectors against labelled motion")
+    parser.add_argument("--trace", help="CSV trace of raw readings to score instead of the built in scenes")
+    parser.add_argument("--rate", type=int, default=RATE, help="sample rate in Hz")
+    parser.add_argument("--fps", type=int, default=FPS, help="frames a second the samples are read in")
+    args = parser.parse_args()
+
+    if args.trace:
+        with open(args.trace, "rb") as f:
+            binary = f.read(4) == sensortrace.MAGIC
+        if binary:
+            data, args.rate = load_binary_trace(args.trace)
+            labels = []
+        else:
+            data, labels = load_trace(args.trace)
+        scenes = [(os.path.basename(args.trace), data, labels, len(data) / 6 / args.rate)]
+    else:
+        scenes = [(name, generate(script, seconds, args.rate), [(int(t * args.rate), kind) for t, kind in marks], seconds)
+                  for name, script, seconds, marks in SCENES]
+
+    print("{:<14} {:>5} {:>5} {:>6} {:>6} {:>7} {:>7} {:>7}".format(
+        "scene", "label", "found", "false", "moves", "mean ms", "max ms", "seen ms"))
+    labelled = missed = false = 0
+    quiet_seconds = 0.0
+    quiet_false = 0
+    for name, data, labels, seconds in scenes:
+        found = detect(data, args.rate, args.fps)
+        count, lost, wrong = score(name, labels, found, args.rate)
+        labelled += count
+        missed += lost
+        false += wrong
+        if not labels:
+            quiet_seconds += seconds
+            quiet_false += wrong
+    print("found {} of {} labelled events, {} false alarms".format(labelled - missed, labelled, false))
+    if quiet_seconds:
+        print("{:.1f} false alarms a minute with nothing happening".format(quiet_false * 60 / quiet_seconds))
+
+
+main()
@@ -0,0 +1,289 @@
+"""
+  ____  _           ____        _
+ |  _ \(_) ___ ___ | __ )  ___ | |_
+ | |_) | |/ __/ _ \|  _ \ / _ \| __|
+ |  __/| | (_| (_) | |_) | (_) | |_
+ |_|   |_|\___\___/|____/ \___/ \__|
+ Equivalence check and timing for the fastpath hot paths
+
+ Runs the compiled and plain Python versions from python/fastpath.py on the
+ same random inputs, fails if they disagree, then times each. Use the
+ MicroPython unix port to check the viper and native versions off the board,
+ or copy it to the board with fastpath*.py and run it there:
+
+   micropython host/fastpath_check.py
+   python3 host/fastpath_check.py      plain Python only, against references
+
+ By Matthew Page
+
+"""
+import sys
+from array import array
+import random
+import struct
+
+# Find python/ next to this folder, without os.path so MicroPython can run it
+here = __file__.rsplit("/", 1)[0] if "/" in __file__ else "."
+sys.path.insert(0, here + "/../python")
+
+import fastpath
+
+try:
+    from time import ticks_us, ticks_diff
+except ImportError:
+    from time import perf_counter_ns
+
+    def ticks_us():
+        return perf_counter_ns() // 1000
+
+    def ticks_diff(a, b):
+        return a - b
+
+ROUNDS = 200
+TIMED = 2000
+
+OFFSETS = array('i', [22 * 4096, -77 * 4096, -306 * 4096, -51200 * 64, -40300 * 64, -1000 * 64])
+DIVISORS = array('i', [225 * 4096, 297 * 4096, 532 * 4096, 100700 * 64, 84000 * 64, 2000 * 64])
+
+
+class Recorder:
+    """ Display stand-in that remembers every line drawn"""
+
+    def __init__(self):
+        self.lines = []
+
+    def line(self, x0, y0, x1, y1, colour):
+        self.lines.append((x0, y0, x1, y1, colour))
+
+
+class Discard:
+    """ Display stand-in that draws nothing, for timing"""
+
+    def line(self, x0, y0, x1, y1, colour):
+        pass
+
+
+def int16():
+    return random.getrandbits(16) - 32768
+
+
+def check_decode(decode):
+    burst = bytearray(17)
+    out = array('h', [0] * 6)
+    for _ in range(ROUNDS):
+        for i in range(len(burst)):
+            burst[i] = random.getrandbits(8)
+        decode(burst, 5, out)
+        if list(out) != list(struct.unpack_from('<6h', burst, 5)):
+            return False
+    return True
+
+
+def reference_positions(raw, height):
+    out = []
+    for i in range(6):
+        value = abs(raw[i] * 100 - OFFSETS[i]) * height // DIVISORS[i]
+        out.append(min(value, height))
+    return out
+
+
+def check_scale(scale):
+    raw = array('h', [0] * 6)
+    out = array('h', [0] * 6)
+    for _ in range(ROUNDS):
+        for i in range(6):
+            raw[i] = int16()
+        scale(raw, OFFSETS, DIVISORS, out, 6, 50)
+        if list(out) != reference_positions(raw, 50):
+            return False
+    return True
+
+
+def check_spread(channel_spread):
+    for _ in range(ROUNDS):
+        samples = random.getrandbits(7)
+        shift = 4 + random.getrandbits(3)
+        data = array('h', [int16() for _ in range(samples * 6)])
+        centre = array('i', [int16() << shift for _ in range(6)])
+        spread = array('i', [random.getrandbits(15) << shift for _ in range(6)])
+        expect_centre = list(centre)
+        expect_spread = list(spread)
+        for j in range(samples * 6):
+            c = j % 6
+            delta = data[j] - (expect_centre[c] >> shift)
+            expect_centre[c] += delta
+            expect_spread[c] += abs(delta) - (expect_spread[c] >> shift)
+        channel_spread(data, samples, centre, spread, 6, shift)
+        if list(centre) != expect_centre or list(spread) != expect_spread:
+            return False
+    return True
+
+
+def check_fuse(fuse_gravity):
+    for _ in range(ROUNDS):
+        samples = random.getrandbits(5)
+        data = array('h', [int16() for _ in range(samples * 6)])
+        start = [random.getrandbits(20) - (1 << 19) for _ in range(3)]
+        gravity = array('i', start)
+        expected = array('i', start)
+        bias = array('h', [random.getrandbits(8) - 128 for _ in range(6)])
+        fuse_gravity(data, samples, gravity, bias, 3581, 7)
+        fastpath.fuse_gravity_py(data, samples, expected, bias, 3581, 7)
+        if list(gravity) != list(expected):
+            return False
+    return True
+
+
+def reference_expand(indices, start, count, palette, bits):
+    out = bytearray(count * 2)
+    for i in range(count):
+        pixel = start + i
+        if bits == 8:
+            index = indices[pixel]
+        else:
+            index = indices[pixel >> 1] & 0x0F if pixel & 1 else indices[pixel >> 1] >> 4
+        struct.pack_into('<H', out, i * 2, palette[index])
+    return out
+
+
+def check_expand(expand, bits):
+    palette = array('H', [random.getrandbits(16) for _ in range(1 << bits)])
+    indices = bytearray(64)
+    line = bytearray(128)
+    for _ in range(ROUNDS):
+        for i in range(len(indices)):
+            indices[i] = random.getrandbits(8)
+        pixels = len(indices) * 8 // bits
+        start = random.getrandbits(5)
+        count = random.getrandbits(6) % (pixels - start)
+        expand(indices, start, count, palette, line)
+        if line[:count * 2] != reference_expand(indices, start, count, palette, bits):
+            return False
+    return True
+
+
+def check_gs8(expand):
+    return check_expand(expand, 8)
+
+
+def check_gs4(expand):
+    return check_expand(expand, 4)
+
+
+def check_encode(encode_int16):
+    out = bytearray(40)
+    for _ in range(ROUNDS):
+        data = array('h', [int16() for _ in range(16)])
+        start = random.getrandbits(3)
+        count = random.getrandbits(3)
+        offset = random.getrandbits(4)
+        expected = bytearray(out)
+        struct.pack_into('<{}h'.format(count), expected, offset, *data[start:start + count])
+        encode_int16(data, start, count, out, offset)
+        if out != expected:
+            return False
+    return True
+
+
+def check_crc(crc16):
+    # The standard check value for CRC-16/CCITT-FALSE
+    if crc16(b"123456789", 0, 9, 0xFFFF) != 0x29B1:
+        return False
+    for _ in range(ROUNDS):
+        data = bytes(random.getrandbits(8) for _ in range(32))
+        start = random.getrandbits(4)
+        count = random.getrandbits(4)
+        if crc16(data, start, count, 0xFFFF) != fastpath.crc16_py(data, start, count, 0xFFFF):
+            return False
+    return True
+
+
+def check_graph(draw_graph):
+    for _ in range(ROUNDS):
+        length = 24
+        history = array('h', [random.getrandbits(6) for _ in range(length)])
+        start = random.getrandbits(4)
+        count = 1 + random.getrandbits(4)
+        drawn = Recorder()
+        draw_graph(drawn, history, start, count, length, 10, 0, 110, 0xFFFF)
+        expected = Recorder()
+        fastpath.draw_graph_py(expected, history, start, count, length, 10, 0, 110, 0xFFFF)
+        if drawn.lines != expected.lines:
+            return False
+    return True
+
+
+def timed(function, *args):
+    started = ticks_us()
+    for _ in range(TIMED):
+        function(*args)
+    return ticks_diff(ticks_us(), started) / TIMED
+
+
+def main():
+    print("compiled hot paths: {}".format("yes" if fastpath.COMPILED else "no, plain Python"))
+    failed = 0
+    checks = (
+        ("decode_xyz", check_decode, fastpath.decode_xyz, fastpath.decode_xyz_py),
+        ("scale_positions", check_scale, fastpath.scale_positions, fastpath.scale_positions_py),
+        ("channel_spread", check_spread, fastpath.channel_spread, fastpath.channel_spread_py),
+        ("fuse_gravity", check_fuse, fastpath.fuse_gravity, fastpath.fuse_gravity_py),
+        ("expand_gs8", check_gs8, fastpath.expand_gs8, fastpath.expand_gs8_py),
+        ("expand_gs4", check_gs4, fastpath.expand_gs4, fastpath.expand_gs4_py),
+        ("encode_int16", check_encode, fastpath.encode_int16, fastpath.encode_int16_py),
+        ("crc16", check_crc, fastpath.crc16, fastpath.crc16_py),
+        ("draw_graph", check_graph, fastpath.draw_graph, fastpath.draw_graph_py),
+    )
+    for name, check, fast, plain in checks:
+        ok = check(fast) and check(plain)
+        failed += 0 if ok else 1
+        print("{:<16} {}".format(name, "same" if ok else "DIFFERENT"))
+
+    burst = bytearray(17)
+    raw = array('h', [1000, -2000, 3000, -4000, 5000, -6000])
+    out = array('h', [0] * 6)
+    data = array('h', [int16() for _ in range(128 * 6)])
+    centre = array('i', [0] * 6)
+    spread = array('i', [0] * 6)
+    gravity = array('i', [65536, 0, 0])
+    bias = array('h', [0] * 6)
+    indices = bytearray(240)
+    palette = array('H', range(256))
+    line = bytearray(480)
+    record = bytearray(400)
+    history = array('h', [0] * 24)
+    display = Discard()
+    timings = (
+        ("decode_xyz", (burst, 5, out)),
+        ("scale_positions", (raw, OFFSETS, DIVISORS, out, 6, 50)),
+        ("channel_spread", (data, 128, centre, spread, 6, 12)),
+        ("fuse_gravity", (data, 128, gravity, bias, 3581, 7)),
+        ("expand_gs8", (indices, 0, 240, palette, line)),
+        ("expand_gs4", (indices, 0, 240, palette, line)),
+        ("encode_int16", (data, 0, 192, record, 0)),
+        ("crc16", (record, 0, 384, 0xFFFF)),
+        ("draw_graph", (display, history, 0, 24, 24, 10, 0, 110, 0xFFFF)),
+    )
+    print("{:<16} {:>10} {:>10}".format("us per call", "fast", "python"))
+    for name, args in timings:
+        fast = getattr(fastpath, name)
+        plain = getattr(fastpath, name + "_py")
+        fast_us = timed(fast, *args)
+        plain_us = timed(plain, *args)
+        print("{:<16} {:>10.1f} {:>10.1f}".format(name, fast_us, plain_us))
+
+    # The filter runs on every sample, this is what it costs at each rate
+    fast_us = timed(fastpath.fuse_gravity, data, 128, gravity, bias, 3581, 7) / 128
+    for rate in (125, 250, 500, 1000):
+        print("fuse_gravity at {:>4}Hz {:>8.2f} ms a second".format(rate, fast_us * rate / 1000))
+
+    # An indexed frame is expanded a line at a time as it is sent
+    for name in ("expand_gs8", "expand_gs4"):
+        frame_ms = timed(getattr(fastpath, name), indices, 0, 240, palette, line) * 240 / 1000
+        print("{} full frame {:>8.2f} ms".format(name, frame_ms))
+
+    if failed:
+        sys.exit(1)
+
+
+main()
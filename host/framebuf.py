@@ -0,0 +1,321 @@
+"""
+  ____  _           ____        _
+ |  _ \(_) ___ ___ | __ )  ___ | |_
+ | |_) | |/ __/ _ \|  _ \ / _ \| __|
+ |  __/| | (_| (_) | |_) | (_) | |_
+ |_|   |_|\___\___/|____/ \___/ \__|
+
+ Host stand-in for the MicroPython framebuf module
+
+ Pure Python version of the parts of framebuf the bot uses. The drawing
+ algorithms follow extmod/modframebuf.c so rendered frames match the board
+ pixel for pixel, except text which uses a simple 5x7 font.
+
+ By Matthew Page
+
+"""
+MONO_VLSB = 0
+MONO_HLSB = 3
+MONO_HMSB = 4
+RGB565 = 1
+GS2_HMSB = 5
+GS4_HMSB = 2
+GS8 = 6
+
+# 5x7 glyphs, one 5 bit row per byte. Lower case is drawn as upper case.
+_GLYPHS = {
+    " ": (0, 0, 0, 0, 0, 0, 0),
+    "0": (0x0E, 0x11, 0x13, 0x15, 0x19, 0x11, 0x0E),
+    "1": (0x04, 0x0C, 0x04, 0x04, 0x04, 0x04, 0x0E),
+    "2": (0x0E, 0x11, 0x01, 0x02, 0x04, 0x08, 0x1F),
+    "3": (0x1F, 0x02, 0x04, 0x02, 0x01, 0x11, 0x0E),
+    "4": (0x02, 0x06, 0x0A, 0x12, 0x1F, 0x02, 0x02),
+    "5": (0x1F, 0x10, 0x1E, 0x01, 0x01, 0x11, 0x0E),
+    "6": (0x06, 0x08, 0x10, 0x1E, 0x11, 0x11, 0x0E),
+    "7": (0x1F, 0x01, 0x02, 0x04, 0x08, 0x08, 0x08),
+    "8": (0x0E, 0x11, 0x11, 0x0E, 0x11, 0x11, 0x0E),
+    "9": (0x0E, 0x11, 0x11, 0x0F, 0x01, 0x02, 0x0C),
+    "A": (0x0E, 0x11, 0x11, 0x1F, 0x11, 0x11, 0x11),
+    "B": (0x1E, 0x11, 0x11, 0x1E, 0x11, 0x11, 0x1E),
+    "C": (0x0E, 0x11, 0x10, 0x10, 0x10, 0x11, 0x0E),
+    "D": (0x1C, 0x12, 0x11, 0x11, 0x11, 0x12, 0x1C),
+    "E": (0x1F, 0x10, 0x10, 0x1E, 0x10, 0x10, 0x1F),
+    "F": (0x1F, 0x10, 0x10, 0x1E, 0x10, 0x10, 0x10),
+    "G": (0x0E, 0x11, 0x10, 0x17, 0x11, 0x11, 0x0F),
+    "H": (0x11, 0x11, 0x11, 0x1F, 0x11, 0x11, 0x11),
+    "I": (0x0E, 0x04, 0x04, 0x04, 0x04, 0x04, 0x0E),
+    "J": (0x07, 0x02, 0x02, 0x02, 0x02, 0x12, 0x0C),
+    "K": (0x11, 0x12, 0x14, 0x18, 0x14, 0x12, 0x11),
+    "L": (0x10, 0x10, 0x10, 0x10, 0x10, 0x10, 0x1F),
+    "M": (0x11, 0x1B, 0x15, 0x15, 0x11, 0x11, 0x11),
+    "N": (0x11, 0x11, 0x19, 0x15, 0x13, 0x11, 0x11),
+    "O": (0x0E, 0x11, 0x11, 0x11, 0x11, 0x11, 0x0E),
+    "P": (0x1E, 0x11, 0x11, 0x1E, 0x10, 0x10, 0x10),
+    "Q": (0x0E, 0x11, 0x11, 0x11, 0x15, 0x12, 0x0D),
+    "R": (0x1E, 0x11, 0x11, 0x1E, 0x14, 0x12, 0x11),
+    "S": (0x0F, 0x10, 0x10, 0x0E, 0x01, 0x01, 0x1E),
+    "T": (0x1F, 0x04, 0x04, 0x04, 0x04, 0x04, 0x04),
+    "U": (0x11, 0x11, 0x11, 0x11, 0x11, 0x11, 0x0E),
+    "V": (0x11, 0x11, 0x11, 0x11, 0x11, 0x0A, 0x04),
+    "W": (0x11, 0x11, 0x11, 0x15, 0x15, 0x15, 0x0A),
+    "X": (0x11, 0x11, 0x0A, 0x04, 0x0A, 0x11, 0x11),
+    "Y": (0x11, 0x11, 0x11, 0x0A, 0x04, 0x04, 0x04),
+    "Z": (0x1F, 0x01, 0x02, 0x04, 0x08, 0x10, 0x1F),
+    ".": (0, 0, 0, 0, 0, 0x0C, 0x0C),
+    ":": (0, 0x0C, 0x0C, 0, 0x0C, 0x0C, 0),
+    "-": (0, 0, 0, 0x1F, 0, 0, 0),
+    "%": (0x18, 0x19, 0x02, 0x04, 0x08, 0x13, 0x03),
+    "/": (0, 0x01, 0x02, 0x04, 0x08, 0x10, 0),
+}
+_MISSING = (0x1F, 0x11, 0x11, 0x11, 0x11, 0x11, 0x1F)
+
+
+class FrameBuffer:
+    """ Frame buffer over a bytearray, same constructor as framebuf.FrameBuffer"""
+
+    def __init__(self, buffer, width, height, format, stride=None):
+        self._buf = buffer
+        self.width_ = width
+        self.height_ = height
+        self.format = format
+        if stride is None:
+            stride = width
+        if format == MONO_HLSB or format == MONO_HMSB:
+            stride = (stride + 7) & ~7
+        self.stride = stride
+
+    # Pixel access for each format
+
+    def _get(self, x, y):
+        f = self.format
+        buf = self._buf
+        if f == RGB565:
+            i = (x + y * self.stride) * 2
+            return buf[i] | (buf[i + 1] << 8)
+        if f == GS8:
+            return buf[x + y * self.stride]
+        if f == GS4_HMSB:
+            v = buf[(x + y * self.stride) >> 1]
+            return v & 0x0F if x & 1 else v >> 4
+        if f == MONO_HLSB:
+            i = (x + y * self.stride) >> 3
+            return (buf[i] >> (7 - (x & 7))) & 1
+        if f == MONO_HMSB:
+            i = (x + y * self.stride) >> 3
+            return (buf[i] >> (x & 7)) & 1
+        if f == MONO_VLSB:
+            return (buf[(y >> 3) * self.stride + x] >> (y & 7)) & 1
+        raise ValueError("unsupported format")
+
+    def _set(self, x, y, c):
+        f = self.format
+        buf = self._buf
+        if f == RGB565:
+            i = (x + y * self.stride) * 2
+            buf[i] = c & 0xFF
+            buf[i + 1] = (c >> 8) & 0xFF
+        elif f == GS8:
+            buf[x + y * self.stride] = c & 0xFF
+        elif f == GS4_HMSB:
+            i = (x + y * self.stride) >> 1
+            if x & 1:
+                buf[i] = (buf[i] & 0xF0) | (c & 0x0F)
+            else:
+                buf[i] = (buf[i] & 0x0F) | ((c & 0x0F) << 4)
+        elif f == MONO_HLSB:
+            i = (x + y * self.stride) >> 3
+            bit = 7 - (x & 7)
+            buf[i] = (buf[i] & ~(1 << bit)) | ((c & 1) << bit)
+        elif f == MONO_HMSB:
+            i = (x + y * self.stride) >> 3
+            bit = x & 7
+            buf[i] = (buf[i] & ~(1 << bit)) | ((c & 1) << bit)
+        elif f == MONO_VLSB:
+            i = (y >> 3) * self.stride + x
+            bit = y & 7
+            buf[i] = (buf[i] & ~(1 << bit)) | ((c & 1) << bit)
+        else:
+            raise ValueError("unsupported format")
+
+    def _fill_rect(self, x, y, w, h, c):
+        if h < 1 or w < 1 or x + w <= 0 or y + h <= 0 or y >= self.height_ or x >= self.width_:
+            return
+        xend = min(self.width_, x + w)
+        yend = min(self.height_, y + h)
+        x = max(x, 0)
+        y = max(y, 0)
+        if self.format == RGB565:
+            run = bytes((c & 0xFF, (c >> 8) & 0xFF)) * (xend - x)
+            for row in range(y, yend):
+                i = (x + row * self.stride) * 2
+                self._buf[i:i + len(run)] = run
+        elif self.format == GS8:
+            run = bytes((c & 0xFF,)) * (xend - x)
+            for row in range(y, yend):
+                i = x + row * self.stride
+                self._buf[i:i + len(run)] = run
+        else:
+            for row in range(y, yend):
+                for col in range(x, xend):
+                    self._set(col, row, c)
+
+    # framebuf API
+
+    def fill(self, c):
+        self._fill_rect(0, 0, self.width_, self.height_, c)
+
+    def fill_rect(self, x, y, w, h, c):
+        self._fill_rect(x, y, w, h, c)
+
+    def pixel(self, x, y, c=None):
+        if 0 <= x < self.width_ and 0 <= y < self.height_:
+            if c is None:
+                return self._get(x, y)
+            self._set(x, y, c)
+        return None
+
+    def hline(self, x, y, w, c):
+        self._fill_rect(x, y, w, 1, c)
+
+    def vline(self, x, y, h, c):
+        self._fill_rect(x, y, 1, h, c)
+
+    def rect(self, x, y, w, h, c, f=False):
+        if f:
+            self._fill_rect(x, y, w, h, c)
+        else:
+            self._fill_rect(x, y, w, 1, c)
+            self._fill_rect(x, y + h - 1, w, 1, c)
+            self._fill_rect(x, y, 1, h, c)
+            self._fill_rect(x + w - 1, y, 1, h, c)
+
+    def line(self, x1, y1, x2, y2, c):
+        dx = x2 - x1
+        if dx > 0:
+            sx = 1
+        else:
+            dx = -dx
+            sx = -1
+        dy = y2 - y1
+        if dy > 0:
+            sy = 1
+        else:
+            dy = -dy
+            sy = -1
+        steep = dy > dx
+        if steep:
+            x1, y1 = y1, x1
+            dx, dy = dy, dx
+            sx, sy = sy, sx
+        e = 2 * dy - dx
+        w = self.width_
+        h = self.height_
+        for _ in range(dx):
+            if steep:
+                if 0 <= y1 < w and 0 <= x1 < h:
+                    self._set(y1, x1, c)
+            elif 0 <= x1 < w and 0 <= y1 < h:
+                self._set(x1, y1, c)
+            while e >= 0:
+                y1 += sy
+                e -= 2 * dx
+            x1 += sx
+            e += 2 * dy
+        if 0 <= x2 < w and 0 <= y2 < h:
+            self._set(x2, y2, c)
+
+    def _ellipse_points(self, cx, cy, x, y, c, mask):
+        if mask & 0x10:
+            if mask & 0x01:
+                self._fill_rect(cx, cy - y, x + 1, 1, c)
+            if mask & 0x02:
+                self._fill_rect(cx - x, cy - y, x + 1, 1, c)
+            if mask & 0x04:
+                self._fill_rect(cx - x, cy + y, x + 1, 1, c)
+            if mask & 0x08:
+                self._fill_rect(cx, cy + y, x + 1, 1, c)
+        else:
+            if mask & 0x01:
+                self.pixel(cx + x, cy - y, c)
+            if mask & 0x02:
+                self.pixel(cx - x, cy - y, c)
+            if mask & 0x04:
+                self.pixel(cx - x, cy + y, c)
+            if mask & 0x08:
+                self.pixel(cx + x, cy + y, c)
+
+    def ellipse(self, cx, cy, xr, yr, c, f=False, m=0x0F):
+        mask = (0x10 if f else 0) | (m & 0x0F)
+        two_asquare = 2 * xr * xr
+        two_bsquare = 2 * yr * yr
+        x = xr
+        y = 0
+        xchange = yr * yr * (1 - 2 * xr)
+        ychange = xr * xr
+        error = 0
+        stoppingx = two_bsquare * xr
+        stoppingy = 0
+        while stoppingx >= stoppingy:
+            self._ellipse_points(cx, cy, x, y, c, mask)
+            y += 1
+            stoppingy += two_asquare
+            error += ychange
+            ychange += two_asquare
+            if 2 * error + xchange > 0:
+                x -= 1
+                stoppingx -= two_bsquare
+                error += xchange
+                xchange += two_bsquare
+        x = 0
+        y = yr
+        xchange = yr * yr
+        ychange = xr * xr * (1 - 2 * yr)
+        error = 0
+        stoppingx = 0
+        stoppingy = two_asquare * yr
+        while stoppingx <= stoppingy:
+            self._ellipse_points(cx, cy, x, y, c, mask)
+            x += 1
+            stoppingx += two_bsquare
+            error += xchange
+            xchange += two_bsquare
+            if 2 * error + ychange > 0:
+                y -= 1
+                stoppingy -= two_asquare
+                error += ychange
+                ychange += two_asquare
+
+    def text(self, s, x0, y0, c=1):
+        for ch in s:
+            rows = _GLYPHS.get(ch.upper(), _MISSING)
+            for row in range(7):
+                bits = rows[row]
+                for col in range(5):
+                    if bits & (0x10 >> col):
+                        self.pixel(x0 + col + 1, y0 + row, c)
+            x0 += 8
+
+    def scroll(self, xstep, ystep):
+        copy = FrameBuffer(bytearray(self._buf), self.width_, self.height_, self.format, self.stride)
+        self.blit(copy, xstep, ystep)
+
+    def blit(self, fbuf, x, y, key=-1, palette=None):
+        if x >= self.width_ or y >= self.height_ or -x >= fbuf.width_ or -y >= fbuf.height_:
+            return
+        x0 = max(0, x)
+        y0 = max(0, y)
+        x1 = max(0, -x)
+        y1 = max(0, -y)
+        x0end = min(self.width_, x + fbuf.width_)
+        y0end = min(self.height_, y + fbuf.height_)
+        while y0 < y0end:
+            cx1 = x1
+            for cx0 in range(x0, x0end):
+                col = fbuf._get(cx1, y1)
+                if palette is not None:
+                    col = palette._get(col, 0)
+                if col != key:
+                    self._set(cx0, y0, col)
+                cx1 += 1
+            y1 += 1
+            y0 += 1
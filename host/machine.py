@@ -0,0 +1,215 @@
+"""
+  ____  _           ____        _
+ |  _ \(_) ___ ___ | __ )  ___ | |_
+ | |_) | |/ __/ _ \|  _ \ / _ \| __|
+ |  __/| | (_| (_) | |_) | (_) | |_
+ |_|   |_|\___\___/|____/ \___/ \__|
+ Host stand-in for the MicroPython machine module
+
+ Pins, buses and peripherals forward to device models registered by the
+ host (see devices.py) and count the traffic so benchmarks can report it.
+
+ By Matthew Page
+
+"""
+import utime
+
+# Traffic counters, reset by the benchmark between frames
+stats = {
+    "spi_writes": 0,
+    "spi_bytes": 0,
+    "i2c_transactions": 0,
+    "i2c_bytes": 0,
+    "i2c_us": 0,
+}
+
+_levels = {}
+_irqs = {}
+_spi_devices = {}
+_i2c_devices = {}
+_adc_sources = {}
+_idle_hooks = []
+
+
+def reset_stats():
+    for key in stats:
+        stats[key] = 0
+
+
+def attach_spi(bus, device):
+    """ Register a device model on an SPI bus"""
+    _spi_devices[bus] = device
+
+
+def attach_i2c(bus, address, device):
+    """ Register a device model on an I2C bus address"""
+    _i2c_devices[(bus, address)] = device
+
+
+def attach_adc(pin, source):
+    """ Register a callable returning the 16 bit reading of an ADC pin"""
+    _adc_sources[pin] = source
+
+
+def on_idle(hook):
+    """ Register a callable run while the CPU sleeps, given the virtual time in us"""
+    _idle_hooks.append(hook)
+
+
+def drive(pin, level):
+    """ Drive an input pin from outside, firing any matching IRQ"""
+    old = _levels.get(pin, 0)
+    _levels[pin] = 1 if level else 0
+    irq = _irqs.get(pin)
+    if irq is None or old == _levels[pin]:
+        return
+    handler, trigger, obj = irq
+    if (level and trigger & Pin.IRQ_RISING) or (not level and trigger & Pin.IRQ_FALLING):
+        handler(obj)
+
+
+def _pin_id(pin):
+    return pin.id if isinstance(pin, Pin) else pin
+
+
+class Pin:
+    IN = 0
+    OUT = 1
+    OPEN_DRAIN = 2
+    PULL_UP = 1
+    PULL_DOWN = 2
+    IRQ_FALLING = 4
+    IRQ_RISING = 8
+
+    def __init__(self, id, mode=-1, pull=-1, value=None):
+        self.id = id
+        if value is not None:
+            _levels[id] = 1 if value else 0
+        elif pull == Pin.PULL_UP and id not in _levels:
+            _levels[id] = 1
+
+    def __call__(self, value=None):
+        return self.value(value)
+
+    def value(self, value=None):
+        if value is None:
+            return _levels.get(self.id, 0)
+        _levels[self.id] = 1 if value else 0
+        return None
+
+    def on(self):
+        self.value(1)
+
+    def off(self):
+        self.value(0)
+
+    def irq(self, handler=None, trigger=IRQ_FALLING | IRQ_RISING, hard=False):
+        if handler is None:
+            _irqs.pop(self.id, None)
+        else:
+            _irqs[self.id] = (handler, trigger, self)
+
+
+class SPI:
+    def __init__(self, id, baudrate=1_000_000, polarity=0, phase=0, bits=8, firstbit=0, sck=None, mosi=None, miso=None):
+        self.id = id
+        self.baudrate = baudrate
+
+    def write(self, buf):
+        stats["spi_writes"] += 1
+        stats["spi_bytes"] += len(buf)
+        device = _spi_devices.get(self.id)
+        if device is not None:
+            device.spi_write(bytes(buf))
+
+
+class I2C:
+    def __init__(self, id, scl=None, sda=None, freq=400_000, timeout=50_000):
+        self.id = id
+        self.freq = freq
+
+    def _device(self, addr):
+        device = _i2c_devices.get((self.id, addr))
+        if device is None:
+            raise OSError(19)
+        return device
+
+    def _count(self, nbytes):
+        # Address, register, repeated start and ack overhead plus the payload
+        stats["i2c_transactions"] += 1
+        stats["i2c_bytes"] += nbytes
+        stats["i2c_us"] += (nbytes + 3) * 9 * 1_000_000 // self.freq
+
+    def scan(self):
+        return [addr for (bus, addr) in _i2c_devices if bus == self.id]
+
+    def readfrom_mem(self, addr, memaddr, nbytes, addrsize=8):
+        self._count(nbytes)
+        return bytes(self._device(addr).read(memaddr, nbytes))
+
+    def readfrom_mem_into(self, addr, memaddr, buf, addrsize=8):
+        n = len(memoryview(buf).cast("B"))
+        self._count(n)
+        data = self._device(addr).read(memaddr, n)
+        memoryview(buf).cast("B")[:] = data
+
+    def writeto_mem(self, addr, memaddr, buf, addrsize=8):
+        self._count(len(buf))
+        self._device(addr).write(memaddr, bytes(buf))
+
+
+class ADC:
+    def __init__(self, pin):
+        self.pin = _pin_id(pin)
+
+    def read_u16(self):
+        source = _adc_sources.get(self.pin)
+        return source() if source is not None else 0
+
+
+class PWM:
+    def __init__(self, pin):
+        self.pin = _pin_id(pin)
+        self._freq = 0
+        self._duty = 0
+
+    def freq(self, value=None):
+        if value is None:
+            return self._freq
+        self._freq = value
+        return None
+
+    def duty_u16(self, value=None):
+        if value is None:
+            return self._duty
+        self._duty = value
+        return None
+
+    def deinit(self):
+        pass
+
+
+def freq(value=None):
+    return 125_000_000
+
+
+def _idle(ms):
+    # Step the virtual clock a millisecond at a time so device models can
+    # raise interrupts part way through a sleep
+    woken = [False]
+    end = utime.ticks_add(utime.ticks_ms(), ms)
+    while utime.ticks_diff(end, utime.ticks_ms()) > 0:
+        utime.advance_us(1000)
+        for hook in _idle_hooks:
+            if hook(utime.ticks_us()):
+                woken[0] = True
+        if woken[0]:
+            break
+
+
+def lightsleep(ms=None):
+    _idle(ms if ms is not None else 60_000)
+
+
+def idle():
+    pass
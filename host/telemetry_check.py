@@ -0,0 +1,107 @@
+"""
+  ____  _           ____        _
+ |  _ \(_) ___ ___ | __ )  ___ | |_
+ | |_) | |/ __/ _ \|  _ \ / _ \| __|
+ |  __/| | (_| (_) | |_) | (_) | |_
+ |_|   |_|\___\___/|____/ \___/ \__|
+ Round trip check for the telemetry stream
+
+ Queues sample batches through python/telemetry.py, including batches big
+ enough to be split over several records and chip counters that wrap,
+ writes them through a pipe, decodes them with host/telemetry_recorder.py
+ and fails unless every sample comes back with its own counter and
+ readings, in order:
+
+   python3 host/telemetry_check.py
+
+ By Matthew Page
+
+"""
+import csv
+import os
+from array import array
+import random
+import shutil
+import sys
+import tempfile
+
+HOST = os.path.dirname(os.path.abspath(__file__))
+PYTHON = os.path.join(os.path.dirname(HOST), "python")
+sys.path[:0] = [HOST, PYTHON]
+
+import telemetry
+import telemetry_recorder
+from sensors import SampleBatch
+
+ROUNDS = 50
+RATE = 250
+
+
+def fill(batch, count, counter):
+    """ Random readings in a batch whose newest sample has the given counter,
+    returns the expected (counter, readings) of each sample, oldest first"""
+    batch.count = count
+    batch.timestamp = counter
+    expected = []
+    for i in range(count):
+        readings = [random.getrandbits(16) - 32768 for _ in range(6)]
+        batch.data[i * 6:(i + 1) * 6] = array('h', readings)
+        expected.append(((counter - count + 1 + i) & telemetry_recorder.COUNTER_MASK, readings))
+    return expected
+
+
+def round_trip(batches):
+    """ Send the batches and decode what comes out, returns the (counter,
+    readings) of each sample decoded and the decoder"""
+    read, write = os.pipe()
+    stream = os.fdopen(write, "wb", buffering=0)
+    sender = telemetry.Telemetry(stream)
+    decoder = telemetry_recorder.Decoder()
+    folder = tempfile.mkdtemp(prefix="picobot-telemetry-")
+    recorder = telemetry_recorder.Recorder(folder)
+    try:
+        for batch in batches:
+            sender.samples(batch, RATE)
+            while sender.used:
+                sender.flush()
+                for kind, sequence, payload in decoder.feed(os.read(read, 65536)):
+                    recorder.write(kind, payload)
+        recorder.close()
+        with open(os.path.join(folder, "records.csv")) as f:
+            decoded = [(int(row[2]), [int(v) for v in row[3:]]) for row in csv.reader(f) if row[0] == "samples"]
+    finally:
+        stream.close()
+        os.close(read)
+        shutil.rmtree(folder, ignore_errors=True)
+    return decoded, decoder
+
+
+def main():
+    failed = 0
+    for _ in range(ROUNDS):
+        batches = []
+        expected = []
+        counter = random.getrandbits(24)
+        for _ in range(3):
+            batch = SampleBatch()
+            count = 1 + random.getrandbits(7)
+            counter = (counter + count) & telemetry_recorder.COUNTER_MASK
+            expected += fill(batch, count, counter)
+            batches.append(batch)
+        decoded, decoder = round_trip(batches)
+        if decoded != expected or decoder.lost or decoder.bad_crc or decoder.skipped:
+            failed += 1
+
+    # A batch split over records that wraps the 24 bit counter part way
+    batch = SampleBatch()
+    expected = fill(batch, 100, 20)
+    decoded, decoder = round_trip([batch])
+    if decoded != expected:
+        failed += 1
+
+    print("telemetry round trips {}".format("same" if not failed else "{} DIFFERENT".format(failed)))
+    if failed:
+        sys.exit(1)
+
+
+main()
@@ -0,0 +1,214 @@
+"""
+  ____  _           ____        _
+ |  _ \(_) ___ ___ | __ )  ___ | |_
+ | |_) | |/ __/ _ \|  _ \ / _ \| __|
+ |  __/| | (_| (_) | |_) | (_) | |_
+ |_|   |_|\___\___/|____/ \___/ \__|
+ Decoder and recorder for the telemetry stream from python/telemetry.py
+
+ Reads the USB serial of a bot running with TELEMETRY set in main.py, or a
+ capture of it, finds the framed records among any text the bot prints,
+ checks their CRC and sequence and writes them out:
+
+   python3 host/telemetry_recorder.py --port /dev/ttyACM0 --out run1
+   python3 host/telemetry_recorder.py capture.bin --out run1
+
+ The folder gets samples.csv, one raw sample a line in the trace format
+ host/events_eval.py --trace reads, and records.csv with the time, chip
+ sample counter and readings of every sample plus the battery, heart rate,
+ state and motion event records. Reading the port needs pyserial.
+
+ By Matthew Page
+
+"""
+import argparse
+import binascii
+import os
+import struct
+import sys
+import time
+
+SYNC = b"\xA5\x5A"
+HEADER = struct.Struct("<2sBHH")
+CRC = struct.Struct("<H")
+MAX_PAYLOAD = 512
+
+RECORD_SAMPLES = 1
+RECORD_BATTERY = 2
+RECORD_HEART = 3
+RECORD_STATE = 4
+RECORD_EVENT = 5
+
+SAMPLES_HEADER = struct.Struct("<IIHB")
+VALUE = struct.Struct("<IH")
+STATE = struct.Struct("<IBB")
+
+NAMES = {
+    RECORD_SAMPLES: "samples",
+    RECORD_BATTERY: "battery",
+    RECORD_HEART: "heart",
+    RECORD_STATE: "state",
+    RECORD_EVENT: "event",
+}
+
+# The chip's sample counter is 24 bits
+COUNTER_MASK = 0xFFFFFF
+
+
+class Decoder:
+    """ Finds records in a byte stream, fed in chunks of any size. Bytes
+    that are not part of a good record, such as printed text, are skipped
+    and counted."""
+
+    def __init__(self):
+        self.pending = bytearray()
+        self.records = 0
+        self.bad_crc = 0
+        self.skipped = 0
+        self.lost = 0
+        self.sequence = None
+
+    def feed(self, data):
+        """ Add bytes and return the records completed, as (type, sequence,
+        payload) tuples"""
+        pending = self.pending
+        pending += data
+        found = []
+        start = 0
+        while True:
+            sync = pending.find(SYNC, start)
+            if sync < 0:
+                # Keep a trailing first sync byte, the second may follow
+                keep = len(pending) - 1 if pending.endswith(SYNC[:1]) else len(pending)
+                self.skipped += keep - start
+                start = keep
+                break
+            self.skipped += sync - start
+            if len(pending) - sync < HEADER.size:
+                start = sync
+                break
+            _, kind, sequence, length = HEADER.unpack_from(pending, sync)
+            if length > MAX_PAYLOAD:
+                self.skipped += 1
+                start = sync + 1
+                continue
+            end = sync + HEADER.size + length
+            if len(pending) < end + CRC.size:
+                start = sync
+                break
+            if binascii.crc_hqx(bytes(pending[sync + 2:end]), 0xFFFF) != CRC.unpack_from(pending, end)[0]:
+                # Text that happened to hold the sync bytes, or corruption
+                self.bad_crc += 1
+                self.skipped += 1
+                start = sync + 1
+                continue
+            if self.sequence is not None:
+                self.lost += (sequence - self.sequence - 1) & 0xFFFF
+            self.sequence = sequence
+            self.records += 1
+            found.append((kind, sequence, bytes(pending[sync + HEADER.size:end])))
+            start = end + CRC.size
+        del pending[:start]
+        return found
+
+
+class Recorder:
+    """ Writes decoded records to CSV files and counts samples"""
+
+    def __init__(self, folder):
+        os.makedirs(folder, exist_ok=True)
+        self.trace = open(os.path.join(folder, "samples.csv"), "w")
+        self.trace.write("ax,ay,az,gx,gy,gz\n")
+        self.log = open(os.path.join(folder, "records.csv"), "w")
+        self.log.write("record,ms,sample,values\n")
+        self.samples = 0
+        self.first_ms = None
+        self.last_ms = None
+
+    def write(self, kind, payload):
+        if kind == RECORD_SAMPLES:
+            ms, counter, rate, count = SAMPLES_HEADER.unpack_from(payload)
+            readings = struct.unpack_from("<{}h".format(count * 6), payload, SAMPLES_HEADER.size)
+            for i in range(count):
+                values = ",".join(str(v) for v in readings[i * 6:(i + 1) * 6])
+                # The counter is for the newest sample of the record
+                self.trace.write(values + "\n")
+                self.log.write("samples,{},{},{}\n".format(ms, (counter - count + 1 + i) & COUNTER_MASK, values))
+            self.samples += count
+        elif kind in (RECORD_BATTERY, RECORD_HEART, RECORD_EVENT):
+            ms, value = VALUE.unpack_from(payload)
+            self.log.write("{},{},,{}\n".format(NAMES[kind], ms, value))
+        elif kind == RECORD_STATE:
+            ms, state, mode = STATE.unpack_from(payload)
+            self.log.write("state,{},,{},{}\n".format(ms, state, mode))
+        else:
+            return
+        if self.first_ms is None:
+            self.first_ms = ms
+        self.last_ms = ms
+
+    def close(self):
+        self.trace.close()
+        self.log.close()
+
+
+def open_source(args):
+    """ A read(size) callable for the serial port or capture file"""
+    if args.port:
+        try:
+            import serial
+        except ImportError:
+            sys.exit("reading a serial port needs pyserial: pip install pyserial")
+        port = serial.Serial(args.port, args.baud, timeout=0.1)
+        return port.read, port.close
+    f = sys.stdin.buffer if args.capture == "-" else open(args.capture, "rb")
+    return f.read, f.close
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Decode and record the bot's binary telemetry")
+    parser.add_argument("capture", nargs="?", help="file of captured serial bytes, - for stdin")
+    parser.add_argument("--port", help="serial port of the bot, such as /dev/ttyACM0 or COM3")
+    parser.add_argument("--baud", type=int, default=115200, help="ignored by USB serial but needed to open it")
+    parser.add_argument("--seconds", type=float, help="stop recording from the port after this long")
+    parser.add_argument("--out", default="telemetry", help="folder for the CSV files")
+    parser.add_argument("--save", help="also keep the raw bytes read in this file")
+    args = parser.parse_args()
+    if not args.port and not args.capture:
+        parser.error("give a capture file or --port")
+
+    read, close = open_source(args)
+    raw = open(args.save, "wb") if args.save else None
+    decoder = Decoder()
+    recorder = Recorder(args.out)
+    started = time.monotonic()
+    try:
+        while True:
+            data = read(65536)
+            if data:
+                if raw:
+                    raw.write(data)
+                for kind, sequence, payload in decoder.feed(data):
+                    recorder.write(kind, payload)
+            elif not args.port:
+                break
+            if args.seconds and time.monotonic() - started >= args.seconds:
+                break
+    except KeyboardInterrupt:
+        pass
+    finally:
+        close()
+        recorder.close()
+        if raw:
+            raw.close()
+
+    print("{} records, {} samples, {} lost, {} failed the CRC, {} other bytes skipped".format(
+        decoder.records, recorder.samples, decoder.lost, decoder.bad_crc, decoder.skipped))
+    if recorder.first_ms is not None and recorder.last_ms > recorder.first_ms:
+        seconds = (recorder.last_ms - recorder.first_ms) / 1000
+        print("{:.1f} seconds of bot time, {:.0f} samples a second".format(seconds, recorder.samples / seconds))
+    print("written to {}".format(args.out))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""
+  ____  _           ____        _
+ |  _ \(_) ___ ___ | __ )  ___ | |_
+ | |_) | |/ __/ _ \|  _ \ / _ \| __|
+ |  __/| | (_| (_) | |_) | (_) | |_
+ |_|   |_|\___\___/|____/ \___/ \__|
+ Host stand-in for the MicroPython utime module
+
+ Time runs on a virtual clock: real elapsed CPU time plus every sleep the
+ code asks for, so the bot loop runs flat out on the host while still seeing
+ sensible tick values. Call freeze() to leave real time out so runs are
+ repeatable, then time only moves on sleeps and advance_us().
+
+ By Matthew Page
+
+"""
+import time as _time
+
+TICKS_PERIOD = 1 << 30
+TICKS_MAX = TICKS_PERIOD - 1
+TICKS_HALFPERIOD = TICKS_PERIOD // 2
+
+_start = _time.perf_counter_ns()
+_slept_us = 0
+_frozen = False
+
+
+def _now_us():
+    if _frozen:
+        return _slept_us
+    return (_time.perf_counter_ns() - _start) // 1000 + _slept_us
+
+
+def freeze():
+    """ Stop real time feeding the clock, it only moves on sleeps"""
+    global _frozen, _slept_us
+    _slept_us = _now_us()
+    _frozen = True
+
+
+def advance_us(us):
+    """ Move the virtual clock forward without sleeping"""
+    global _slept_us
+    if us > 0:
+        _slept_us += int(us)
+
+
+def ticks_us():
+    return _now_us() & TICKS_MAX
+
+
+def ticks_ms():
+    return (_now_us() // 1000) & TICKS_MAX
+
+
+def ticks_cpu():
+    return ticks_us()
+
+
+def ticks_add(ticks, delta):
+    return (ticks + delta) & TICKS_MAX
+
+
+def ticks_diff(ticks1, ticks2):
+    return ((ticks1 - ticks2 + TICKS_HALFPERIOD) & TICKS_MAX) - TICKS_HALFPERIOD
+
+
+def sleep(seconds):
+    advance_us(seconds * 1_000_000)
+
+
+def sleep_ms(ms):
+    advance_us(ms * 1000)
+
+
+def sleep_us(us):
+    advance_us(us)
+
+
+def time_ns():
+    return _now_us() * 1000
+
+
+def time():
+    return _now_us() // 1_000_000
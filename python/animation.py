@@ -0,0 +1,189 @@
+"""
+  ____  _           ____        _
+ |  _ \(_) ___ ___ | __ )  ___ | |_
+ | |_) | |/ __/ _ \|  _ \ / _ \| __|
+ |  __/| | (_| (_) | |_) | (_) | |_
+ |_|   |_|\___\___/|____/ \___/ \__|
+ The Pico Bot animations, keyframe tracks played against the clock
+
+ By Matthew Page
+
+"""
+from array import array
+import utime
+
+# Easing into each key, applied to the fraction of the way from the last key
+EASE_LINEAR = 0
+EASE_IN = 1
+EASE_OUT = 2
+EASE_IN_OUT = 3
+
+# Fractions are fixed point, this is 1.0
+EASE_ONE = 1024
+
+# Key value meaning whatever the target is when the track is played
+CURRENT = -0x7FFFFFFF
+
+MAX_KEYS = 12
+
+def ease(kind, fraction):
+    """ Eased fraction, both 0 to EASE_ONE
+    kind: One of the EASE_ constants
+    fraction: How far through the step
+    """
+    if kind == EASE_IN:
+        return (fraction * fraction) >> 10
+    if kind == EASE_OUT:
+        return (fraction * ((EASE_ONE * 2) - fraction)) >> 10
+    if kind == EASE_IN_OUT:
+        # Scaled down between the multiplies to stay in a small int, the
+        # outer fraction last so the curve never steps backwards
+        return (fraction * ((fraction * ((EASE_ONE * 3) - (fraction * 2))) >> 10)) >> 10
+    return fraction
+
+class Track():
+    """ Class to hold the keyframes that move one value over time. Keys are
+    integer values at times in milliseconds from the start, kept in fixed
+    arrays so a track is built once and played as often as needed."""
+
+    def __init__(self, target, attribute=None, keys=MAX_KEYS):
+        """ Initialise the track
+        target: Object the value is set on, or a function called with it
+        attribute: Name of the attribute to set, None to call target
+        keys: Most keys the track can hold
+        """
+        self.target = target
+        self.attribute = attribute
+        self.times = array('i', [0] * keys)
+        self.values = array('i', [0] * keys)
+        self.eases = array('b', [0] * keys)
+        self.count = 0
+        self.current = -1
+        self.loopFrom = -1
+        self.playing = False
+        self.start = 0
+        self.value = None
+
+    def key(self, time, value, easing=EASE_LINEAR):
+        """ Add a key after the last one, returns the track so keys can be chained
+        time: Milliseconds from the start of the track
+        value: Value at that time, or CURRENT for the value when played
+        easing: How the value moves from the previous key, an EASE_ constant
+        """
+        if self.count == len(self.times):
+            raise ValueError("Track is full")
+        if value == CURRENT:
+            self.current = self.count
+            value = 0
+        self.times[self.count] = time
+        self.values[self.count] = value
+        self.eases[self.count] = easing
+        self.count += 1
+        return self
+
+    def loop(self, time=0):
+        """ Repeat the track from a time once it reaches the last key
+        time: Milliseconds from the start the loop goes back to
+        """
+        self.loopFrom = time
+        return self
+
+    def duration(self):
+        """ Milliseconds from the start to the last key"""
+        return self.times[self.count - 1] if self.count else 0
+
+    def begin(self, now):
+        """ Start the track from its first key
+        now: Start time from utime.ticks_ms()
+        """
+        if self.current >= 0:
+            self.values[self.current] = int(getattr(self.target, self.attribute))
+        self.start = now
+        self.playing = True
+        self.value = None
+
+    def value_at(self, time):
+        """ The value of the track at a time
+        time: Milliseconds from the start
+        """
+        times = self.times
+        values = self.values
+        if time <= times[0]:
+            return values[0]
+        for i in range(1, self.count):
+            if time < times[i]:
+                span = times[i] - times[i - 1]
+                fraction = ease(self.eases[i], ((time - times[i - 1]) * EASE_ONE) // span)
+                return values[i - 1] + (((values[i] - values[i - 1]) * fraction) >> 10)
+        return values[self.count - 1]
+
+    def apply(self, now):
+        """ Set the target to the track's value at a time, the target is only
+        touched when the value changes. The track stops after the last key
+        unless it loops.
+        now: Time from utime.ticks_ms()
+        """
+        time = utime.ticks_diff(now, self.start)
+        end = self.duration()
+        if time >= end:
+            if self.loopFrom >= 0 and end > self.loopFrom:
+                time = self.loopFrom + (time - self.loopFrom) % (end - self.loopFrom)
+            else:
+                time = end
+                self.playing = False
+
+        value = self.value_at(time)
+        if value != self.value:
+            self.value = value
+            if self.attribute is None:
+                self.target(value)
+            else:
+                setattr(self.target, self.attribute, value)
+
+class Animator():
+    """ Class to play any number of tracks at once. Tracks are added once,
+    playing a track stops any other track driving the same value."""
+
+    def __init__(self):
+        """ Initialise the animator"""
+        self.tracks = []
+
+    def add(self, track):
+        """ Register a track so it can be played, returns the track
+        track: The track to add
+        """
+        self.tracks.append(track)
+        return track
+
+    def play(self, track, now=None):
+        """ Start a track from its first key
+        track: A track that has been added
+        now: Start time from utime.ticks_ms(), defaults to now
+        """
+        for other in self.tracks:
+            if other is not track and other.playing and other.target is track.target and other.attribute == track.attribute:
+                other.playing = False
+        track.begin(utime.ticks_ms() if now is None else now)
+
+    def stop(self, track):
+        """ Stop a track where it is
+        track: The track to stop
+        """
+        track.playing = False
+
+    def busy(self):
+        """ True while any track is playing"""
+        for track in self.tracks:
+            if track.playing:
+                return True
+        return False
+
+    def update(self, now=None):
+        """ Move every playing track on to the current time
+        now: Time from utime.ticks_ms(), defaults to now
+        """
+        if now is None:
+            now = utime.ticks_ms()
+        for track in self.tracks:
+            if track.playing:
+                track.apply(now)
@@ -11,18 +11,44 @@
 
 """
 from machine import Pin, ADC
+from array import array
+import framebuf
 import math
+import utime
+from sprites import TRANSPARENT, buffer_size
+from glyphs import Readout, atlas
+from widgets import Widget
 
 # Battery levels in volts for each dot
 BATTERY_LEVELS = (3.5, 3.65, 3.8, 3.95, 4.05)
 
-class BatteryMeter():
-    """ Class to read value and draw a battery meter on the display"""
+# ADC sampling: time between samples, reads averaged into each sample and
+# samples in the moving average
+SAMPLE_INTERVAL_MS = 1000
+OVERSAMPLE = 16
+AVERAGE_SAMPLES = 8
+
+# Voltage text: times the built in font, characters, and the top edge
+TEXT_SCALE = 2
+TEXT_LENGTH = 5
+TEXT_TOP = 204
+
+def format_volts(centivolts):
+    """ Text for a reading, such as 3.92v
+    centivolts: Battery voltage in hundredths of a volt
+    """
+    return "{}.{:02d}v".format(centivolts // 100, centivolts % 100)
+
+class BatteryMeter(Widget):
+    """ Class to read value and draw a battery meter on the display. The
+    meter is rendered into a sprite when the reading changes, its box is
+    the sprite's."""
 
     def __init__(self, pin):
         """ Initialise the battery meter
         pin: The pin to read the battery voltage from
         """
+        super().__init__()
         self.vbat = ADC(Pin(pin))
         self.intervals = 36
         self.distance = 113
@@ -30,37 +56,138 @@ class BatteryMeter():
         self.yellow = 0x00FF
         self.green = 0x000F
 
-    def draw(self, display):
-        """ Draw the battery meter on the display
+        # Battery levels in hundredths of a volt to compare with the reading
+        self.levels = array('h', [int(level * 100 + 0.5) for level in BATTERY_LEVELS])
+
+        # Moving average of the oversampled ADC readings
+        self.samples = array('H', [0] * AVERAGE_SAMPLES)
+        self.sampleIndex = 0
+        self.total = 0
+        self.lastSample = None
+        self.centivolts = 0
+
+        # Dot positions and the rendered meter, set up when added to a scene
+        self.dots = None
+        self.sprite = None
+        self.shown = -1
+
+    def layout(self, display):
+        """ Work out the dot positions and the area the meter covers
         display: The display to draw on
         """
-        reading = self.read()
-        colour = self.red
-        if reading > BATTERY_LEVELS[3]:
-            colour = self.green
-        elif reading > BATTERY_LEVELS[1]:
-            colour = self.yellow
+        # The voltage readout sits centred at the bottom
+        self.readout = Readout(display, atlas(display, TEXT_SCALE, display.white), TEXT_LENGTH, format_volts)
+        textLeft = display.MID_X - (self.readout.width // 2)
 
-        # Draw the black outlines first
+        positions = []
+        left, top = textLeft, TEXT_TOP
+        right, bottom = textLeft + self.readout.width, TEXT_TOP + self.readout.height
         for dot in range(0, 5):
             dot += 16
             angle = math.pi * 2 * (dot / self.intervals) - math.pi / 2
             x = int(display.MID_X + math.cos(angle) * self.distance)
             y = int(display.MID_Y + math.sin(angle) * self.distance)
-            display.ellipse(x, y, 20, 20, 0x0000, True)
+            positions.append((x, y))
+            left = min(left, x - 20)
+            top = min(top, y - 20)
+            right = max(right, x + 21)
+            bottom = min(max(bottom, y + 21), display.height)
+
+        # Positions are kept relative to the top left of the meter
+        self.left = left
+        self.top = top
+        self.width = right - left
+        self.height = bottom - top
+        self.dots = array('h', [0] * 10)
+        for i in range(0, 5):
+            self.dots[i * 2] = positions[i][0] - left
+            self.dots[(i * 2) + 1] = positions[i][1] - top
+        self.readout.place(textLeft - left, TEXT_TOP - top, self.readout.width, self.readout.height)
+        self.sprite = framebuf.FrameBuffer(bytearray(buffer_size(self.width, self.height, display.format)),
+                                           self.width, self.height, display.format)
+
+        # Colours as the display draws them, palette indices when indexed
+        self.red = display.colour(self.red)
+        self.yellow = display.colour(self.yellow)
+        self.green = display.colour(self.green)
+        self.outline = display.black
+        self.transparent = display.colour(TRANSPARENT)
+        self.place(self.left, self.top, self.width, self.height)
+
+    def attach(self, display):
+        """ Lay the meter out for the display it is added to
+        display: The display to draw on
+        """
+        self.layout(display)
+
+    def sample(self):
+        """ Take a new sample if one is due, oversampling the ADC and
+        keeping a moving average"""
+        now = utime.ticks_ms()
+        if self.lastSample is not None and utime.ticks_diff(now, self.lastSample) < SAMPLE_INTERVAL_MS:
+            return
+        total = 0
+        for i in range(0, OVERSAMPLE):
+            total += self.vbat.read_u16()
+        sample = total // OVERSAMPLE
+
+        if self.lastSample is None:
+            # Start the average full of the first sample
+            for i in range(0, AVERAGE_SAMPLES):
+                self.samples[i] = sample
+            self.total = sample * AVERAGE_SAMPLES
+        else:
+            self.total += sample - self.samples[self.sampleIndex]
+            self.samples[self.sampleIndex] = sample
+            self.sampleIndex = (self.sampleIndex + 1) % AVERAGE_SAMPLES
+        self.lastSample = now
+
+        # 3.3v reference and a divide by two on the battery pin
+        self.centivolts = (self.total * 660) // (AVERAGE_SAMPLES * 65535)
+
+    def render(self):
+        """ Draw the meter for the current reading into the sprite"""
+        reading = self.centivolts
+        colour = self.red
+        if reading > self.levels[3]:
+            colour = self.green
+        elif reading > self.levels[1]:
+            colour = self.yellow
+
+        sprite = self.sprite
+        sprite.fill(self.transparent)
+
+        # Draw the black outlines first
+        dots = self.dots
+        for dot in range(0, 10, 2):
+            sprite.ellipse(dots[dot], dots[dot + 1], 20, 20, self.outline, True)
 
         # Draw the dots over the top
         for dot in range(0, 5):
-            fill = BATTERY_LEVELS[dot] < reading
-            dot += 16
-            angle = math.pi * 2 * (dot / self.intervals) - math.pi / 2
-            x = int(display.MID_X + math.cos(angle) * self.distance)
-            y = int(display.MID_Y + math.sin(angle) * self.distance)
-            display.ellipse(x, y, 5, 5, colour, fill)
+            fill = self.levels[dot] < reading
+            sprite.ellipse(dots[dot * 2], dots[(dot * 2) + 1], 5, 5, colour, fill)
+
+        # Draw the text value, only formatted and rendered when it changes
+        self.readout.update(reading)
+        self.readout.draw(sprite, 0, 0)
+        self.shown = reading
 
-        # Draw the text value
-        display.text("{:.2f}v".format(reading), 100, 210, 0xFFFF)
+    def update(self):
+        """ Sample the battery, the meter is only rendered again when the
+        displayed reading changes"""
+        self.sample()
+        if self.centivolts != self.shown:
+            self.render()
+            self.invalidate()
+
+    def draw(self, target, dx, dy):
+        """ Blit the rendered meter
+        target: Frame buffer to draw on
+        dx: Added to x on the display
+        dy: Added to y on the display
+        """
+        target.blit(self.sprite, self.left + dx, self.top + dy, self.transparent)
 
     def read(self):
         """ Read the ADC value and convert to voltage"""
-        return self.vbat.read_u16() * 3.3 / 65535 * 2
\ No newline at end of file
+        return self.vbat.read_u16() * 3.3 / 65535 * 2
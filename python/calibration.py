@@ -0,0 +1,255 @@
+"""
+  ____  _           ____        _
+ |  _ \(_) ___ ___ | __ )  ___ | |_
+ | |_) | |/ __/ _ \|  _ \ / _ \| __|
+ |  __/| | (_| (_) | |_) | (_) | |_
+ |_|   |_|\___\___/|____/ \___/ \__|
+ The Pico Bot sensor calibration, measured once and kept in flash
+
+ By Matthew Page
+
+"""
+from array import array
+import struct
+from sensors import ACC_LSB_PER_G
+from orientation import isqrt
+from fastpath import channel_spread
+
+CHANNELS = 6
+
+# Raw readings while sat still and upright on its base, gravity on X
+RESTING = (ACC_LSB_PER_G, 0, 0, 0, 0, 0)
+
+# Still samples averaged for the resting readings, about a second at 250Hz
+SAMPLES = 256
+
+# Any reading further than this from the average so far means the bot was
+# moved, and calibration starts again. 0.1g and 5dps.
+STILL_RAW = (410, 410, 410, 320, 320, 320)
+
+# A graph range is never narrower than this many times the channel's noise
+NOISE_SPAN = 8
+
+# The graph ranges follow the recent readings: samples averaged over, as a
+# power of two, about 16 seconds awake at 250Hz
+SPREAD_SHIFT = 12
+
+# Each side of a graph range is this many mean absolute deviations from the
+# mean, about three standard deviations
+SPREAD_SPAN = 4
+
+# A range that has moved by less than this fraction of its width is not
+# saved again
+SAVE_TOLERANCE = 8
+
+# File layout: magic, version, samples averaged, then for each channel the
+# resting offset, noise, and the recent mean and mean absolute deviation
+MAGIC = b"PBCL"
+VERSION = 1
+FORMAT = "<4sHH6h6H6h6H"
+
+class RunningStats():
+    """ Class to keep the mean and variance of a number of channels one
+    sample at a time with Welford's method, in fixed arrays. Means are kept
+    at 16 times the reading so small offsets are not lost."""
+
+    def __init__(self, channels):
+        """ Initialise the statistics
+        channels: Number of readings in each sample
+        """
+        self.channels = channels
+        self.mean = array('i', [0] * channels)
+        self.m2 = array('i', [0] * channels)
+        self.count = 0
+
+    def clear(self):
+        """ Forget every sample"""
+        for i in range(self.channels):
+            self.mean[i] = 0
+            self.m2[i] = 0
+        self.count = 0
+
+    def add(self, data, base):
+        """ Add one sample
+        data: array('h') of readings
+        base: Index of the sample's first reading
+        """
+        self.count += 1
+        count = self.count
+        mean = self.mean
+        m2 = self.m2
+        for i in range(self.channels):
+            value = data[base + i] << 4
+            delta = value - mean[i]
+
+            # Rounded towards zero so the mean does not creep
+            if delta < 0:
+                mean[i] -= (-delta) // count
+            else:
+                mean[i] += delta // count
+            m2[i] += (delta * (value - mean[i])) >> 8
+
+    def average(self, channel):
+        """ Mean of a channel in readings, rounded
+        channel: Index of the channel
+        """
+        return (self.mean[channel] + 8) >> 4
+
+    def deviation(self, channel):
+        """ Standard deviation of a channel in readings, rounded down
+        channel: Index of the channel
+        """
+        if self.count < 2:
+            return 0
+        return isqrt(self.m2[channel] // (self.count - 1))
+
+class Calibration():
+    """ Class to hold the sensor calibration: the offsets that make the gyro
+    read zero and the bot sit upright when still, the noise on each channel,
+    and the recent mean and mean absolute deviation of every reading, which
+    set the graph ranges. Old readings fade from those, so a knock widens a
+    range for a while rather than for good. Calibrating averages SAMPLES
+    still samples fed in from the FIFO, the result is saved to flash and
+    loaded at boot so it is only done once."""
+
+    def __init__(self, low, high):
+        """ Initialise the calibration with default ranges
+        low: Lowest raw reading of each channel until more are seen
+        high: Highest raw reading of each channel until more are seen
+        """
+        self.bias = array('h', [0] * CHANNELS)
+        self.noise = array('H', [0] * CHANNELS)
+
+        # Means and deviations in readings shifted up by SPREAD_SHIFT
+        self.centre = array('i', [0] * CHANNELS)
+        self.spread = array('i', [0] * CHANNELS)
+        self.set_range(low, high)
+        self.savedLow = array('h', [0] * CHANNELS)
+        self.savedSpan = array('H', [0] * CHANNELS)
+        self.keep()
+        self.samples = 0
+        self.stats = RunningStats(CHANNELS)
+        self.running = False
+
+    def set_range(self, low, high):
+        """ Start the recent readings off to give these ranges
+        low: Lowest raw reading of each channel
+        high: Highest raw reading of each channel
+        """
+        for i in range(CHANNELS):
+            self.centre[i] = ((low[i] + high[i]) // 2) << SPREAD_SHIFT
+            self.spread[i] = ((high[i] - low[i]) // (2 * SPREAD_SPAN)) << SPREAD_SHIFT
+
+    def start(self):
+        """ Start calibrating, the bot needs to sit still for a moment"""
+        self.stats.clear()
+        self.running = True
+
+    def add(self, batch):
+        """ Feed samples in while calibrating, True once it has finished
+        batch: SampleBatch read from the sensor FIFO
+        """
+        if not self.running:
+            return False
+        stats = self.stats
+        data = batch.data
+        for base in range(0, batch.count * 6, 6):
+            if stats.count:
+                for i in range(CHANNELS):
+                    if abs((data[base + i] << 4) - stats.mean[i]) > (STILL_RAW[i] << 4):
+                        stats.clear()
+                        break
+            stats.add(data, base)
+            if stats.count == SAMPLES:
+                self.finish()
+                return True
+        return False
+
+    def finish(self):
+        """ Take the resting readings and noise from the samples"""
+        stats = self.stats
+        for i in range(CHANNELS):
+            self.bias[i] = stats.average(i) - RESTING[i]
+            self.noise[i] = stats.deviation(i)
+        self.samples = stats.count
+        self.running = False
+
+    def track(self, batch):
+        """ Follow the recent readings through every sample of a batch
+        batch: SampleBatch read from the sensor FIFO
+        """
+        channel_spread(batch.data, batch.count, self.centre, self.spread, CHANNELS, SPREAD_SHIFT)
+
+    def span(self, channel):
+        """ Width of a channel's graph range in raw readings
+        channel: Index of the channel
+        """
+        deviation = self.spread[channel] >> SPREAD_SHIFT
+        return max(deviation * SPREAD_SPAN * 2, self.noise[channel] * NOISE_SPAN, 1)
+
+    def low(self, channel):
+        """ Bottom of a channel's graph range in raw readings
+        channel: Index of the channel
+        """
+        return (self.centre[channel] >> SPREAD_SHIFT) - (self.span(channel) // 2)
+
+    def keep(self):
+        """ Remember the ranges as saved"""
+        for i in range(CHANNELS):
+            self.savedLow[i] = max(-32768, min(32767, self.low(i)))
+            self.savedSpan[i] = min(65535, self.span(i))
+
+    def changed(self):
+        """ True if a range has moved or resized noticeably since it was
+        loaded or saved"""
+        for i in range(CHANNELS):
+            tolerance = self.savedSpan[i] // SAVE_TOLERANCE
+            if abs(self.low(i) - self.savedLow[i]) > tolerance or abs(self.span(i) - self.savedSpan[i]) > tolerance:
+                return True
+        return False
+
+    def scale(self, offsets, divisors):
+        """ Graph scaling for fastpath.scale_positions from the recent readings
+        offsets: array('i') for the bottom of each range, hundredths of a raw reading
+        divisors: array('i') for the height of each range in the same units
+        """
+        for i in range(CHANNELS):
+            offsets[i] = self.low(i) * 100
+            divisors[i] = self.span(i) * 100
+
+    def load(self, path):
+        """ Read a saved calibration, False if there is none or it is not
+        one this version can use
+        path: File in flash
+        """
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+        except OSError:
+            return False
+        if len(data) != struct.calcsize(FORMAT):
+            return False
+        values = struct.unpack(FORMAT, data)
+        if values[0] != MAGIC or values[1] != VERSION:
+            return False
+
+        self.samples = values[2]
+        for i in range(CHANNELS):
+            self.bias[i] = values[3 + i]
+            self.noise[i] = values[9 + i]
+            self.centre[i] = values[15 + i] << SPREAD_SHIFT
+            self.spread[i] = values[21 + i] << SPREAD_SHIFT
+        self.keep()
+        return True
+
+    def save(self, path):
+        """ Write the calibration to flash
+        path: File in flash
+        """
+        means = tuple((self.centre[i] >> SPREAD_SHIFT) for i in range(CHANNELS))
+        deviations = tuple(min(65535, self.spread[i] >> SPREAD_SHIFT) for i in range(CHANNELS))
+        data = struct.pack(FORMAT, MAGIC, VERSION, self.samples, *(
+            tuple(self.bias) + tuple(self.noise) + means + deviations))
+        with open(path, "wb") as f:
+            f.write(data)
+        self.keep()
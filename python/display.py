@@ -1,10 +1,79 @@
 # Vendor display class for the 1.28" LCD display
 import framebuf
 import utime
+from array import array
 from machine import Pin,SPI,PWM
+from fastpath import expand_gs8, expand_gs4
+
+# GC9A01 init sequence, each entry is command, parameter count, parameters
+# then a delay in ms to wait after it
+GC9A01_INIT = bytes((
+    0xEF, 0, 0,
+    0xEB, 1, 0x14, 0,
+    0xFE, 0, 0,
+    0xEF, 0, 0,
+    0xEB, 1, 0x14, 0,
+    0x84, 1, 0x40, 0,
+    0x85, 1, 0xFF, 0,
+    0x86, 1, 0xFF, 0,
+    0x87, 1, 0xFF, 0,
+    0x88, 1, 0x0A, 0,
+    0x89, 1, 0x21, 0,
+    0x8A, 1, 0x00, 0,
+    0x8B, 1, 0x80, 0,
+    0x8C, 1, 0x01, 0,
+    0x8D, 1, 0x01, 0,
+    0x8E, 1, 0xFF, 0,
+    0x8F, 1, 0xFF, 0,
+    0xB6, 2, 0x00, 0x20, 0,
+    0x36, 1, 0x98, 0,
+    0x3A, 1, 0x05, 0,
+    0x90, 4, 0x08, 0x08, 0x08, 0x08, 0,
+    0xBD, 1, 0x06, 0,
+    0xBC, 1, 0x00, 0,
+    0xFF, 3, 0x60, 0x01, 0x04, 0,
+    0xC3, 1, 0x13, 0,
+    0xC4, 1, 0x13, 0,
+    0xC9, 1, 0x22, 0,
+    0xBE, 1, 0x11, 0,
+    0xE1, 2, 0x10, 0x0E, 0,
+    0xDF, 3, 0x21, 0x0C, 0x02, 0,
+    0xF0, 6, 0x45, 0x09, 0x08, 0x08, 0x26, 0x2A, 0,
+    0xF1, 6, 0x43, 0x70, 0x72, 0x36, 0x37, 0x6F, 0,
+    0xF2, 6, 0x45, 0x09, 0x08, 0x08, 0x26, 0x2A, 0,
+    0xF3, 6, 0x43, 0x70, 0x72, 0x36, 0x37, 0x6F, 0,
+    0xED, 2, 0x1B, 0x0B, 0,
+    0xAE, 1, 0x77, 0,
+    0xCD, 1, 0x63, 0,
+    0x70, 9, 0x07, 0x07, 0x04, 0x0E, 0x0F, 0x09, 0x07, 0x08, 0x03, 0,
+    0xE8, 1, 0x34, 0,
+    0x62, 12, 0x18, 0x0D, 0x71, 0xED, 0x70, 0x70, 0x18, 0x0F, 0x71, 0xEF, 0x70, 0x70, 0,
+    0x63, 12, 0x18, 0x11, 0x71, 0xF1, 0x70, 0x70, 0x18, 0x13, 0x71, 0xF3, 0x70, 0x70, 0,
+    0x64, 7, 0x28, 0x29, 0xF1, 0x01, 0xF1, 0x00, 0x07, 0,
+    0x66, 10, 0x3C, 0x00, 0xCD, 0x67, 0x45, 0x45, 0x10, 0x00, 0x00, 0x00, 0,
+    0x67, 10, 0x00, 0x3C, 0x00, 0x00, 0x00, 0x01, 0x54, 0x10, 0x32, 0x98, 0,
+    0x74, 7, 0x10, 0x85, 0x80, 0x00, 0x00, 0x4E, 0x00, 0,
+    0x98, 2, 0x3E, 0x07, 0,
+    0x35, 0, 0,
+    0x21, 0, 0,
+    0x11, 0, 120,
+    0x29, 0, 20,
+))
+
+# Most dirty rectangles tracked before they collapse into one bounding box
+MAX_DIRTY = 8
+
+# Frame buffer colour modes: RGB565 pixels, or 8 or 4 bit indices into a
+# palette of RGB565 colours that are looked up as the frame is sent
+COLOUR_RGB565 = 0
+COLOUR_GS8 = 1
+COLOUR_GS4 = 2
+
+# Rows expanded from indices to RGB565 at a time while sending
+LINE_ROWS = 8
 
 class LCD_1inch28(framebuf.FrameBuffer):
-    def __init__(self, DC, CS, SCK, MOSI, RST, BL):
+    def __init__(self, DC, CS, SCK, MOSI, RST, BL, double_buffer=False, colour_mode=COLOUR_RGB565):
         self.width = 240
         self.height = 240
 
@@ -12,24 +81,72 @@ class LCD_1inch28(framebuf.FrameBuffer):
         self.rst = Pin(RST,Pin.OUT)
 
         self.cs(1)
+
+        # Command and parameter buffers reused for every transfer, plus the
+        # window last sent so unchanged windows cost nothing
+        self.cmd_buf = bytearray(1)
+        self.data_buf = bytearray(1)
+        self.cols = bytearray(4)
+        self.rows = bytearray(4)
+        self.window = array('h', [-1, -1, -1, -1])
+
         self.spi = SPI(1,100_000_000,polarity=0, phase=0,sck=Pin(SCK),mosi=Pin(MOSI),miso=None)
         self.dc = Pin(DC,Pin.OUT)
         self.dc(1)
-        self.buffer = bytearray(self.height * self.width * 2)
-        super().__init__(self.buffer, self.width, self.height, framebuf.RGB565)
+
+        # Indexed modes keep a palette and a line buffer the rows are
+        # expanded into, the frame buffer is a half or a quarter the size
+        self.palette = None
+        if colour_mode == COLOUR_GS8:
+            self.format = framebuf.GS8
+            self.row_bytes = self.width
+            self.palette = array('H', [0] * 256)
+            self.expand = expand_gs8
+        elif colour_mode == COLOUR_GS4:
+            self.format = framebuf.GS4_HMSB
+            self.row_bytes = self.width // 2
+            self.palette = array('H', [0] * 16)
+            self.expand = expand_gs4
+        else:
+            self.format = framebuf.RGB565
+            self.row_bytes = self.width * 2
+        if self.palette is not None:
+            # Index 0 is black so a cleared buffer is black in every mode
+            self.palette_count = 1
+            self.palette_index = {0x0000: 0}
+            self.line_buffer = bytearray(self.width * 2 * LINE_ROWS)
+            self.line_mv = memoryview(self.line_buffer)
+
+        # A spare row after the frame lets view() make a region at the
+        # bottom right, a frame buffer needs a full stride for every row
+        self.canvas = bytearray((self.height + 1) * self.row_bytes)
+        self.buffer = memoryview(self.canvas)[:self.height * self.row_bytes]
+        self.mv = self.buffer
+        super().__init__(self.buffer, self.width, self.height, self.format)
+
+        # Dirty rectangles as x0, y0, x1, y1 (exclusive) runs of four
+        self.dirty = array('h', [0] * (MAX_DIRTY * 4))
+        self.dirty_count = 0
+
+        # Front buffer and handshake locks, only used when double buffered
+        self.front = None
         self.init_display()
 
-        self.red   =   0x07E0
-        self.green =   0x001f
-        self.blue  =   0xf800
-        self.white =   0xffff
-        self.yellow =  0x00ff
-        self.purple =  0xffe0
-        self.grey = 0x9999
+        self.red   =   self.colour(0x07E0)
+        self.green =   self.colour(0x001f)
+        self.blue  =   self.colour(0xf800)
+        self.white =   self.colour(0xffff)
+        self.yellow =  self.colour(0x00ff)
+        self.purple =  self.colour(0xffe0)
+        self.grey = self.colour(0x9999)
+        self.black = self.colour(0x0000)
 
         self.fill(self.white)
         self.show()
 
+        if double_buffer:
+            self.start_double_buffer()
+
         self.pwm = PWM(Pin(BL))
         self.pwm.freq(5000)
 
@@ -39,287 +156,311 @@ class LCD_1inch28(framebuf.FrameBuffer):
         self.MID_Y = int(self.HEIGHT / 2)
 
     def write_cmd(self, cmd):
+        self.cmd_buf[0] = cmd
         self.cs(1)
         self.dc(0)
         self.cs(0)
-        self.spi.write(bytearray([cmd]))
+        self.spi.write(self.cmd_buf)
         self.cs(1)
 
     def write_data(self, buf):
+        self.data_buf[0] = buf
         self.cs(1)
         self.dc(1)
         self.cs(0)
-        self.spi.write(bytearray([buf]))
+        self.spi.write(self.data_buf)
+        self.cs(1)
+
+    def write_cmd_args(self, cmd, buf):
+        """Send a command and its parameter bytes in one transaction"""
+        self.cmd_buf[0] = cmd
+        self.cs(1)
+        self.dc(0)
+        self.cs(0)
+        self.spi.write(self.cmd_buf)
+        self.dc(1)
+        self.spi.write(buf)
         self.cs(1)
+
+    def colour(self, rgb):
+        """Value to draw an RGB565 colour with: the colour itself, or in the
+        indexed modes its palette index, added the first time it is asked for"""
+        if self.palette is None:
+            return rgb
+        index = self.palette_index.get(rgb)
+        if index is None:
+            if self.palette_count == len(self.palette):
+                raise ValueError("Palette is full")
+            index = self.palette_count
+            self.palette[index] = rgb
+            self.palette_index[rgb] = index
+            self.palette_count += 1
+        return index
+
+    def view(self, x, y, w, h):
+        """Frame buffer over a rectangle of this one, drawing on it is clipped
+        to the rectangle. In COLOUR_GS4 x must be even."""
+        if self.format == framebuf.RGB565:
+            start = (y * self.row_bytes) + (x * 2)
+        elif self.format == framebuf.GS8:
+            start = (y * self.row_bytes) + x
+        else:
+            start = (y * self.row_bytes) + (x >> 1)
+        return framebuf.FrameBuffer(memoryview(self.canvas)[start:], w, h, self.format, self.width)
+
     def set_bl_pwm(self,duty):
         self.pwm.duty_u16(duty)#max 65535
+
+    def set_idle(self, on):
+        """Idle mode: 8 colours and lower power, the image is kept"""
+        self.wait_flush()
+        self.write_cmd(0x39 if on else 0x38)
     def init_display(self):
         """Initialize dispaly"""
+        start = utime.ticks_us()
+
+        # The reset pulse only has to be 10us long
         self.rst(1)
-        utime.sleep(0.01)
         self.rst(0)
-        utime.sleep(0.01)
+        utime.sleep_ms(1)
         self.rst(1)
-        utime.sleep(0.05)
-
-        self.write_cmd(0xEF)
-        self.write_cmd(0xEB)
-        self.write_data(0x14)
-
-        self.write_cmd(0xFE)
-        self.write_cmd(0xEF)
-
-        self.write_cmd(0xEB)
-        self.write_data(0x14)
-
-        self.write_cmd(0x84)
-        self.write_data(0x40)
-
-        self.write_cmd(0x85)
-        self.write_data(0xFF)
-
-        self.write_cmd(0x86)
-        self.write_data(0xFF)
-
-        self.write_cmd(0x87)
-        self.write_data(0xFF)
-
-        self.write_cmd(0x88)
-        self.write_data(0x0A)
-
-        self.write_cmd(0x89)
-        self.write_data(0x21)
+        utime.sleep_ms(50)
+
+        # Replay the init table, one CS assertion per command with all of
+        # its parameters sent in a single write
+        table = memoryview(GC9A01_INIT)
+        i = 0
+        while i < len(table):
+            count = table[i + 1]
+            if count:
+                self.write_cmd_args(table[i], table[i + 2:i + 2 + count])
+            else:
+                self.write_cmd(table[i])
+            delay = table[i + 2 + count]
+            if delay:
+                utime.sleep_ms(delay)
+            i += count + 3
+
+        self.window[0] = -1
+        self.init_us = utime.ticks_diff(utime.ticks_us(), start)
+
+    def set_window(self, x0, y0, x1, y1):
+        """Set the panel address window, inclusive coordinates, and start
+        a memory write. Only the parts that changed since the last window
+        are sent."""
+        window = self.window
+        if window[0] != x0 or window[2] != x1:
+            cols = self.cols
+            cols[0] = x0 >> 8
+            cols[1] = x0 & 0xff
+            cols[2] = x1 >> 8
+            cols[3] = x1 & 0xff
+            self.write_cmd_args(0x2A, cols)
+            window[0] = x0
+            window[2] = x1
+
+        if window[1] != y0 or window[3] != y1:
+            rows = self.rows
+            rows[0] = y0 >> 8
+            rows[1] = y0 & 0xff
+            rows[2] = y1 >> 8
+            rows[3] = y1 & 0xff
+            self.write_cmd_args(0x2B, rows)
+            window[1] = y0
+            window[3] = y1
 
-        self.write_cmd(0x8A)
-        self.write_data(0x00)
-
-        self.write_cmd(0x8B)
-        self.write_data(0x80)
-
-        self.write_cmd(0x8C)
-        self.write_data(0x01)
-
-        self.write_cmd(0x8D)
-        self.write_data(0x01)
-
-        self.write_cmd(0x8E)
-        self.write_data(0xFF)
-
-        self.write_cmd(0x8F)
-        self.write_data(0xFF)
-
-
-        self.write_cmd(0xB6)
-        self.write_data(0x00)
-        self.write_data(0x20)
-
-        self.write_cmd(0x36)
-        self.write_data(0x98)
-
-        self.write_cmd(0x3A)
-        self.write_data(0x05)
-
-
-        self.write_cmd(0x90)
-        self.write_data(0x08)
-        self.write_data(0x08)
-        self.write_data(0x08)
-        self.write_data(0x08)
-
-        self.write_cmd(0xBD)
-        self.write_data(0x06)
-
-        self.write_cmd(0xBC)
-        self.write_data(0x00)
-
-        self.write_cmd(0xFF)
-        self.write_data(0x60)
-        self.write_data(0x01)
-        self.write_data(0x04)
-
-        self.write_cmd(0xC3)
-        self.write_data(0x13)
-        self.write_cmd(0xC4)
-        self.write_data(0x13)
-
-        self.write_cmd(0xC9)
-        self.write_data(0x22)
-
-        self.write_cmd(0xBE)
-        self.write_data(0x11)
-
-        self.write_cmd(0xE1)
-        self.write_data(0x10)
-        self.write_data(0x0E)
-
-        self.write_cmd(0xDF)
-        self.write_data(0x21)
-        self.write_data(0x0c)
-        self.write_data(0x02)
-
-        self.write_cmd(0xF0)
-        self.write_data(0x45)
-        self.write_data(0x09)
-        self.write_data(0x08)
-        self.write_data(0x08)
-        self.write_data(0x26)
-        self.write_data(0x2A)
-
-        self.write_cmd(0xF1)
-        self.write_data(0x43)
-        self.write_data(0x70)
-        self.write_data(0x72)
-        self.write_data(0x36)
-        self.write_data(0x37)
-        self.write_data(0x6F)
-
-
-        self.write_cmd(0xF2)
-        self.write_data(0x45)
-        self.write_data(0x09)
-        self.write_data(0x08)
-        self.write_data(0x08)
-        self.write_data(0x26)
-        self.write_data(0x2A)
-
-        self.write_cmd(0xF3)
-        self.write_data(0x43)
-        self.write_data(0x70)
-        self.write_data(0x72)
-        self.write_data(0x36)
-        self.write_data(0x37)
-        self.write_data(0x6F)
-
-        self.write_cmd(0xED)
-        self.write_data(0x1B)
-        self.write_data(0x0B)
-
-        self.write_cmd(0xAE)
-        self.write_data(0x77)
-
-        self.write_cmd(0xCD)
-        self.write_data(0x63)
-
-
-        self.write_cmd(0x70)
-        self.write_data(0x07)
-        self.write_data(0x07)
-        self.write_data(0x04)
-        self.write_data(0x0E)
-        self.write_data(0x0F)
-        self.write_data(0x09)
-        self.write_data(0x07)
-        self.write_data(0x08)
-        self.write_data(0x03)
-
-        self.write_cmd(0xE8)
-        self.write_data(0x34)
-
-        self.write_cmd(0x62)
-        self.write_data(0x18)
-        self.write_data(0x0D)
-        self.write_data(0x71)
-        self.write_data(0xED)
-        self.write_data(0x70)
-        self.write_data(0x70)
-        self.write_data(0x18)
-        self.write_data(0x0F)
-        self.write_data(0x71)
-        self.write_data(0xEF)
-        self.write_data(0x70)
-        self.write_data(0x70)
-
-        self.write_cmd(0x63)
-        self.write_data(0x18)
-        self.write_data(0x11)
-        self.write_data(0x71)
-        self.write_data(0xF1)
-        self.write_data(0x70)
-        self.write_data(0x70)
-        self.write_data(0x18)
-        self.write_data(0x13)
-        self.write_data(0x71)
-        self.write_data(0xF3)
-        self.write_data(0x70)
-        self.write_data(0x70)
-
-        self.write_cmd(0x64)
-        self.write_data(0x28)
-        self.write_data(0x29)
-        self.write_data(0xF1)
-        self.write_data(0x01)
-        self.write_data(0xF1)
-        self.write_data(0x00)
-        self.write_data(0x07)
-
-        self.write_cmd(0x66)
-        self.write_data(0x3C)
-        self.write_data(0x00)
-        self.write_data(0xCD)
-        self.write_data(0x67)
-        self.write_data(0x45)
-        self.write_data(0x45)
-        self.write_data(0x10)
-        self.write_data(0x00)
-        self.write_data(0x00)
-        self.write_data(0x00)
-
-        self.write_cmd(0x67)
-        self.write_data(0x00)
-        self.write_data(0x3C)
-        self.write_data(0x00)
-        self.write_data(0x00)
-        self.write_data(0x00)
-        self.write_data(0x01)
-        self.write_data(0x54)
-        self.write_data(0x10)
-        self.write_data(0x32)
-        self.write_data(0x98)
-
-        self.write_cmd(0x74)
-        self.write_data(0x10)
-        self.write_data(0x85)
-        self.write_data(0x80)
-        self.write_data(0x00)
-        self.write_data(0x00)
-        self.write_data(0x4E)
-        self.write_data(0x00)
-
-        self.write_cmd(0x98)
-        self.write_data(0x3e)
-        self.write_data(0x07)
-
-        self.write_cmd(0x35)
-        self.write_cmd(0x21)
-
-        self.write_cmd(0x11)
-        utime.sleep(0.12)
-        self.write_cmd(0x29)
-        utime.sleep(0.02)
-
-        self.write_cmd(0x21)
-
-        self.write_cmd(0x11)
-
-        self.write_cmd(0x29)
+        self.write_cmd(0x2C)
 
     def show(self):
-        self.write_cmd(0x2A)
-        self.write_data(0x00)
-        self.write_data(0x00)
-        self.write_data(0x00)
-        self.write_data(0xef)
-
-        self.write_cmd(0x2B)
-        self.write_data(0x00)
-        self.write_data(0x00)
-        self.write_data(0x00)
-        self.write_data(0xEF)
+        if self.front is not None:
+            self.mark_dirty(0, 0, self.width, self.height)
+            self.swap()
+            return
 
-        self.write_cmd(0x2C)
+        if self.palette is not None:
+            self.send_region(self.mv, 0, 0, self.width, self.height)
+            self.dirty_count = 0
+            return
+
+        self.set_window(0, 0, self.width - 1, self.height - 1)
 
         self.cs(1)
         self.dc(1)
         self.cs(0)
         self.spi.write(self.buffer)
         self.cs(1)
+        self.dirty_count = 0
+
+    def mark_dirty(self, x, y, w, h):
+        """Add a rectangle to be sent by show_dirty(), merging any it overlaps"""
+        x0 = max(x, 0)
+        y0 = max(y, 0)
+        x1 = min(x + w, self.width)
+        y1 = min(y + h, self.height)
+        if x0 >= x1 or y0 >= y1:
+            return
+
+        rects = self.dirty
+        i = 0
+        while i < self.dirty_count:
+            j = i * 4
+            if x0 <= rects[j + 2] and rects[j] <= x1 and y0 <= rects[j + 3] and rects[j + 1] <= y1:
+                # Grow to cover both, drop the old one and check again
+                x0 = min(x0, rects[j])
+                y0 = min(y0, rects[j + 1])
+                x1 = max(x1, rects[j + 2])
+                y1 = max(y1, rects[j + 3])
+                self.dirty_count -= 1
+                k = self.dirty_count * 4
+                rects[j] = rects[k]
+                rects[j + 1] = rects[k + 1]
+                rects[j + 2] = rects[k + 2]
+                rects[j + 3] = rects[k + 3]
+                i = 0
+            else:
+                i += 1
+
+        if self.dirty_count == MAX_DIRTY:
+            # Out of slots, collapse everything into one bounding box
+            for i in range(0, self.dirty_count * 4, 4):
+                x0 = min(x0, rects[i])
+                y0 = min(y0, rects[i + 1])
+                x1 = max(x1, rects[i + 2])
+                y1 = max(y1, rects[i + 3])
+            self.dirty_count = 0
+
+        j = self.dirty_count * 4
+        rects[j] = x0
+        rects[j + 1] = y0
+        rects[j + 2] = x1
+        rects[j + 3] = y1
+        self.dirty_count += 1
+
+    def show_region(self, x, y, w, h):
+        """Send one rectangle of the buffer to the panel"""
+        if self.front is not None:
+            self.mark_dirty(x, y, w, h)
+            self.swap()
+            return
+
+        self.send_region(self.mv, max(x, 0), max(y, 0), min(x + w, self.width), min(y + h, self.height))
+
+    def send_region(self, mv, x0, y0, x1, y1):
+        """Send the x0, y0 to x1, y1 (exclusive) rectangle of a frame buffer's
+        memoryview to the panel"""
+        if x0 >= x1 or y0 >= y1:
+            return
+
+        self.set_window(x0, y0, x1 - 1, y1 - 1)
+
+        self.cs(1)
+        self.dc(1)
+        self.cs(0)
+        if self.palette is not None:
+            self.send_indexed(mv, x0, y0, x1, y1)
+            self.cs(1)
+            return
+
+        stride = self.row_bytes
+        if x0 == 0 and x1 == self.width:
+            # Full width rows are contiguous, one slice covers the lot
+            self.spi.write(mv[y0 * stride:y1 * stride])
+        else:
+            start = y0 * stride + x0 * 2
+            length = (x1 - x0) * 2
+            for row in range(y0, y1):
+                self.spi.write(mv[start:start + length])
+                start += stride
+        self.cs(1)
+
+    def send_indexed(self, mv, x0, y0, x1, y1):
+        """Expand a rectangle of palette indices to RGB565 through the line
+        buffer and write it, the window must already be set"""
+        line = self.line_mv
+        palette = self.palette
+        expand = self.expand
+        if x0 == 0 and x1 == self.width:
+            # Full width rows are contiguous, expand LINE_ROWS at a time
+            for row in range(y0, y1, LINE_ROWS):
+                count = min(LINE_ROWS, y1 - row) * self.width
+                expand(mv, row * self.width, count, palette, line)
+                self.spi.write(line[:count * 2])
+        else:
+            width = x1 - x0
+            start = y0 * self.width + x0
+            for row in range(y0, y1):
+                expand(mv, start, width, palette, line)
+                self.spi.write(line[:width * 2])
+                start += self.width
+
+    def show_dirty(self):
+        """Send only the rectangles marked dirty since the last show"""
+        if self.front is not None:
+            self.swap()
+            return
+
+        rects = self.dirty
+        for i in range(0, self.dirty_count * 4, 4):
+            self.send_region(self.mv, rects[i], rects[i + 1], rects[i + 2], rects[i + 3])
+        self.dirty_count = 0
+
+    def start_double_buffer(self):
+        """Render into one buffer on core 0 while core 1 sends the last frame
+        from another. The second buffer needs another 115KB of heap, 58KB
+        or 29KB in the indexed colour modes.
+
+        Once started show(), show_region() and show_dirty() hand the frame
+        to core 1 and return straight away, and anything else that talks to
+        the panel must call wait_flush() first."""
+        import _thread
+
+        self.front = bytearray(len(self.buffer))
+        self.front_mv = memoryview(self.front)
+        self.front_dirty = array('h', [0] * (MAX_DIRTY * 4))
+        self.front_count = 0
+
+        # pending is held until a frame is ready, idle is held while core 1
+        # is sending one
+        self.pending = _thread.allocate_lock()
+        self.idle = _thread.allocate_lock()
+        self.pending.acquire()
+        _thread.start_new_thread(self.flush_loop, ())
+
+    def swap(self):
+        """Hand the dirty rectangles to core 1, waiting for it to finish the
+        previous frame first. Only the rows of the dirty rectangles are
+        copied to the front buffer."""
+        self.idle.acquire()
+
+        rects = self.dirty
+        front = self.front_dirty
+        stride = self.row_bytes
+        for i in range(0, self.dirty_count * 4, 4):
+            start = rects[i + 1] * stride
+            end = rects[i + 3] * stride
+            self.front_mv[start:end] = self.mv[start:end]
+            front[i] = rects[i]
+            front[i + 1] = rects[i + 1]
+            front[i + 2] = rects[i + 2]
+            front[i + 3] = rects[i + 3]
+        self.front_count = self.dirty_count
+        self.dirty_count = 0
+
+        self.pending.release()
+
+    def wait_flush(self):
+        """Block until core 1 has finished sending, safe to call any time"""
+        if self.front is not None:
+            self.idle.acquire()
+            self.idle.release()
+
+    def flush_loop(self):
+        """Core 1: send each frame handed over by swap()"""
+        while True:
+            self.pending.acquire()
+            try:
+                rects = self.front_dirty
+                for i in range(0, self.front_count * 4, 4):
+                    self.send_region(self.front_mv, rects[i], rects[i + 1], rects[i + 2], rects[i + 3])
+            finally:
+                self.idle.release()
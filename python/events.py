@@ -0,0 +1,384 @@
+"""
+  ____  _           ____        _
+ |  _ \(_) ___ ___ | __ )  ___ | |_
+ | |_) | |/ __/ _ \|  _ \ / _ \| __|
+ |  __/| | (_| (_) | |_) | (_) | |_
+ |_|   |_|\___\___/|____/ \___/ \__|
+ The Pico Bot motion events, taps, shakes, falls and tilts from every sample
+
+ By Matthew Page
+
+"""
+from array import array
+from sensors import ACC_LSB_PER_G
+
+# Events, in the order of EVENT_NAMES
+EVENT_NONE = 0
+EVENT_MOVE = 1
+EVENT_TAP = 2
+EVENT_DOUBLE_TAP = 3
+EVENT_SHAKE = 4
+EVENT_FREE_FALL = 5
+EVENT_TILT = 6
+EVENT_NAMES = ("none", "move", "tap", "double tap", "shake", "free fall", "tilt")
+
+# Detectors to run, one bit for each event
+DETECT_MOVE = 1 << EVENT_MOVE
+DETECT_TAP = 1 << EVENT_TAP
+DETECT_DOUBLE_TAP = 1 << EVENT_DOUBLE_TAP
+DETECT_SHAKE = 1 << EVENT_SHAKE
+DETECT_FREE_FALL = 1 << EVENT_FREE_FALL
+DETECT_TILT = 1 << EVENT_TILT
+DETECT_ALL = DETECT_MOVE | DETECT_TAP | DETECT_DOUBLE_TAP | DETECT_SHAKE | DETECT_FREE_FALL | DETECT_TILT
+
+# Events waiting to be handled, the oldest is dropped when it is full
+QUEUE_LENGTH = 16
+
+# Samples are numbered modulo 1 << 30 like utime ticks, so the number stays
+# a small int. Samples since an earlier one are (sample - earlier) &
+# SAMPLE_MASK, right for about 50 days at 250Hz.
+SAMPLE_MASK = 0x3FFFFFFF
+
+# The accelerometer baseline follows the readings by 1 / (1 << BASELINE) a
+# sample, what it has not caught up with is the jolt taps and shakes are
+# found in. About 130ms at 250Hz.
+BASELINE = 5
+
+# Tap: a jolt over TAP_G that is over within TAP_MS then quiet, under half
+# of TAP_G, for TAP_QUIET_MS. A second tap within DOUBLE_TAP_MS of the first
+# is a double tap as well.
+TAP_G = 1.0
+TAP_MS = 100
+TAP_QUIET_MS = 40
+DOUBLE_TAP_MS = 500
+
+# Shake: SHAKE_SWINGS changes of direction over SHAKE_G on one axis within
+# SHAKE_MS. It is one shake until there has been no swing for SHAKE_MS.
+SHAKE_G = 0.8
+SHAKE_SWINGS = 4
+SHAKE_MS = 800
+
+# Free fall: under FALL_G in total for FALL_MS, over again once past
+# FALL_END_G
+FALL_G = 0.35
+FALL_END_G = 0.6
+FALL_MS = 60
+
+# Tilt: leaning further than TILT_SIN2 (the sine of the angle squared, in
+# 1024ths, 30 degrees) from upright for TILT_MS
+TILT_SIN2 = 256
+TILT_MS = 1000
+
+# Tap detector states
+TAP_IDLE = 0
+TAP_PEAK = 1
+TAP_QUIET = 2
+TAP_REJECT = 3
+
+class EventQueue():
+    """ Class to pass motion events from the detectors to the bot in fixed
+    arrays. get() returns the kind of the oldest event and leaves its
+    details in sample and value, so nothing is allocated."""
+
+    def __init__(self, length=QUEUE_LENGTH):
+        """ Initialise the queue
+        length: Most events that can wait
+        """
+        self.kinds = array('B', [0] * length)
+        self.samples = array('i', [0] * length)
+        self.values = array('i', [0] * length)
+        self.length = length
+        self.head = 0
+        self.count = 0
+        self.dropped = 0
+        self.sample = 0
+        self.value = 0
+
+    def put(self, kind, sample, value=0):
+        """ Add an event, dropping the oldest if the queue is full
+        kind: One of the EVENT_ constants
+        sample: Number of the sample it was detected on
+        value: Detail of the event, the jolt in raw readings for a tap
+        """
+        if self.count == self.length:
+            self.head = (self.head + 1) % self.length
+            self.count -= 1
+            self.dropped += 1
+        index = (self.head + self.count) % self.length
+        self.kinds[index] = kind
+        self.samples[index] = sample
+        self.values[index] = value
+        self.count += 1
+
+    def get(self):
+        """ Take the oldest event, its kind or EVENT_NONE if there are none"""
+        if self.count == 0:
+            return EVENT_NONE
+        index = self.head
+        self.head = (index + 1) % self.length
+        self.count -= 1
+        self.sample = self.samples[index]
+        self.value = self.values[index]
+        return self.kinds[index]
+
+    def clear(self):
+        """ Forget every waiting event"""
+        self.head = 0
+        self.count = 0
+
+class MotionEvents():
+    """ Class to find motion events in the sensor samples as they are read,
+    every sample goes through each detector so quick taps between frames
+    are not missed. Detectors are small state machines on integer readings,
+    their thresholds are worked out in raw readings and samples once, from
+    the module settings, by set_rate(). Events go into an EventQueue."""
+
+    def __init__(self, rate, queue, moveRaw, detect=DETECT_ALL):
+        """ Initialise the detectors
+        rate: Sensor sample rate in Hz
+        queue: EventQueue the events are put in
+        moveRaw: Six raw readings, any sample over one of them is a move.
+            The accelerometer is compared as read, the gyro either way.
+        detect: DETECT_ bits of the detectors to run
+        """
+        self.queue = queue
+        self.moveRaw = moveRaw
+        self.detect = detect
+        self.bias = array('h', [0, 0, 0, 0, 0, 0])
+        self.baseline = array('i', [0, 0, 0])
+        self.settled = False
+        self.sample = 0
+
+        self.tapState = TAP_IDLE
+        self.tapStart = 0
+        self.tapQuiet = 0
+        self.tapPeak = 0
+        self.lastTap = 0
+        self.tapped = False
+
+        self.shakeAxis = -1
+        self.shakeSign = 0
+        self.shakeSwings = 0
+        self.shakeStart = 0
+        self.shakeLast = 0
+        self.shaking = False
+
+        self.fallSamples = 0
+        self.falling = False
+
+        self.tiltSamples = 0
+        self.tilted = False
+
+        self.set_rate(rate)
+
+    def set_rate(self, rate):
+        """ Work the thresholds out for a sample rate
+        rate: Sensor sample rate in Hz
+        """
+        self.rate = rate
+        self.tapRaw = int(TAP_G * ACC_LSB_PER_G)
+        self.tapLength = max(1, (TAP_MS * rate) // 1000)
+        self.tapQuietLength = max(1, (TAP_QUIET_MS * rate) // 1000)
+        self.doubleTapLength = (DOUBLE_TAP_MS * rate) // 1000
+        self.shakeRaw = int(SHAKE_G * ACC_LSB_PER_G)
+        self.shakeLength = (SHAKE_MS * rate) // 1000
+
+        # Free fall is checked on the readings / 16 squared, 256 to 1g
+        self.fallRaw2 = int(FALL_G * 256) ** 2
+        self.fallEndRaw2 = int(FALL_END_G * 256) ** 2
+        self.fallLength = max(1, (FALL_MS * rate) // 1000)
+        self.tiltLength = (TILT_MS * rate) // 1000
+
+    def set_bias(self, bias):
+        """ Offsets taken off the accelerometer, so sitting at rest is upright
+        bias: Six raw offsets, accelerometer then gyro, as Calibration.bias
+        """
+        for i in range(6):
+            self.bias[i] = bias[i]
+
+    def enable(self, detect):
+        """ Choose the detectors to run
+        detect: DETECT_ bits of the detectors
+        """
+        self.detect = detect
+
+    def reset(self):
+        """ Start the detectors again, after the sensor has not been read"""
+        self.settled = False
+        self.tapState = TAP_IDLE
+        self.tapped = False
+        self.shakeSwings = 0
+        self.shaking = False
+        self.fallSamples = 0
+        self.falling = False
+        self.tiltSamples = 0
+
+    def update(self, batch):
+        """ Run every sample in a batch through the detectors
+        batch: SampleBatch read from the sensor FIFO
+        """
+        if batch.count == 0:
+            return
+        data = batch.data
+        detect = self.detect
+        queue = self.queue
+        baseline = self.baseline
+        if not self.settled:
+            for i in range(3):
+                baseline[i] = data[i] << 4
+            self.settled = True
+
+        moveRaw = self.moveRaw
+        moved = not detect & DETECT_MOVE
+        for j in range(0, batch.count * 6, 6):
+            sample = (self.sample + 1) & SAMPLE_MASK
+            self.sample = sample
+            ax = data[j]
+            ay = data[j + 1]
+            az = data[j + 2]
+
+            # Move, at most one a batch
+            if not moved:
+                if (ax > moveRaw[0] or ay > moveRaw[1] or az > moveRaw[2] or
+                        abs(data[j + 3]) > moveRaw[3] or abs(data[j + 4]) > moveRaw[4] or abs(data[j + 5]) > moveRaw[5]):
+                    queue.put(EVENT_MOVE, sample)
+                    moved = True
+
+            # Jolt away from the baseline on each axis, the baseline holds
+            # still while a tap is checked so the tap is not followed
+            hx = ax - (baseline[0] >> 4)
+            hy = ay - (baseline[1] >> 4)
+            hz = az - (baseline[2] >> 4)
+            if self.tapState != TAP_PEAK and self.tapState != TAP_QUIET:
+                baseline[0] += ((ax << 4) - baseline[0]) >> BASELINE
+                baseline[1] += ((ay << 4) - baseline[1]) >> BASELINE
+                baseline[2] += ((az << 4) - baseline[2]) >> BASELINE
+            jolt = abs(hx) + abs(hy) + abs(hz)
+
+            if detect & (DETECT_TAP | DETECT_DOUBLE_TAP):
+                self._tap(jolt, sample)
+
+            if detect & DETECT_SHAKE:
+                self._shake(hx, hy, hz, sample)
+
+            if detect & DETECT_FREE_FALL:
+                x = ax >> 4
+                y = ay >> 4
+                z = az >> 4
+                size = x * x + y * y + z * z
+                if self.falling:
+                    if size > self.fallEndRaw2:
+                        self.falling = False
+                        self.fallSamples = 0
+                elif size < self.fallRaw2:
+                    self.fallSamples += 1
+                    if self.fallSamples == self.fallLength:
+                        self.falling = True
+                        queue.put(EVENT_FREE_FALL, sample)
+                else:
+                    self.fallSamples = 0
+
+            if detect & DETECT_TILT:
+                self._tilt(sample)
+
+    def _tap(self, jolt, sample):
+        """ Move the tap detector on by a sample
+        jolt: Total jolt on the three axes in raw readings
+        sample: Number of the sample
+        """
+        state = self.tapState
+        if state == TAP_IDLE:
+            # A first tap too long ago to be doubled is forgotten, so the
+            # sample number can wrap
+            if self.tapped and ((sample - self.lastTap) & SAMPLE_MASK) > self.doubleTapLength:
+                self.tapped = False
+            if jolt > self.tapRaw:
+                self.tapState = TAP_PEAK
+                self.tapStart = sample
+                self.tapPeak = jolt
+        elif state == TAP_PEAK:
+            if jolt > self.tapPeak:
+                self.tapPeak = jolt
+            if jolt < (self.tapRaw >> 1):
+                self.tapState = TAP_QUIET
+                self.tapQuiet = sample
+            elif ((sample - self.tapStart) & SAMPLE_MASK) > self.tapLength:
+                # Too long for a tap, wait for it to calm down
+                self.tapState = TAP_REJECT
+                self.tapQuiet = sample
+        elif state == TAP_QUIET:
+            if jolt > self.tapRaw:
+                self.tapState = TAP_REJECT
+                self.tapQuiet = sample
+            elif ((sample - self.tapQuiet) & SAMPLE_MASK) >= self.tapQuietLength:
+                self.tapState = TAP_IDLE
+                if self.detect & DETECT_TAP:
+                    self.queue.put(EVENT_TAP, sample, self.tapPeak)
+                if self.tapped and ((self.tapStart - self.lastTap) & SAMPLE_MASK) <= self.doubleTapLength:
+                    if self.detect & DETECT_DOUBLE_TAP:
+                        self.queue.put(EVENT_DOUBLE_TAP, sample, self.tapPeak)
+                    self.tapped = False
+                else:
+                    self.lastTap = self.tapStart
+                    self.tapped = True
+        elif jolt >= (self.tapRaw >> 1):
+            self.tapQuiet = sample
+        elif ((sample - self.tapQuiet) & SAMPLE_MASK) >= self.tapQuietLength:
+            self.tapState = TAP_IDLE
+
+    def _shake(self, hx, hy, hz, sample):
+        """ Move the shake detector on by a sample
+        hx, hy, hz: Jolt on each axis in raw readings
+        sample: Number of the sample
+        """
+        if ((sample - self.shakeStart) & SAMPLE_MASK) > self.shakeLength:
+            self.shakeSwings = 0
+        if self.shaking and ((sample - self.shakeLast) & SAMPLE_MASK) > self.shakeLength:
+            self.shaking = False
+
+        # The axis with the biggest swing, if it is big enough
+        axis = 0
+        swing = hx
+        if abs(hy) > abs(swing):
+            axis = 1
+            swing = hy
+        if abs(hz) > abs(swing):
+            axis = 2
+            swing = hz
+        if abs(swing) < self.shakeRaw:
+            return
+
+        sign = 1 if swing > 0 else -1
+        if self.shaking:
+            # Still the shake that has been reported
+            self.shakeLast = sample
+        elif axis == self.shakeAxis and sign != self.shakeSign:
+            if self.shakeSwings == 0:
+                self.shakeStart = sample
+            self.shakeSwings += 1
+            if self.shakeSwings == SHAKE_SWINGS:
+                self.queue.put(EVENT_SHAKE, sample, self.shakeSwings)
+                self.shakeSwings = 0
+                self.shaking = True
+                self.shakeLast = sample
+        self.shakeAxis = axis
+        self.shakeSign = sign
+
+    def _tilt(self, sample):
+        """ Move the tilt detector on by a sample, from the baseline
+        sample: Number of the sample
+        """
+        # Readings / 64 so the squares stay small, 64 to 1g
+        x = ((self.baseline[0] >> 4) - self.bias[0]) >> 6
+        y = ((self.baseline[1] >> 4) - self.bias[1]) >> 6
+        z = ((self.baseline[2] >> 4) - self.bias[2]) >> 6
+        side = y * y + z * z
+        if x < 0 or side * 1024 > TILT_SIN2 * (x * x + side):
+            if not self.tilted:
+                self.tiltSamples += 1
+                if self.tiltSamples >= self.tiltLength:
+                    self.tilted = True
+                    self.queue.put(EVENT_TILT, sample)
+        else:
+            self.tiltSamples = 0
+            self.tilted = False
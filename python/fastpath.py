@@ -0,0 +1,223 @@
+"""
+  ____  _           ____        _
+ |  _ \(_) ___ ___ | __ )  ___ | |_
+ | |_) | |/ __/ _ \|  _ \ / _ \| __|
+ |  __/| | (_| (_) | |_) | (_) | |_
+ |_|   |_|\___\___/|____/ \___/ \__|
+ The Pico Bot hot paths, compiled where the firmware allows
+
+ The versions in fastpath_viper.py use the viper and native code emitters
+ and are used when they load. Firmware built without the emitters, or
+ CPython on the host, gets the plain Python versions here, which give the
+ same results. host/fastpath_check.py compares the two and times them.
+
+ By Matthew Page
+
+"""
+
+def decode_xyz_py(burst, offset, out):
+    """ Decode six little endian int16 readings
+    burst: Bytes read from the sensor
+    offset: Index of the first reading in burst
+    out: array('h') of six for the readings
+    """
+    for i in range(6):
+        value = (burst[offset + (i * 2) + 1] << 8) | burst[offset + (i * 2)]
+        if value & 0x8000:
+            value -= 0x10000
+        out[i] = value
+
+def scale_positions_py(raw, offsets, divisors, out, count, height):
+    """ Scale raw readings to pixel positions: abs(raw * 100 - offset) *
+    height // divisor, no more than height
+    raw: array('h') of readings
+    offsets: array('i') of offsets in hundredths of a unit times the raw scale
+    divisors: array('i') of range widths in the same units
+    out: array('h') for the positions
+    count: Number of channels to scale
+    height: Position of the top of the range
+    """
+    for i in range(count):
+        value = (raw[i] * 100) - offsets[i]
+        if value < 0:
+            value = -value
+        value = (value * height) // divisors[i]
+        if value > height:
+            value = height
+        out[i] = value
+
+def channel_spread_py(data, samples, centre, spread, channels, shift):
+    """ Move the recent mean and mean absolute deviation of each channel on
+    through a batch of samples, each sample counts for 1 / (1 << shift) and
+    older ones fade away
+    data: array('h') of samples, six readings each
+    samples: Number of samples in data
+    centre: array('i') of the mean of each channel, shifted up by shift
+    spread: array('i') of the mean absolute deviation, shifted up by shift
+    channels: Number of channels to follow, from the first
+    shift: Samples averaged over, as a power of two
+    """
+    for i in range(channels):
+        mean = centre[i]
+        deviation = spread[i]
+        for j in range(i, samples * 6, 6):
+            delta = data[j] - (mean >> shift)
+            mean += delta
+            if delta < 0:
+                delta = -delta
+            deviation += delta - (deviation >> shift)
+        centre[i] = mean
+        spread[i] = deviation
+
+def fuse_gravity_py(data, samples, gravity, bias, divisor, shift):
+    """ Move a gravity estimate on through a batch of samples, a
+    complementary filter: each gyro reading turns the estimate, then it is
+    pulled a little towards the accelerometer reading
+    data: array('h') of samples, six readings each
+    samples: Number of samples in data
+    gravity: array('i') of three, the estimate at 16 times the accelerometer scale
+    bias: array('h') of six, offsets taken off each reading first
+    divisor: Gyro reading times estimate / 256 that turns it by one sample
+    shift: The pull towards the accelerometer is 1 / (1 << shift) a sample
+    """
+    gx = gravity[0]
+    gy = gravity[1]
+    gz = gravity[2]
+    ox = bias[0] << 4
+    oy = bias[1] << 4
+    oz = bias[2] << 4
+    bx = bias[3]
+    by = bias[4]
+    bz = bias[5]
+    for j in range(0, samples * 6, 6):
+        x = gx >> 8
+        y = gy >> 8
+        z = gz >> 8
+        wx = data[j + 3] - bx
+        wy = data[j + 4] - by
+        wz = data[j + 5] - bz
+
+        # Seen from the sensor gravity turns the opposite way, -w x g, with
+        # the steps rounded towards zero so they do not drift
+        turn = (wz * y) - (wy * z)
+        if turn < 0:
+            gx -= (-turn) // divisor
+        else:
+            gx += turn // divisor
+        turn = (wx * z) - (wz * x)
+        if turn < 0:
+            gy -= (-turn) // divisor
+        else:
+            gy += turn // divisor
+        turn = (wy * x) - (wx * y)
+        if turn < 0:
+            gz -= (-turn) // divisor
+        else:
+            gz += turn // divisor
+
+        gx += ((data[j] << 4) - ox - gx) >> shift
+        gy += ((data[j + 1] << 4) - oy - gy) >> shift
+        gz += ((data[j + 2] << 4) - oz - gz) >> shift
+    gravity[0] = gx
+    gravity[1] = gy
+    gravity[2] = gz
+
+def expand_gs8_py(indices, start, count, palette, line):
+    """ Look up a run of 8 bit palette indices as RGB565 pixels
+    indices: Frame buffer of indices, one byte a pixel
+    start: Pixel to start from
+    count: Number of pixels
+    palette: array('H') of RGB565 colours
+    line: Buffer for the pixels, two bytes each
+    """
+    for i in range(count):
+        colour = palette[indices[start + i]]
+        line[i * 2] = colour & 0xFF
+        line[(i * 2) + 1] = colour >> 8
+
+def expand_gs4_py(indices, start, count, palette, line):
+    """ Look up a run of 4 bit palette indices as RGB565 pixels, the even
+    pixel of each byte is in the high nibble
+    indices: Frame buffer of indices, two pixels a byte
+    start: Pixel to start from
+    count: Number of pixels
+    palette: array('H') of RGB565 colours
+    line: Buffer for the pixels, two bytes each
+    """
+    for i in range(count):
+        pixel = start + i
+        if pixel & 1:
+            colour = palette[indices[pixel >> 1] & 0x0F]
+        else:
+            colour = palette[indices[pixel >> 1] >> 4]
+        line[i * 2] = colour & 0xFF
+        line[(i * 2) + 1] = colour >> 8
+
+def encode_int16_py(data, start, count, out, offset):
+    """ Write int16 readings out as little endian bytes
+    data: array('h') of readings
+    start: Index of the first reading
+    count: Number of readings
+    out: Buffer for the bytes
+    offset: Index in out of the first byte
+    """
+    for i in range(count):
+        value = data[start + i]
+        out[offset + (i * 2)] = value & 0xFF
+        out[offset + (i * 2) + 1] = (value >> 8) & 0xFF
+
+def crc16_py(data, start, count, crc):
+    """ CRC-16/CCITT-FALSE of a run of bytes, start with crc 0xFFFF
+    data: Bytes to check
+    start: Index of the first byte
+    count: Number of bytes
+    crc: CRC so far
+    """
+    for i in range(start, start + count):
+        crc ^= data[i] << 8
+        for bit in range(8):
+            if crc & 0x8000:
+                crc = ((crc << 1) ^ 0x1021) & 0xFFFF
+            else:
+                crc = (crc << 1) & 0xFFFF
+    return crc
+
+def draw_graph_py(display, history, start, count, length, step, x, y, colour):
+    """ Draw one channel of the graph, oldest sample first
+    display: The display to draw on
+    history: array('h') of positions, a ring buffer channel
+    start: Index of the oldest position
+    count: Number of positions
+    length: Size of the ring buffer
+    step: Pixels between positions
+    x: Screen column of the oldest position
+    y: Screen row of position zero
+    colour: Colour of the line
+    """
+    index = start
+    last = history[index]
+    for i in range(count - 1):
+        position = history[index]
+        display.line(x, y + last, x + step, y + position, colour)
+        x += step
+        last = position
+        index += 1
+        if index == length:
+            index = 0
+
+try:
+    from fastpath_viper import decode_xyz, scale_positions, channel_spread, fuse_gravity, expand_gs8, expand_gs4, encode_int16, crc16, draw_graph
+    COMPILED = True
+except Exception:
+    # Missing emitters, or code the firmware's viper cannot compile, which
+    # raises ViperTypeError on import
+    decode_xyz = decode_xyz_py
+    scale_positions = scale_positions_py
+    channel_spread = channel_spread_py
+    fuse_gravity = fuse_gravity_py
+    expand_gs8 = expand_gs8_py
+    expand_gs4 = expand_gs4_py
+    encode_int16 = encode_int16_py
+    crc16 = crc16_py
+    draw_graph = draw_graph_py
+    COMPILED = False
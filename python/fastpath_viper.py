@@ -0,0 +1,269 @@
+"""
+  ____  _           ____        _
+ |  _ \(_) ___ ___ | __ )  ___ | |_
+ | |_) | |/ __/ _ \|  _ \ / _ \| __|
+ |  __/| | (_| (_) | |_) | (_) | |_
+ |_|   |_|\___\___/|____/ \___/ \__|
+ The Pico Bot hot paths for the viper and native code emitters
+
+ Import fastpath rather than this, it falls back to plain Python when these
+ cannot be compiled. Viper reads 16 bit pointers as unsigned so readings are
+ sign extended by hand, and divides by shifting and subtracting, which gives
+ the same whole number results as // on the positive values used here.
+
+ By Matthew Page
+
+"""
+import micropython
+
+@micropython.viper
+def decode_xyz(burst, offset: int, out):
+    src = ptr8(burst)
+    dst = ptr16(out)
+    for i in range(6):
+        j = offset + (i << 1)
+        dst[i] = src[j] | (src[j + 1] << 8)
+
+@micropython.viper
+def scale_positions(raw, offsets, divisors, out, count: int, height: int):
+    src = ptr16(raw)
+    offset = ptr32(offsets)
+    divisor = ptr32(divisors)
+    dst = ptr16(out)
+    for i in range(count):
+        value = int(src[i])
+        if value & 0x8000:
+            value -= 0x10000
+        value = (value * 100) - int(offset[i])
+        if value < 0:
+            value = 0 - value
+        d = int(divisor[i])
+        if value >= d:
+            # Past the top of the range, value * height // d is height or more
+            dst[i] = height
+            continue
+
+        # value * height // d by shifting and subtracting, below height so
+        # only a few steps
+        n = value * height
+        part = d
+        step = 1
+        while (part << 1) <= n:
+            part <<= 1
+            step <<= 1
+        value = 0
+        while step:
+            if n >= part:
+                n -= part
+                value += step
+            part >>= 1
+            step >>= 1
+        dst[i] = value
+
+@micropython.viper
+def channel_spread(data, samples: int, centre, spread, channels: int, shift: int):
+    src = ptr16(data)
+    means = ptr32(centre)
+    deviations = ptr32(spread)
+    end = samples * 6
+    for i in range(channels):
+        mean = int(means[i])
+        deviation = int(deviations[i])
+        j = i
+        while j < end:
+            delta = int(src[j])
+            if delta & 0x8000:
+                delta -= 0x10000
+            delta -= mean >> shift
+            mean += delta
+            if delta < 0:
+                delta = 0 - delta
+            deviation += delta - (deviation >> shift)
+            j += 6
+        means[i] = mean
+        deviations[i] = deviation
+
+@micropython.viper
+def fuse_gravity(data, samples: int, gravity, bias, divisor: int, shift: int):
+    src = ptr16(data)
+    g = ptr32(gravity)
+    b = ptr16(bias)
+    ox = int(b[0])
+    if ox & 0x8000:
+        ox -= 0x10000
+    ox = ox << 4
+    oy = int(b[1])
+    if oy & 0x8000:
+        oy -= 0x10000
+    oy = oy << 4
+    oz = int(b[2])
+    if oz & 0x8000:
+        oz -= 0x10000
+    oz = oz << 4
+    bx = int(b[3])
+    if bx & 0x8000:
+        bx -= 0x10000
+    by = int(b[4])
+    if by & 0x8000:
+        by -= 0x10000
+    bz = int(b[5])
+    if bz & 0x8000:
+        bz -= 0x10000
+    gx = int(g[0])
+    gy = int(g[1])
+    gz = int(g[2])
+    end = samples * 6
+    j = 0
+    while j < end:
+        x = gx >> 8
+        y = gy >> 8
+        z = gz >> 8
+        wx = int(src[j + 3])
+        if wx & 0x8000:
+            wx -= 0x10000
+        wx -= bx
+        wy = int(src[j + 4])
+        if wy & 0x8000:
+            wy -= 0x10000
+        wy -= by
+        wz = int(src[j + 5])
+        if wz & 0x8000:
+            wz -= 0x10000
+        wz -= bz
+
+        turn = (wz * y) - (wy * z)
+        n = turn
+        if n < 0:
+            n = 0 - n
+        q = 0
+        if n >= divisor:
+            part = divisor
+            step = 1
+            while (part << 1) <= n:
+                part <<= 1
+                step <<= 1
+            while step:
+                if n >= part:
+                    n -= part
+                    q += step
+                part >>= 1
+                step >>= 1
+        if turn < 0:
+            gx -= q
+        else:
+            gx += q
+        turn = (wx * z) - (wz * x)
+        n = turn
+        if n < 0:
+            n = 0 - n
+        q = 0
+        if n >= divisor:
+            part = divisor
+            step = 1
+            while (part << 1) <= n:
+                part <<= 1
+                step <<= 1
+            while step:
+                if n >= part:
+                    n -= part
+                    q += step
+                part >>= 1
+                step >>= 1
+        if turn < 0:
+            gy -= q
+        else:
+            gy += q
+        turn = (wy * x) - (wx * y)
+        n = turn
+        if n < 0:
+            n = 0 - n
+        q = 0
+        if n >= divisor:
+            part = divisor
+            step = 1
+            while (part << 1) <= n:
+                part <<= 1
+                step <<= 1
+            while step:
+                if n >= part:
+                    n -= part
+                    q += step
+                part >>= 1
+                step >>= 1
+        if turn < 0:
+            gz -= q
+        else:
+            gz += q
+
+        a = int(src[j])
+        if a & 0x8000:
+            a -= 0x10000
+        gx += ((a << 4) - ox - gx) >> shift
+        a = int(src[j + 1])
+        if a & 0x8000:
+            a -= 0x10000
+        gy += ((a << 4) - oy - gy) >> shift
+        a = int(src[j + 2])
+        if a & 0x8000:
+            a -= 0x10000
+        gz += ((a << 4) - oz - gz) >> shift
+        j += 6
+    g[0] = gx
+    g[1] = gy
+    g[2] = gz
+
+@micropython.viper
+def expand_gs8(indices, start: int, count: int, palette, line):
+    src = ptr8(indices)
+    colours = ptr16(palette)
+    dst = ptr16(line)
+    for i in range(count):
+        dst[i] = colours[src[start + i]]
+
+@micropython.viper
+def expand_gs4(indices, start: int, count: int, palette, line):
+    src = ptr8(indices)
+    colours = ptr16(palette)
+    dst = ptr16(line)
+    pixel = start
+    for i in range(count):
+        if pixel & 1:
+            dst[i] = colours[src[pixel >> 1] & 0x0F]
+        else:
+            dst[i] = colours[src[pixel >> 1] >> 4]
+        pixel += 1
+
+@micropython.viper
+def encode_int16(data, start: int, count: int, out, offset: int):
+    src = ptr16(data)
+    dst = ptr8(out)
+    for i in range(count):
+        value = src[start + i]
+        j = offset + (i << 1)
+        dst[j] = value & 0xFF
+        dst[j + 1] = value >> 8
+
+@micropython.viper
+def crc16(data, start: int, count: int, crc: int) -> int:
+    src = ptr8(data)
+    for i in range(start, start + count):
+        crc ^= src[i] << 8
+        for bit in range(8):
+            if crc & 0x8000:
+                crc = ((crc << 1) ^ 0x1021) & 0xFFFF
+            else:
+                crc = (crc << 1) & 0xFFFF
+    return crc
+
+@micropython.native
+def draw_graph(display, history, start, count, length, step, x, y, colour):
+    index = start
+    last = history[index]
+    for i in range(count - 1):
+        position = history[index]
+        display.line(x, y + last, x + step, y + position, colour)
+        x += step
+        last = position
+        index += 1
+        if index == length:
+            index = 0
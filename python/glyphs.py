@@ -0,0 +1,147 @@
+"""
+  ____  _           ____        _
+ |  _ \(_) ___ ___ | __ )  ___ | |_
+ | |_) | |/ __/ _ \|  _ \ / _ \| __|
+ |  __/| | (_| (_) | |_) | (_) | |_
+ |_|   |_|\___\___/|____/ \___/ \__|
+ The Pico Bot text, glyph atlases of the built in font at larger sizes and
+ readouts that only render when their value changes
+
+ By Matthew Page
+
+"""
+import framebuf
+from sprites import TRANSPARENT, buffer_size
+from widgets import Widget
+
+# Characters baked into an atlas, anything else is drawn as a space
+CHARACTERS = " 0123456789.v%:-Z"
+
+# Size of the built in font's glyphs in pixels
+GLYPH_SIZE = 8
+
+# Atlases made so far, by scale, format and colour
+atlases = {}
+
+def atlas(display, scale, colour):
+    """ The atlas for a size and colour, baked the first time it is asked for
+    display: The display, for its format and transparent value
+    scale: 1, 2 or 3 times the built in font
+    colour: Colour as the display draws it
+    """
+    key = (scale, display.format, colour)
+    found = atlases.get(key)
+    if found is None:
+        found = GlyphAtlas(display, scale, colour)
+        atlases[key] = found
+    return found
+
+class GlyphAtlas():
+    """ Class to hold the characters of the built in 8x8 font scaled up by a
+    whole number, each a frame buffer in the display's format over a single
+    block of memory. They are baked once in one colour so drawing text is
+    one blit a character, with no font rasterising or scaling. The blits
+    only leave out the transparent value, they need no palette, which not
+    every firmware's blit takes."""
+
+    def __init__(self, display, scale=1, colour=1, characters=CHARACTERS):
+        """ Bake the glyphs
+        display: The display, for its format and transparent value
+        scale: Times larger than the built in font
+        colour: Colour as the display draws it
+        characters: Characters to bake
+        """
+        size = GLYPH_SIZE * scale
+        self.scale = scale
+        self.width = size
+        self.height = size
+        self.transparent = display.colour(TRANSPARENT)
+        glyphBytes = buffer_size(size, size, display.format)
+        self.memory = bytearray(glyphBytes * len(characters))
+        memory = memoryview(self.memory)
+
+        # Each character is drawn once at 1x, then copied up block by block
+        small = framebuf.FrameBuffer(bytearray(GLYPH_SIZE), GLYPH_SIZE, GLYPH_SIZE, framebuf.MONO_HLSB)
+        self.glyphs = {}
+        for i in range(len(characters)):
+            glyph = framebuf.FrameBuffer(memory[i * glyphBytes:(i + 1) * glyphBytes], size, size, display.format)
+            glyph.fill(self.transparent)
+            small.fill(0)
+            small.text(characters[i], 0, 0, 1)
+            for y in range(GLYPH_SIZE):
+                for x in range(GLYPH_SIZE):
+                    if small.pixel(x, y):
+                        glyph.fill_rect(x * scale, y * scale, scale, scale, colour)
+            self.glyphs[characters[i]] = glyph
+        self.space = self.glyphs.get(" ")
+
+    def measure(self, text):
+        """ Width of text in pixels
+        text: The string to measure
+        """
+        return len(text) * self.width
+
+    def draw(self, target, text, x, y):
+        """ Draw text by blitting its glyphs
+        target: Frame buffer to draw on
+        text: The string to draw
+        x: Left of the first glyph
+        y: Top of the glyphs
+        """
+        for character in text:
+            glyph = self.glyphs.get(character, self.space)
+            if glyph is not None:
+                target.blit(glyph, x, y, self.transparent)
+            x += self.width
+
+class Readout(Widget):
+    """ Class to show a value as text from an atlas. The text is rendered
+    into a sprite, centred, and only formatted and rendered again when the
+    value changes, so drawing it is a single blit. Its box is where the
+    sprite goes, set with place() or move()."""
+
+    def __init__(self, display, glyphs, length, formatter=None):
+        """ Initialise the readout
+        display: The display it is drawn on, for its format
+        glyphs: GlyphAtlas to draw with, which sets the colour
+        length: Most characters shown
+        formatter: Function from a value to its text, the value is the text if None
+        """
+        super().__init__()
+        self.glyphs = glyphs
+        self.formatter = formatter
+        self.width = glyphs.width * length
+        self.height = glyphs.height
+        self.transparent = glyphs.transparent
+        self.sprite = framebuf.FrameBuffer(bytearray(buffer_size(self.width, self.height, display.format)),
+                                           self.width, self.height, display.format)
+        self.value = None
+        self.place(0, 0, self.width, self.height)
+
+    def update(self, value):
+        """ Show a value, True if it changed and was rendered
+        value: Value to show
+        """
+        if value == self.value:
+            return False
+        self.value = value
+        text = value if self.formatter is None else self.formatter(value)
+        self.sprite.fill(self.transparent)
+        self.glyphs.draw(self.sprite, text, (self.width - self.glyphs.measure(text)) // 2, 0)
+        self.invalidate()
+        return True
+
+    def move(self, x, y):
+        """ Move the readout, the text is not rendered again
+        x: Left of the readout
+        y: Top of the readout
+        """
+        self.place(x, y, self.width, self.height)
+
+    def draw(self, target, dx, dy):
+        """ Blit the rendered text
+        target: Frame buffer to draw on
+        dx: Added to x of the box
+        dy: Added to y of the box
+        """
+        target.blit(self.sprite, self.box[0] + dx, self.box[1] + dy, self.transparent)
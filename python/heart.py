@@ -10,8 +10,15 @@
  By Matthew Page
 
 """
-class Heart:
-    """Class to draw a heart on the display and keep track of the rate of the heart"""
+from widgets import Widget
+
+# Seconds the ring stays bright on each beat
+BEAT_TIME = 0.15
+
+class Heart(Widget):
+    """Class to draw a heart on the display and keep track of the rate of the heart.
+    The ring is drawn a quadrant at a time, its box is the quarter of the
+    screen that quadrant is in."""
 
     def __init__(self, restingRate, maxRate, fps):
         """Initialise the heart
@@ -19,6 +26,7 @@ class Heart:
         maxRate: The maximum rate of the heart
         fps: The number of frames per second
         """
+        super().__init__()
         self.fps = fps
         self.restingRate = restingRate
         self.maxRate = maxRate
@@ -28,12 +36,27 @@ class Heart:
         self.colourLight = 0x07E0
         self.colourLight = 0xFFFF
         self.colourDark = 0x0030
+        self.light = None
+        self.dark = None
+        self.beat = False
+        self.drawn = None
 
-    def draw(self, display):
-        """Draw the heart on the display
-        display: The display to draw on
+    def attach(self, display):
+        """Look up the colours and cover the first quadrant
+        display: The display the heart is drawn on
         """
-        if self.counter < 0 or self.counter / self.fps > 1 / ( self.rate / 60 ):
+        # As the display draws them, palette indices when indexed
+        self.light = display.colour(self.colourLight)
+        self.dark = display.colour(self.colourDark)
+        self.midX = display.MID_X
+        self.midY = display.MID_Y
+        self.place_quad(self.quad)
+
+    def update(self):
+        """Beat the heart if it is time, the ring is only drawn again when it
+        changes quadrant or brightness"""
+        beat = self.counter < 0 or self.counter / self.fps > 1 / ( self.rate / 60 )
+        if beat:
 
             if self.counter > 0:
                 self.quad = int(self.quad / 2)
@@ -41,23 +64,44 @@ class Heart:
                     self.quad = 8
 
             if self.counter > 0:
-                self.counter = -3
-            # Bright on beat
-            display.ellipse(120, 120, 118, 118, self.colourLight, False, self.quad)
-            display.ellipse(120, 120, 119, 119, self.colourLight, False, self.quad)
-            display.ellipse(120, 120, 120, 120, self.colourLight, False, self.quad)
-            #display.ellipse(120, 120, 118, 118, 0x0000, True, 15)
-                
-        else:
-            # Dark off beat
-            display.ellipse(120, 120, 118, 118, self.colourDark, False, self.quad)
-            display.ellipse(120, 120, 119, 119, self.colourDark, False, self.quad)
-            display.ellipse(120, 120, 120, 120, self.colourDark, False, self.quad)
-            #display.ellipse(120, 120, 118, 118, 0x0000, True, 15)
-        
+                self.counter = -max(1, int(self.fps * BEAT_TIME))
+        self.beat = beat
+
+        look = self.quad if beat else -self.quad
+        if look != self.drawn:
+            self.place_quad(self.quad)
+            self.invalidate()
+        self.drawn = look
+
         # Display the heart rate value
         #display.text("{}bpm".format(self.rate), 92, 10, 0x200a)
 
+    def draw(self, target, dx, dy):
+        """Draw the ring quadrant, bright on beat and dark off beat
+        target: Frame buffer to draw on
+        dx: Added to x on the display
+        dy: Added to y on the display
+        """
+        colour = self.light if self.beat else self.dark
+        target.ellipse(120 + dx, 120 + dy, 118, 118, colour, False, self.quad)
+        target.ellipse(120 + dx, 120 + dy, 119, 119, colour, False, self.quad)
+        target.ellipse(120 + dx, 120 + dy, 120, 120, colour, False, self.quad)
+        #display.ellipse(120, 120, 118, 118, 0x0000, True, 15)
+
+    def place_quad(self, quad):
+        """Cover the quarter of the screen a ring quadrant is drawn in
+        quad: The ellipse quadrant mask, one bit
+        """
+        x = self.midX if quad & 0x09 else 0
+        y = 0 if quad & 0x03 else self.midY
+        self.place(x, y, self.midX + 1, self.midY + 1)
+
+    def set_fps(self, fps):
+        """Change the frame rate the heart is ticked at
+        fps: The number of frames per second
+        """
+        self.fps = fps
+
     def tick(self):
         """Tick the heart counter"""
         self.counter += 1
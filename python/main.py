@@ -14,15 +14,53 @@
 """
 import utime
 import math
-from machine import Pin,I2C,PWM,ADC
-from display import LCD_1inch28
-from sensors import QMI8658
+import sys
+from array import array
+from machine import Pin,lightsleep
+from display import LCD_1inch28, COLOUR_RGB565
+from sensors import QMI8658, SampleBatch, I2C_FAST, ODR_250HZ, ACC_LSB_PER_G, GYRO_LSB_PER_DPS, LSB_PER_UNIT, TAP_NONE, TAP_DOUBLE
 from battery import BatteryMeter
 from heart import Heart
+from pacer import FramePacer
+from glyphs import Readout, atlas
+from widgets import Widget, Scene
+from ringbuffer import RingBuffer
+from fastpath import scale_positions, draw_graph
+from orientation import Orientation, AXIS_Y, AXIS_Z
+from calibration import Calibration
+from events import EventQueue, MotionEvents, EVENT_NONE, EVENT_MOVE, EVENT_TAP, EVENT_DOUBLE_TAP, EVENT_SHAKE, DETECT_ALL, DETECT_TAP, DETECT_DOUBLE_TAP
+from animation import Animator, Track, CURRENT, EASE_LINEAR, EASE_IN, EASE_OUT, EASE_IN_OUT
 
 # QMI8658 Sensor
 I2C_SDA = 6
 I2C_SDL = 7
+I2C_FREQ = I2C_FAST
+SENSOR_ODR = ODR_250HZ             # FIFO sample rate, every sample is read
+
+# Any sample past these is a move, in raw sensor units (4096 per g, 64 per
+# dps). Gravity sits on the X axis so it is allowed for there.
+WAKE_RAW = (
+    int(1.8 * ACC_LSB_PER_G), ACC_LSB_PER_G, int(0.8 * ACC_LSB_PER_G),
+    50 * GYRO_LSB_PER_DPS, 50 * GYRO_LSB_PER_DPS, 50 * GYRO_LSB_PER_DPS)
+
+# Taps, shakes, falls and tilts are found in every sample, see events.py.
+# A QMI8658A can find the taps itself, the QMI8658C on most boards cannot.
+HARDWARE_TAP = False
+
+# Wake on motion once asleep: the QMI8658 watches on its own in low power and
+# toggles INT1 when moved, the Pico light sleeps between frames until then
+# and stops reading the sensor
+WAKE_ON_MOTION = True
+WAKE_MG = 200                      # Change in acceleration that wakes the bot
+IMU_INT1 = 23
+
+# Sensor traces, see sensortrace.py. Record every batch read to flash, or
+# play a recording back in place of the sensor to tune the settings above
+# against the same motion every time.
+TRACE_FILE = "trace.bin"
+TRACE_RECORD = False
+TRACE_REPLAY = False
+TRACE_SPEED = 1                    # Times faster than recorded, 0 (SPEED_STEP) for a batch a frame
 
 # LCD Display
 DC = 8
@@ -41,8 +79,18 @@ HEIGHT = 240
 MID_X = int(WIDTH / 2)
 MID_Y = int(HEIGHT / 2)
 FPS = 20
+SLEEP_FPS = 4                      # Frame rate once asleep and the eyes have closed
+PANEL_IDLE_ASLEEP = False          # Put the panel in its 8 colour idle mode while asleep, dim colours such as the off beat heart go black
+PRINT_FRAME_STATS = False          # Print the achieved frame rate every few seconds
+TELEMETRY = False                  # Stream samples and state as binary records on the USB serial, see host/telemetry_recorder.py
+PROFILE_STAGES = False             # Time each stage of the frame, printed with the frame stats, the profiler is only loaded with this or PROFILE_OVERLAY
+PROFILE_OVERLAY = False            # Start with the frame rate and slowest stages on the display, a shake shows or hides them while profiling
+DOUBLE_BUFFER = False              # Send frames from core 1, needs 115KB more heap, 29KB with COLOUR_GS4
+COLOUR_MODE = COLOUR_RGB565        # 1 (COLOUR_GS8) or 2 (COLOUR_GS4) keep palette indices, saving 58KB or 86KB
 DISPLAY_BRIGHT = 65535
 DISPLAY_DIM = 3000
+DISPLAY_BRIGHTEN_MS = 200          # Backlight fade when waking
+DISPLAY_DIM_MS = 1000              # Backlight fade when falling asleep
 
 # Bot states
 STATE_SLEEPING = 0
@@ -60,17 +108,66 @@ EYE_LEFT_X = int(MID_X - ((EYE_WIDTH + EYE_SPACING) / 2))
 EYE_RIGHT_X = EYE_LEFT_X + EYE_WIDTH + EYE_SPACING
 EYE_LEFT = 0
 EYE_RIGHT = 1
+EYE_MOVE_MS = 250                  # Time to open or close the eyes
+EYE_LOOK = 8                       # How far the eyeballs glance to the side
+EYE_REACH = 16                     # Furthest the eyeballs move from the middle sideways
+EYE_BALL_MARGIN = 9                # Eyeball radius and a gap, limits how far it moves up and down
+
+# The eyeballs look downhill, these are pixels moved for a full 1g lean. The
+# signs pick which way on the screen is downhill for how the sensor sits.
+EYE_FOLLOW_X = -32
+EYE_FOLLOW_Y = 24
+
+# Blink and glance keys while awake (time ms, value, easing). They follow
+# the eyes opening and repeat from there.
+LEFT_BLINK = (
+    (5000, EYE_HEIGHT, EASE_LINEAR),
+    (5250, EYE_CLOSED_HEIGHT, EASE_IN),
+    (5500, EYE_HEIGHT, EASE_OUT),
+    (5750, EYE_HEIGHT, EASE_LINEAR),
+    (5950, 10, EASE_IN),
+    (6000, 10, EASE_LINEAR),
+    (6200, EYE_HEIGHT, EASE_OUT),
+    (6500, EYE_HEIGHT, EASE_LINEAR))
+RIGHT_BLINK = (
+    (5950, EYE_HEIGHT, EASE_LINEAR),
+    (6200, EYE_CLOSED_HEIGHT, EASE_IN),
+    (6250, EYE_CLOSED_HEIGHT, EASE_LINEAR),
+    (6500, EYE_HEIGHT, EASE_OUT))
+LOOK = (
+    (2000, 0, EASE_LINEAR),
+    (2300, -EYE_LOOK, EASE_IN_OUT),
+    (3000, -EYE_LOOK, EASE_LINEAR),
+    (3300, 0, EASE_IN_OUT),
+    (6500, 0, EASE_LINEAR))
 
 # Heart beat settings
 HEART_RESTING_RATE = 100
 HEART_MAX_RATE = 300
 
+# How much each motion event works the heart: none, move, tap, double tap,
+# shake, free fall and tilt
+HEART_WORK = (0, 5, 10, 10, 30, 60, 5)
+
 # Graph and bar settings
 XYZ_HEIGHT = 50
 XYZ_TOP = 130
 XYZ_SPACE = 25
 XYZ_START = int((WIDTH - (XYZ_SPACE * 4)) / 2)
-XYZ_MIN_MAX = ((-0.78, 1.47), (-0.77, 2.2), (-3.06, 2.26), (-512, 495), (-403, 437), (-10, 10))
+
+# Range of each reading in g and dps as the sensor reads it, gravity
+# included, until the calibration has seen more
+XYZ_MIN_MAX = ((0.22, 2.47), (-0.77, 2.2), (-3.06, 2.26), (-512, 495), (-403, 437), (-10, 10))
+XYZ_LOW = [int(round(XYZ_MIN_MAX[i][0] * LSB_PER_UNIT[i])) for i in range(6)]
+XYZ_HIGH = [int(round(XYZ_MIN_MAX[i][1] * LSB_PER_UNIT[i])) for i in range(6)]
+
+# Graph scaling in integer maths, set from the calibrated ranges. A raw
+# reading is at abs(raw * 100 - XYZ_OFFSET) * XYZ_HEIGHT // XYZ_DIVISOR
+# pixels from the bottom of its range
+XYZ_OFFSET = array('i', [0, 0, 0, 0, 0, 0])
+XYZ_DIVISOR = array('i', [1, 1, 1, 1, 1, 1])
+CALIBRATION_FILE = "calibration.bin"
+CALIBRATE_AT_BOOT = False          # Calibrate again even when one has been saved
 GRAPH_SAMPLE_RATE = 2              # Frames between sampling
 GRAPH_WIDTH = 24                   # Number of points on the graph
 
@@ -79,52 +176,252 @@ MODE_BARS = 0
 MODE_GRAPH = 1
 MODE_TIME = 150
 
-class Eye():
+ZZZ_SCALE = 2                      # Size of the sleeping Z's, times the built in font
+
+# Screen areas of the bars and the graph (x, y, width, height)
+BARS_AREA = (XYZ_START - 5, XYZ_TOP - 2, (XYZ_SPACE * 4) + 11, XYZ_HEIGHT + 5)
+GRAPH_AREA = (0, XYZ_TOP - 20, WIDTH, XYZ_HEIGHT + 41)
+
+# Depth of each widget in the scene, higher is drawn on top
+Z_ZZZ = 0
+Z_XYZ = 1
+Z_HEART = 2
+Z_BATTERY = 3
+Z_EYES = 4
+Z_OVERLAY = 5
+
+# Profiled stages of the frame
+STAGES = ("sensor", "state", "xyz", "heart", "battery", "eyes", "draw", "show")
+STAGE_SENSOR = 0
+STAGE_STATE = 1
+STAGE_XYZ = 2
+STAGE_HEART = 3
+STAGE_BATTERY = 4
+STAGE_EYES = 5
+STAGE_DRAW = 6
+STAGE_SHOW = 7
+
+class Eye(Widget):
     def __init__(self, x = EYE_LEFT_X, y = EYE_TOP, position = EYE_LEFT):
+        super().__init__()
         self.position = position
         self.width = EYE_WIDTH
         self.height = EYE_CLOSED_HEIGHT
         self.x = x
         self.y = y
         self.ball = EyeBall(self)
-
-    def draw(self, display):
-        display.rect(
-            int(self.x - (self.width / 2)),
-            int(self.y - (self.height / 2)),
-            int(self.width),
-            int(self.height),
-            display.white)
-        self.ball.draw(display)
+        self.key = None
+
+    def attach(self, display):
+        self.colour = display.white
+
+    def update(self):
+        """ Fit the box to the eye, it is dirty if it looks different to
+        the last time"""
+        width = int(self.width)
+        height = int(self.height)
+        left = int(self.x) - int((width + 1) / 2)
+        top = int(self.y) - int((height + 1) / 2)
+        self.place(left, top, width, height)
+
+        # Any change to the outline or the eyeball redraws the eye
+        key = (((width << 8) | height) << 16) | ((int(self.ball.x) & 0xFF) << 8) | (int(self.ball.y) & 0xFF)
+        if key != self.key:
+            self.key = key
+            self.invalidate()
+
+    def draw(self, target, dx, dy):
+        """ Draw the eye's outline and the eyeball inside it"""
+        box = self.box
+        target.rect(box[0] + dx, box[1] + dy, box[2], box[3], self.colour)
+        self.ball.draw(target, self.colour, self.x + dx, self.y + dy)
 
 class EyeBall():
     def __init__(self, eye, x = 0, y = 0, width = EYE_BALL_WIDTH, height = EYE_BALL_HEIGHT):
         self.eye = eye
         self.x = x
         self.y = y
+        self.glance = x
         self.width = width
         self.height = height
 
-    def draw(self, display):
+    def follow(self, x, y):
+        """ Move the eyeball from its glance towards an offset, by less as the
+        eye closes so it stays inside
+        x: Sideways offset with the eye open
+        y: Up and down offset with the eye open
+        """
+        height = int(self.eye.height)
+        reach = max(0, (height >> 1) - EYE_BALL_MARGIN)
+        self.x = max(-EYE_REACH, min(EYE_REACH, int(self.glance) + ((x * height) // EYE_HEIGHT)))
+        self.y = max(-reach, min(reach, y))
+
+    def draw(self, display, colour, x, y):
+        """ Draw the eyeball centred on its offset from x, y"""
         display.ellipse(
-            int(self.eye.x + self.x),
-            int(self.eye.y + self.y),
+            int(x + self.x),
+            int(y + self.y),
             int(min(self.width / 2, math.floor(self.eye.width / 2)-1)),
             int(min(self.height / 2, math.floor(self.eye.height / 2)-1)),
-            display.white,
+            colour,
             True)
 
-def wakeUp():
-    global xyzPositionMinMax, state
+class BarsWidget(Widget):
+    """ The readings as bars, each with its lowest and highest since waking"""
 
-    state = STATE_AWAKE
-    xyzPositionMinMax = [[9999,-9999],[9999,-9999],[9999,-9999],[9999,-9999],[9999,-9999],[9999,-9999]]
+    def __init__(self):
+        super().__init__()
+        self.place(BARS_AREA[0], BARS_AREA[1], BARS_AREA[2], BARS_AREA[3])
+        self.shown = array('h', [0] * 15)
+
+    def attach(self, display):
+        self.colour = display.white
+
+    def update(self):
+        """ The bars are dirty if any position or range moved"""
+        shown = self.shown
+        for i in range(0, 5):
+            j = i * 3
+            if shown[j] != graphData[i] or shown[j + 1] != xyzGraph.low[i] or shown[j + 2] != xyzGraph.high[i]:
+                shown[j] = graphData[i]
+                shown[j + 1] = xyzGraph.low[i]
+                shown[j + 2] = xyzGraph.high[i]
+                self.dirty = True
+
+    def draw(self, target, dx, dy):
+        colour = self.colour
+        top = XYZ_TOP + dy
+        for i in range(0, 5):
+            x = XYZ_START + (XYZ_SPACE * i) + dx
+
+            # Draw the center line
+            target.line(x, top, x, top + XYZ_HEIGHT, colour)
+
+            # Draw the max and min values
+            target.line(x - 2, top + xyzGraph.low[i], x + 2, top + xyzGraph.low[i], colour)
+            target.line(x - 2, top + xyzGraph.high[i], x + 2, top + xyzGraph.high[i], colour)
 
-# Start graph at zero
-xyzGraph = [[0, 0, 0, 0, 0, 0]]
+            # Draw the current value
+            target.ellipse(x, top + graphData[i], 5, 2, colour, True)
 
-# Maximum and minimum values for each sensor
-maxMins = [[0,0],[0,0],[0,0],[0,0],[0,0],[0,0]]
+class GraphWidget(Widget):
+    """ The last few readings as lines, dirty when a sample is added"""
+
+    def __init__(self):
+        super().__init__()
+        self.place(GRAPH_AREA[0], GRAPH_AREA[1], GRAPH_AREA[2], GRAPH_AREA[3])
+
+    def attach(self, display):
+        self.colour = display.white
+
+    def draw(self, target, dx, dy):
+        """ Draw the graph, oldest sample first"""
+        w = int(WIDTH / GRAPH_WIDTH)
+        start = xyzGraph.start()
+        for i in range(0, 5):
+            draw_graph(target, xyzGraph.data[i], start, xyzGraph.count, xyzGraph.length, w, dx, (i * 10) + XYZ_TOP - 20 + dy, self.colour)
+
+def wakeUp():
+    global state, wakeLatency
+
+    state = STATE_AWAKE
+    if lowPower:
+        if motionSeen:
+            wakeLatency = utime.ticks_diff(utime.ticks_us(), motionTicks)
+        lowPowerMode(False)
+
+        # It may have been moved while the sensor was not being read
+        orientation.reset()
+        motionEvents.reset()
+    xyzGraph.reset_range()
+    for track in awakeTracks:
+        animator.play(track)
+
+def fallAsleep():
+    global state
+
+    state = STATE_SLEEPING
+    for track in sleepingTracks:
+        animator.play(track)
+
+    # Keep the ranges the recent readings give, the graph uses them next time
+    if calibration.changed():
+        calibration.save(CALIBRATION_FILE)
+        calibration.scale(XYZ_OFFSET, XYZ_DIVISOR)
+
+def lowPowerMode(on):
+    """ Drop to the sleeping frame rate, and idle the panel, or return to full
+    speed. The frame rate changes from the next frame.
+    on: True to save power
+    """
+    global lowPower, motionSeen
+
+    lowPower = on
+    pacer.set_fps(SLEEP_FPS if on else FPS)
+    heart.set_fps(pacer.fps)
+    if PANEL_IDLE_ASLEEP:
+        LCD.set_idle(on)
+    if WAKE_ON_MOTION:
+        if on:
+            motionSeen = False
+            qmi8658.Enable_WoM(WAKE_MG)
+            motionPin.irq(motionInterrupt, Pin.IRQ_RISING | Pin.IRQ_FALLING)
+            pacer.set_sleep(lightSleep)
+        else:
+            motionPin.irq(None)
+            pacer.set_sleep()
+            qmi8658.Disable_WoM()
+
+def motionInterrupt(pin):
+    """ The sensor toggled its interrupt pin, it has been moved"""
+    global motionSeen, motionTicks
+
+    if not motionSeen:
+        motionSeen = True
+        motionTicks = utime.ticks_us()
+
+def lightSleep(us):
+    """ Sleep away the rest of a frame, the motion interrupt ends it early"""
+    if us >= 1000:
+        lightsleep(us // 1000)
+    else:
+        utime.sleep_us(us)
+
+def loopTrack(target, attribute, value, keys):
+    """ Track that moves to a value then repeats a list of keys
+    target: The object to animate
+    attribute: Name of the value to animate
+    value: Value to start the loop from
+    keys: Tuple of (time, value, easing) keys to repeat
+    """
+    track = Track(target, attribute).key(0, CURRENT).key(EYE_MOVE_MS, value, EASE_OUT)
+    for time, value, easing in keys:
+        track.key(time, value, easing)
+    return animator.add(track.loop(EYE_MOVE_MS))
+
+def moveTrack(target, attribute, value, duration, easing):
+    """ Track that moves from wherever it is to a value
+    target: The object to animate
+    attribute: Name of the value to animate
+    value: Value to end on
+    duration: Milliseconds to get there
+    easing: One of the EASE_ constants
+    """
+    return animator.add(Track(target, attribute).key(0, CURRENT).key(duration, value, easing))
+
+# Scaled positions for this frame and the last few on the graph, which
+# starts at zero. The graph range is the lowest and highest position since
+# waking
+graphData = array('h', [0, 0, 0, 0, 0, 0])
+xyzGraph = RingBuffer(len(graphData), GRAPH_WIDTH)
+xyzGraph.append(graphData)
+
+# Resting offsets and the maximum and minimum raw values for each sensor,
+# measured on the first boot then loaded from flash
+calibration = Calibration(XYZ_LOW, XYZ_HIGH)
+if not calibration.load(CALIBRATION_FILE) or CALIBRATE_AT_BOOT:
+    calibration.start()
+calibration.scale(XYZ_OFFSET, XYZ_DIVISOR)
 
 # Start the heart beat at resting rate
 heart = Heart(HEART_RESTING_RATE, HEART_MAX_RATE, FPS)
@@ -135,95 +432,155 @@ modeCounter = 0
 
 # Setup the default eyes
 leftEye = Eye()
-leftEyeTarget = None
 rightEye = Eye(x = EYE_RIGHT_X)
-rightEyeTarget = None
 
-animationStack = []
-timeAwake = 0
 frame = 0
 
 battery = BatteryMeter(BATTERY_PIN)
 
-LCD = LCD_1inch28(DC, CS, SCK, MOSI, RST, BL)
+LCD = LCD_1inch28(DC, CS, SCK, MOSI, RST, BL, double_buffer=DOUBLE_BUFFER, colour_mode=COLOUR_MODE)
 LCD.set_bl_pwm(DISPLAY_BRIGHT)
-qmi8658 = QMI8658(I2C_SDA, I2C_SDL)
-Vbat = ADC(Pin(BATTERY_PIN))
-state = STATE_SLEEPING
+if PRINT_FRAME_STATS:
+    print("display init {}us".format(LCD.init_us))
+
+# The sleeping Z, rendered once
+zzzText = Readout(LCD, atlas(LCD, ZZZ_SCALE, LCD.white), 1)
+zzzText.update("Z")
+
+# Everything on the display, only what changes is drawn and sent each frame
+bars = BarsWidget()
+graph = GraphWidget()
+scene = Scene(LCD)
+scene.add(zzzText, Z_ZZZ)
+scene.add(bars, Z_XYZ)
+scene.add(graph, Z_XYZ)
+scene.add(heart, Z_HEART)
+scene.add(battery, Z_BATTERY)
+scene.add(leftEye, Z_EYES)
+scene.add(rightEye, Z_EYES)
+
+# Animations for waking up and falling asleep, played against the clock so
+# they run at the same speed whatever the frame rate
+animator = Animator()
+backlight = LCD.set_bl_pwm
+awakeTracks = (
+    loopTrack(leftEye, "height", EYE_HEIGHT, LEFT_BLINK),
+    loopTrack(rightEye, "height", EYE_HEIGHT, RIGHT_BLINK),
+    loopTrack(leftEye.ball, "glance", 0, LOOK),
+    loopTrack(rightEye.ball, "glance", 0, LOOK),
+    animator.add(Track(backlight).key(0, DISPLAY_DIM).key(DISPLAY_BRIGHTEN_MS, DISPLAY_BRIGHT, EASE_OUT)))
+sleepingTracks = (
+    moveTrack(leftEye, "height", EYE_CLOSED_HEIGHT, EYE_MOVE_MS, EASE_IN),
+    moveTrack(rightEye, "height", EYE_CLOSED_HEIGHT, EYE_MOVE_MS, EASE_IN),
+    moveTrack(leftEye.ball, "glance", 0, EYE_MOVE_MS, EASE_IN_OUT),
+    moveTrack(rightEye.ball, "glance", 0, EYE_MOVE_MS, EASE_IN_OUT),
+    animator.add(Track(backlight).key(0, DISPLAY_BRIGHT).key(DISPLAY_DIM_MS, DISPLAY_DIM, EASE_IN_OUT)))
+
+# The trace module is only compiled when a trace is recorded or replayed
+if TRACE_REPLAY:
+    from sensortrace import TraceReplay
+    qmi8658 = TraceReplay(TRACE_FILE, TRACE_SPEED)
+else:
+    qmi8658 = QMI8658(I2C_SDA, I2C_SDL, freq=I2C_FREQ)
+qmi8658.Enable_FIFO(SENSOR_ODR)
+traceRecorder = None
+if TRACE_RECORD and not TRACE_REPLAY:
+    from sensortrace import TraceRecorder, TRACE_BYTES
+    traceRecorder = TraceRecorder(TRACE_FILE, qmi8658.Sample_Rate(), TRACE_BYTES)
+motion = SampleBatch(qmi8658.FIFO_Capacity())
+orientation = Orientation(qmi8658.Sample_Rate())
+orientation.set_bias(calibration.bias)
+eventQueue = EventQueue()
+motionEvents = MotionEvents(qmi8658.Sample_Rate(), eventQueue, WAKE_RAW)
+motionEvents.set_bias(calibration.bias)
+if HARDWARE_TAP:
+    qmi8658.Enable_Tap()
+    motionEvents.enable(DETECT_ALL & ~(DETECT_TAP | DETECT_DOUBLE_TAP))
+motionPin = Pin(IMU_INT1, Pin.IN)
+motionSeen = False
+motionTicks = 0
+wakeLatency = None
+moving = False
+raw = array('h', [0, 0, 0, 0, 0, 0])
 boredom = 0
 boredomMax = 100
 zzz = 1
+lowPower = False
+pacer = FramePacer(FPS)
+profiler = None
+if PROFILE_STAGES or PROFILE_OVERLAY:
+    # Only compiled when used, it is heap the frame buffer needs
+    from profiler import StageProfiler, ProfileOverlay
+    profiler = StageProfiler(STAGES, True, PROFILE_OVERLAY)
+    overlay = scene.add(ProfileOverlay(profiler), Z_OVERLAY)
+telemetry = None
+if TELEMETRY:
+    # Only compiled when used, it is heap the frame buffer needs
+    from telemetry import Telemetry
+    telemetry = Telemetry(getattr(sys.stdout, "buffer", sys.stdout))
+fallAsleep()
+
+# The first frame covers the whole screen, whatever the panel powered up with
+scene.invalidate()
 
 while(True):
 
-    # Read QMI8658 data
-    xyz = qmi8658.Read_XYZ()
-    xyz[0] = xyz[0] - 1
-
-    # Store max and min values for each sensor
-    for i in range(0, 5):
-        maxMins[i] = [
-            min(maxMins[i][0], xyz[i]),
-            max(maxMins[i][1], xyz[i]),
-        ]
-
-    # Clear the display
-    LCD.fill(0x0000)
+    if profiler:
+        profiler.start()
+
+    if qmi8658.wom:
+        # Asleep, the sensor only interrupts when it is moved. A replayed
+        # trace has no interrupt pin so it is asked instead.
+        if TRACE_REPLAY and qmi8658.WoM_Status():
+            motionInterrupt(None)
+        if motionSeen:
+            eventQueue.put(EVENT_MOVE, motionEvents.sample)
+            if traceRecorder:
+                traceRecorder.motion()
+    else:
+        # Read every QMI8658 sample since the last frame, the newest is displayed
+        qmi8658.Read_FIFO(motion)
+        motion.latest(raw)
+        if traceRecorder:
+            traceRecorder.add(motion)
+        if telemetry:
+            telemetry.samples(motion, qmi8658.Sample_Rate())
+
+        # Look for moves, taps and the like in every sample
+        motionEvents.update(motion)
+        if HARDWARE_TAP:
+            tap = qmi8658.Tap_Status()
+            if tap != TAP_NONE:
+                eventQueue.put(EVENT_DOUBLE_TAP if tap == TAP_DOUBLE else EVENT_TAP, motionEvents.sample)
+
+        # Follow which way is down through every sample
+        orientation.update(motion)
+
+        # Follow the recent spread of each reading for the graph ranges
+        calibration.track(motion)
+
+        # Calibrate from the first still second after a fresh install
+        if calibration.running and calibration.add(motion):
+            calibration.save(CALIBRATION_FILE)
+            orientation.set_bias(calibration.bias)
+            orientation.reset()
+            motionEvents.set_bias(calibration.bias)
+
+    if profiler:
+        profiler.mark(STAGE_SENSOR)
 
     # Tick the heart beat
     heart.tick()
 
-    if state == STATE_AWAKE:
-
-        timeAwake += 1
-
-        # BLINK Animation
-        if timeAwake == 100:
-            leftEyeTarget = Eye()
-            leftEyeTarget.height = 3
-        if timeAwake == 105:
-            leftEyeTarget = Eye()
-            leftEyeTarget.height = EYE_HEIGHT
-
-        if timeAwake == 115:
-            leftEyeTarget = Eye()
-            leftEyeTarget.height = 10
-        if timeAwake == 120:
-            leftEyeTarget = Eye()
-            leftEyeTarget.height = EYE_HEIGHT
-
-        if timeAwake == 119:
-            rightEyeTarget = Eye(x = EYE_RIGHT_X)
-            rightEyeTarget.height = 3
-        if timeAwake == 125:
-            rightEyeTarget = Eye(x = EYE_RIGHT_X)
-            rightEyeTarget.height = EYE_HEIGHT
-
-        if timeAwake == 130:
-            timeAwake = 0
-
-    # Animate the eyes
-    if leftEyeTarget:
-        if int(leftEye.height) != int(leftEyeTarget.height):
-            if int(leftEye.height) > int(leftEyeTarget.height):
-                leftEye.height -= 8
-            if int(leftEye.height) < int(leftEyeTarget.height):
-                leftEye.height += 8
-        else:
-            leftEyeTarget = None
-
-    if rightEyeTarget:
-        if int(rightEye.height) != int(rightEyeTarget.height):
-            if int(rightEye.height) > int(rightEyeTarget.height):
-                rightEye.height -= 8
-            if int(rightEye.height) < int(rightEyeTarget.height):
-                rightEye.height += 8
-        else:
-            rightEyeTarget = None
+    # Animate the eyes and backlight
+    animator.update()
 
     if state == STATE_SLEEPING:
 
-        LCD.set_bl_pwm(DISPLAY_DIM)
+        # Once the eyes have closed, the backlight dimmed and any calibration
+        # finished slow right down
+        if not lowPower and not animator.busy() and not calibration.running:
+            lowPowerMode(True)
 
         # Returning heart rate to normal
         heart.rest(5)
@@ -237,39 +594,54 @@ while(True):
             zzzPosition = [155, 30]
         elif zzz >= 3:
             zzzPosition = [160, 40]
-        LCD.text("Z", zzzPosition[0], EYE_TOP - zzzPosition[1], LCD.white)
-        zzz += 0.2
+        zzzText.move(zzzPosition[0], EYE_TOP - zzzPosition[1])
+        zzzText.show(True)
+
+        # The Z's move at the same speed whatever the frame rate
+        zzz += 0.2 * FPS / pacer.fps
         if zzz > 4:
             zzz = 1
 
     if state == STATE_AWAKE:
-        LCD.set_bl_pwm(DISPLAY_BRIGHT)
+
+        # Clear away the last Z
+        zzzText.show(False)
 
         boredom += 1
 
         # Returning heart rate to normal
         heart.rest(1)
 
-    if xyz[0] > 0.8 or xyz[1] > 1 or xyz[2] > 0.8 or abs(xyz[3]) > 50 or abs(xyz[4]) > 50 or abs(xyz[5]) > 50:
+    # Any motion event wakes the bot and works the heart, a double tap
+    # swaps between the bars and the graph and a shake shows or hides the
+    # profiler overlay when profiling
+    moving = False
+    event = eventQueue.get()
+    while event != EVENT_NONE:
+        moving = True
+        heart.work(HEART_WORK[event])
+        if telemetry:
+            telemetry.event(event)
+        if event == EVENT_DOUBLE_TAP and state == STATE_AWAKE:
+            mode = MODE_GRAPH if mode == MODE_BARS else MODE_BARS
+            modeCounter = 0
+        if event == EVENT_SHAKE and profiler:
+            profiler.toggle_overlay()
+        event = eventQueue.get()
 
-        heart.work(5)
+    if moving:
 
         if state == STATE_SLEEPING:
-            leftEyeTarget = Eye()
-            leftEyeTarget.height = 40
-            rightEyeTarget = Eye(rightEye.x)
-            rightEyeTarget.height = 40
             wakeUp()
 
         boredom = 0
 
     if boredom > boredomMax and heart.rate <= heart.restingRate:
-        leftEyeTarget = Eye()
-        leftEyeTarget.height = EYE_CLOSED_HEIGHT
-        rightEyeTarget = Eye(rightEye.x)
-        rightEyeTarget.height = EYE_CLOSED_HEIGHT
         boredom = 0
-        state = 0
+        fallAsleep()
+
+    if profiler:
+        profiler.mark(STAGE_STATE)
 
     #######################################################
     # XYZ Readings
@@ -277,63 +649,20 @@ while(True):
 
     if state == STATE_AWAKE:
 
-        graphData = []
+        # Position on the line scaled correctly: ( reading - min reading ) * scale
+        scale_positions(raw, XYZ_OFFSET, XYZ_DIVISOR, graphData, 5, XYZ_HEIGHT)
 
-        # Each of the 5 readings
+        # Remember max and min positions (not the reading, just the position)
         for i in range(0, 5):
+            xyzGraph.track(i, graphData[i])
+        bars.show(mode == MODE_BARS)
+        bars.update()
 
-            if i == 0:
-                colour = LCD.red
-            elif i == 1:
-                colour = LCD.green
-            elif i == 2:
-                colour = LCD.blue
-            elif i == 3:
-                colour = LCD.yellow
-            elif i == 4:
-                colour = LCD.purple
-
-            colour = LCD.white
-
-            # Calculate the scale based on height and max - min
-            scale = XYZ_HEIGHT / (XYZ_MIN_MAX[i][1] - XYZ_MIN_MAX[i][0])
-
-            # Position on the line scaled correctly: ( reading - min reading ) * scale
-            position = int(abs((xyz[i] - XYZ_MIN_MAX[i][0]) * scale))
-
-            graphData.append(position)
-
-            # Remember max and min positions (not the reading, just the position)
-            xyzPositionMinMax[i][0] = min(xyzPositionMinMax[i][0], position)
-            xyzPositionMinMax[i][1] = max(xyzPositionMinMax[i][1], position)
-
-            if mode == MODE_BARS:
-                # Draw the center line
-                LCD.line(XYZ_START + (XYZ_SPACE * i), XYZ_TOP, XYZ_START + (XYZ_SPACE * i), XYZ_TOP + XYZ_HEIGHT, colour)
-
-                # Draw the max and min values
-                LCD.line(XYZ_START + (XYZ_SPACE * i) - 2, XYZ_TOP + xyzPositionMinMax[i][0], XYZ_START + (XYZ_SPACE * i) + 2, XYZ_TOP + xyzPositionMinMax[i][0], colour)
-                LCD.line(XYZ_START + (XYZ_SPACE * i) - 2, XYZ_TOP + xyzPositionMinMax[i][1], XYZ_START + (XYZ_SPACE * i) + 2, XYZ_TOP + xyzPositionMinMax[i][1], colour)
-
-                # Draw the current value
-                LCD.ellipse(XYZ_START + (XYZ_SPACE * i), XYZ_TOP + position, 5, 2, colour, True)
-
-        # Add to graph data
+        # Add to graph data, the oldest is overwritten once it is full
         if frame % GRAPH_SAMPLE_RATE == 0:
             xyzGraph.append(graphData)
-
-        # Remove old data
-        if len(xyzGraph) > GRAPH_WIDTH:
-            xyzGraph.pop(0)
-
-        # Draw the graph
-        if mode == MODE_GRAPH:
-            w = int(WIDTH / GRAPH_WIDTH)
-            for i in range(0, 5):
-                lastPosition = int(xyzGraph[0][i])
-                for x in range(0, len(xyzGraph) - 1):
-                    LCD.line(x * w, (i * 10) + XYZ_TOP + lastPosition - 20, (x + 1) * w, (i * 10) + XYZ_TOP + int(xyzGraph[x][i]) - 20, LCD.white)
-                    lastPosition = int(xyzGraph[x][i])
+            graph.invalidate()
+        graph.show(mode == MODE_GRAPH)
 
         # Flip the mode
         if modeCounter == MODE_TIME:
@@ -345,16 +674,59 @@ while(True):
 
         modeCounter += 1
 
-    # Draw the heart beat
-    heart.draw(LCD)
+    else:
+        bars.show(False)
+        graph.show(False)
+
+    if profiler:
+        profiler.mark(STAGE_XYZ)
+
+    # Beat the heart
+    heart.update()
+    if profiler:
+        profiler.mark(STAGE_HEART)
+
+    # Read the battery
+    battery.update()
+    if profiler:
+        profiler.mark(STAGE_BATTERY)
+
+    # Move the eyes, looking downhill
+    lookX = orientation.downhill(AXIS_Y, EYE_FOLLOW_X)
+    lookY = orientation.downhill(AXIS_Z, EYE_FOLLOW_Y)
+    leftEye.ball.follow(lookX, lookY)
+    rightEye.ball.follow(lookX, lookY)
+    leftEye.update()
+    rightEye.update()
+    if profiler:
+        profiler.mark(STAGE_EYES)
+
+    # Draw what changed, in depth order. When the last frame ran over the
+    # graph waits, its area is left as it is on the display.
+    if profiler:
+        overlay.update(pacer.achieved)
+    scene.render(graph if pacer.shed else None)
+    if profiler:
+        profiler.mark(STAGE_DRAW)
+
+    # Send what was drawn
+    LCD.show_dirty()
+    if profiler:
+        profiler.mark(STAGE_SHOW)
+        profiler.end()
+    frame += 1
 
-    # Display the battery reading
-    battery.draw(LCD)
+    if PRINT_FRAME_STATS and frame % (FPS * 5) == 0:
+        print(pacer.report())
+        if wakeLatency is not None:
+            print("woke {}us after motion".format(wakeLatency))
+        if profiler:
+            print(profiler.report())
 
-    # Display the eyes
-    leftEye.draw(LCD)
-    rightEye.draw(LCD)
+    # Send what the serial port has room for, the rest waits for next frame
+    if telemetry:
+        telemetry.status(state, mode, heart.rate, battery.centivolts)
+        telemetry.flush()
 
-    LCD.show()
-    frame += 1
-    utime.sleep(1 / FPS)
+    # Sleep for the rest of the frame
+    pacer.wait()
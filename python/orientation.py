@@ -0,0 +1,142 @@
+"""
+  ____  _           ____        _
+ |  _ \(_) ___ ___ | __ )  ___ | |_
+ | |_) | |/ __/ _ \|  _ \ / _ \| __|
+ |  __/| | (_| (_) | |_) | (_) | |_
+ |_|   |_|\___\___/|____/ \___/ \__|
+ The Pico Bot orientation, which way is down from every sensor sample
+
+ By Matthew Page
+
+"""
+from array import array
+import math
+from sensors import ACC_LSB_PER_G, GYRO_LSB_PER_DPS
+from fastpath import fuse_gravity
+
+# The estimate is kept at 16 times the accelerometer scale, this is 1g
+ONE_G = ACC_LSB_PER_G << 4
+
+# Pull towards the accelerometer each sample, 1 / (1 << SMOOTHING). At 250Hz
+# the gyro carries the estimate for about half a second.
+SMOOTHING = 7
+
+# Axes of the estimate, gravity sits on X when the bot is upright
+AXIS_X = 0
+AXIS_Y = 1
+AXIS_Z = 2
+
+def atan2_cd(y, x):
+    """ Angle of the point x, y from the X axis in hundredths of a degree,
+    -18000 to 18000, to within about a quarter of a degree. Keep x and y
+    under 2 ** 17.
+    y: Distance along Y
+    x: Distance along X
+    """
+    ax = abs(x)
+    ay = abs(y)
+    if ax == 0 and ay == 0:
+        return 0
+
+    # atan(z) is close to 45z + 15.64z(1 - z) degrees for z from 0 to 1
+    if ay <= ax:
+        z = (ay << 12) // ax
+        angle = (z * (4500 + ((1564 * (4096 - z)) >> 12))) >> 12
+    else:
+        z = (ax << 12) // ay
+        angle = 9000 - ((z * (4500 + ((1564 * (4096 - z)) >> 12))) >> 12)
+    if x < 0:
+        angle = 18000 - angle
+    return -angle if y < 0 else angle
+
+def isqrt(value):
+    """ Integer square root, rounded down
+    value: A positive integer
+    """
+    if value <= 0:
+        return 0
+    root = value
+    guess = (root + 1) >> 1
+    while guess < root:
+        root = guess
+        guess = (root + value // root) >> 1
+    return root
+
+class Orientation():
+    """ Class to track which way is down with a complementary filter. The
+    gravity estimate is turned by every gyro sample and pulled gently
+    towards the accelerometer, so it follows the bot quickly without the
+    accelerometer's jitter and bumps. It is fed whole FIFO batches, all in
+    integers with nothing allocated per sample, the work is done by
+    fuse_gravity in fastpath."""
+
+    def __init__(self, rate, smoothing=SMOOTHING):
+        """ Initialise the filter
+        rate: Sensor sample rate in Hz
+        smoothing: Pull towards the accelerometer, 1 / (1 << smoothing) a sample
+        """
+        self.gravity = array('i', [ONE_G, 0, 0])
+        self.smoothing = smoothing
+        self.bias = array('h', [0, 0, 0, 0, 0, 0])
+        self.divisor = 1
+        self.settled = False
+        self.set_rate(rate)
+
+    def set_rate(self, rate):
+        """ Change the sample rate the gyro is integrated at
+        rate: Sensor sample rate in Hz
+        """
+        # A sample turns the estimate by gyro / LSB degrees / rate, the
+        # estimate is taken / 256 to keep the products in small integers
+        self.divisor = max(1, int((GYRO_LSB_PER_DPS * 180 * rate) / (256 * math.pi) + 0.5))
+
+    def set_bias(self, bias):
+        """ Offsets taken off the readings, so the gyro reads zero when still
+        and sitting at rest counts as upright
+        bias: Six raw offsets, accelerometer then gyro, as Calibration.bias
+        """
+        for i in range(6):
+            self.bias[i] = bias[i]
+
+    def reset(self):
+        """ Forget the estimate, the next sample starts it again"""
+        self.settled = False
+
+    def update(self, batch):
+        """ Move the estimate on through every sample in a batch
+        batch: SampleBatch read from the sensor FIFO
+        """
+        if batch.count == 0:
+            return
+        if not self.settled:
+            # Start from the first accelerometer reading
+            data = batch.data
+            for i in range(3):
+                self.gravity[i] = (data[i] - self.bias[i]) << 4
+            self.settled = True
+        fuse_gravity(batch.data, batch.count, self.gravity, self.bias, self.divisor, self.smoothing)
+
+    def roll(self):
+        """ Sideways lean in hundredths of a degree"""
+        return atan2_cd(self.gravity[AXIS_Y] >> 4, self.gravity[AXIS_X] >> 4)
+
+    def pitch(self):
+        """ Forwards or backwards lean in hundredths of a degree"""
+        return atan2_cd(self.gravity[AXIS_Z] >> 4, self.gravity[AXIS_X] >> 4)
+
+    def tilt(self):
+        """ Lean in any direction from upright in hundredths of a degree"""
+        y = self.gravity[AXIS_Y] >> 6
+        z = self.gravity[AXIS_Z] >> 6
+        return atan2_cd(isqrt(y * y + z * z) << 2, self.gravity[AXIS_X] >> 4)
+
+    def downhill(self, axis, reach):
+        """ How far along an axis the ground is, rounded to the nearest whole
+        step. The accelerometer reads up, so this is its opposite.
+        axis: One of the AXIS_ constants
+        reach: Result when the axis points straight down
+        """
+        value = self.gravity[axis] * reach
+        if value < 0:
+            return ((-value) + (ONE_G >> 1)) // ONE_G
+        return -((value + (ONE_G >> 1)) // ONE_G)
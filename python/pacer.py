@@ -0,0 +1,88 @@
+"""
+  ____  _           ____        _
+ |  _ \(_) ___ ___ | __ )  ___ | |_
+ | |_) | |/ __/ _ \|  _ \ / _ \| __|
+ |  __/| | (_| (_) | |_) | (_) | |_
+ |_|   |_|\___\___/|____/ \___/ \__|
+ The Pico Bot frame pacer
+
+ By Matthew Page
+
+"""
+import utime
+
+class FramePacer():
+    """ Class to hold the main loop to a steady frame rate and measure how
+    close it gets"""
+
+    def __init__(self, fps):
+        """ Initialise the pacer
+        fps: The target number of frames per second
+        """
+        self.set_fps(fps)
+        self.frameStart = utime.ticks_us()
+        self.frames = 0
+        self.overruns = 0
+        self.used = 0
+        self.shed = False
+        self.achieved = 0
+        self.windowStart = self.frameStart
+        self.windowFrames = 0
+        self.sleep = utime.sleep_us
+
+    def set_fps(self, fps):
+        """ Change the target frame rate, takes effect from the next frame
+        fps: The target number of frames per second
+        """
+        self.fps = fps
+        self.budget = int(1_000_000 / fps)
+
+    def set_sleep(self, sleep=None):
+        """ Change how the rest of each frame is slept away, a sleep that ends
+        early (woken by an interrupt) starts the next frame straight away
+        sleep: Function taking microseconds, None for utime.sleep_us
+        """
+        self.sleep = sleep if sleep is not None else utime.sleep_us
+
+    def elapsed(self):
+        """ Microseconds used so far this frame"""
+        return utime.ticks_diff(utime.ticks_us(), self.frameStart)
+
+    def remaining(self):
+        """ Microseconds left in this frame's budget, negative once over"""
+        return self.budget - self.elapsed()
+
+    def wait(self):
+        """ Sleep away whatever is left of the frame budget and start the
+        next frame. Frames are timed from deadline to deadline so sleep
+        jitter does not add up. If the frame overran the next one starts
+        straight away and shed is set so optional work can be skipped.
+        """
+        now = utime.ticks_us()
+        self.used = utime.ticks_diff(now, self.frameStart)
+        remaining = self.budget - self.used
+        if remaining > 0:
+            self.sleep(remaining)
+            deadline = utime.ticks_add(self.frameStart, self.budget)
+            now = utime.ticks_us()
+            self.frameStart = deadline if utime.ticks_diff(deadline, now) <= 0 else now
+            self.shed = False
+        else:
+            self.overruns += 1
+            self.frameStart = now
+            self.shed = True
+
+        self.frames += 1
+
+        # Work out the achieved frame rate about once a second
+        self.windowFrames += 1
+        window = utime.ticks_diff(self.frameStart, self.windowStart)
+        if window >= 1_000_000:
+            self.achieved = self.windowFrames * 1_000_000 / window
+            self.windowStart = self.frameStart
+            self.windowFrames = 0
+
+    def report(self):
+        """ Summary of the frame timing as text"""
+        return "fps {:.1f}/{} last {}us overruns {}/{}".format(
+            self.achieved, self.fps, self.used, self.overruns, self.frames)
@@ -0,0 +1,199 @@
+"""
+  ____  _           ____        _
+ |  _ \(_) ___ ___ | __ )  ___ | |_
+ | |_) | |/ __/ _ \|  _ \ / _ \| __|
+ |  __/| | (_| (_) | |_) | (_) | |_
+ |_|   |_|\___\___/|____/ \___/ \__|
+ The Pico Bot frame profiler, time spent in each stage of the main loop
+
+ By Matthew Page
+
+"""
+from array import array
+import utime
+from widgets import Widget
+
+# Frames kept for each stage's rolling statistics
+WINDOW = 32
+
+# Overlay position, a box that fits inside the round display at the top
+OVERLAY_X = 62
+OVERLAY_Y = 14
+OVERLAY_WIDTH = 116
+OVERLAY_LINES = 4
+OVERLAY_LINE_HEIGHT = 10
+OVERLAY_HEIGHT = OVERLAY_LINES * OVERLAY_LINE_HEIGHT + 2
+
+# Statistics written by stats()
+STAT_MIN = 0
+STAT_MEAN = 1
+STAT_MAX = 2
+STAT_P95 = 3
+
+class StageProfiler():
+    """ Class to time the stages of each frame with ticks_us. Every call to
+    mark() charges the time since the previous mark to a stage, the last
+    WINDOW times of each stage are kept in fixed arrays. When disabled mark()
+    returns straight away."""
+
+    def __init__(self, names, enabled=False, overlay=False):
+        """ Initialise the profiler
+        names: Tuple of stage names, stages are referred to by index
+        enabled: Start timing straight away
+        overlay: Show the overlay while enabled
+        """
+        self.names = names
+        self.times = array('I', [0] * (len(names) * WINDOW))
+        self.index = 0
+        self.filled = 0
+        self.scratch = array('I', [0] * WINDOW)
+        self.result = array('I', [0] * 4)
+        self.last = utime.ticks_us()
+        self.enabled = enabled
+        self.overlay = overlay
+        self.lines = None
+
+    def enable(self, enabled=True):
+        """ Turn the timing on or off
+        enabled: True to time the stages
+        """
+        self.enabled = enabled
+        self.last = utime.ticks_us()
+
+    def toggle_overlay(self):
+        """ Show or hide the overlay, showing it turns the timing on"""
+        self.overlay = not self.overlay
+        if self.overlay and not self.enabled:
+            self.enable()
+
+    def start(self):
+        """ Begin a frame, time from here is charged to the first mark"""
+        if not self.enabled:
+            return
+        self.last = utime.ticks_us()
+
+    def mark(self, stage):
+        """ Charge the time since the last mark to a stage
+        stage: Index of the stage in names
+        """
+        if not self.enabled:
+            return
+        now = utime.ticks_us()
+        self.times[stage * WINDOW + self.index] = utime.ticks_diff(now, self.last)
+        self.last = now
+
+    def end(self):
+        """ Finish a frame, moving the window on"""
+        if not self.enabled:
+            return
+        self.index += 1
+        if self.index == WINDOW:
+            self.index = 0
+        if self.filled < WINDOW:
+            self.filled += 1
+
+    def stats(self, stage):
+        """ Work out the minimum, mean, maximum and 95th percentile of a
+        stage, returned in a reused array indexed by the STAT_ constants
+        stage: Index of the stage in names
+        """
+        count = self.filled
+        result = self.result
+        if count == 0:
+            for i in range(4):
+                result[i] = 0
+            return result
+
+        # Insertion sort a copy of the window, it is small
+        scratch = self.scratch
+        base = stage * WINDOW
+        total = 0
+        for i in range(count):
+            value = self.times[base + i]
+            total += value
+            j = i
+            while j > 0 and scratch[j - 1] > value:
+                scratch[j] = scratch[j - 1]
+                j -= 1
+            scratch[j] = value
+
+        result[STAT_MIN] = scratch[0]
+        result[STAT_MEAN] = total // count
+        result[STAT_MAX] = scratch[count - 1]
+        result[STAT_P95] = scratch[(count * 95) // 100]
+        return result
+
+    def report(self):
+        """ Summary of every stage as text, min/mean/max/p95 in microseconds"""
+        lines = []
+        for stage in range(len(self.names)):
+            s = self.stats(stage)
+            lines.append("{:<8} {:>6} {:>6} {:>6} {:>6}".format(
+                self.names[stage], s[STAT_MIN], s[STAT_MEAN], s[STAT_MAX], s[STAT_P95]))
+        return "\n".join(lines)
+
+    def refresh(self, fps):
+        """ Rebuild the overlay text: the frame rate and the slowest stages
+        fps: Achieved frames per second
+        """
+        order = []
+        for stage in range(len(self.names)):
+            order.append((self.stats(stage)[STAT_MEAN], stage))
+        order.sort(reverse=True)
+        lines = ["{:.1f} fps".format(fps)]
+        for mean, stage in order[:OVERLAY_LINES - 1]:
+            lines.append("{:<8}{:>6}us".format(self.names[stage], mean))
+        self.lines = lines
+
+class ProfileOverlay(Widget):
+    """ Class to show a profiler's frame rate and slowest stages on the
+    display while its overlay is on. The text is rebuilt about once a second
+    so it can be read and costs little, it is only drawn again then."""
+
+    def __init__(self, profiler):
+        """ Initialise the overlay
+        profiler: The StageProfiler to show
+        """
+        super().__init__()
+        self.profiler = profiler
+        self.frames = 0
+        self.place(OVERLAY_X, OVERLAY_Y, OVERLAY_WIDTH, OVERLAY_HEIGHT)
+        self.visible = False
+
+    def attach(self, display):
+        """ Look up the colours
+        display: The display the overlay is drawn on
+        """
+        self.background = display.black
+        self.foreground = display.white
+
+    def update(self, fps):
+        """ Show or hide the overlay as the profiler says, rebuilding the text
+        when it is due
+        fps: Achieved frames per second
+        """
+        profiler = self.profiler
+        self.show(profiler.overlay and profiler.enabled)
+        if not self.visible:
+            self.frames = 0
+            return
+
+        if profiler.lines is None or self.frames == 0:
+            profiler.refresh(fps)
+            self.frames = WINDOW
+            self.invalidate()
+        self.frames -= 1
+
+    def draw(self, target, dx, dy):
+        """ Draw the text on a black box
+        target: Frame buffer to draw on
+        dx: Added to x on the display
+        dy: Added to y on the display
+        """
+        x = OVERLAY_X + dx
+        y = OVERLAY_Y + dy
+        target.fill_rect(x, y, OVERLAY_WIDTH, OVERLAY_HEIGHT, self.background)
+        y += 2
+        for line in self.profiler.lines:
+            target.text(line, x + 2, y, self.foreground)
+            y += OVERLAY_LINE_HEIGHT
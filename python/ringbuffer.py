@@ -0,0 +1,97 @@
+"""
+  ____  _           ____        _
+ |  _ \(_) ___ ___ | __ )  ___ | |_
+ | |_) | |/ __/ _ \|  _ \ / _ \| __|
+ |  __/| | (_| (_) | |_) | (_) | |_
+ |_|   |_|\___\___/|____/ \___/ \__|
+ The Pico Bot ring buffer, fixed length history for the graph
+
+ By Matthew Page
+
+"""
+from array import array
+
+RANGE_EMPTY_LOW = 32767
+RANGE_EMPTY_HIGH = -32768
+
+class RingBuffer():
+    """ Class to hold the last few samples of several channels, one
+    array('h') per channel written in place so nothing is allocated once it
+    is created. The lowest and highest value seen on each channel are kept
+    as samples are added"""
+
+    def __init__(self, channels, length):
+        """ Initialise the ring buffer
+        channels: Number of values in each sample
+        length: Number of samples kept, the oldest is overwritten
+        """
+        self.channels = channels
+        self.length = length
+        self.data = [array('h', bytes(length * 2)) for i in range(channels)]
+        self.low = array('h', [RANGE_EMPTY_LOW] * channels)
+        self.high = array('h', [RANGE_EMPTY_HIGH] * channels)
+        self.head = 0
+        self.count = 0
+
+    def append(self, values):
+        """ Add a sample, overwriting the oldest when full
+        values: Sequence of at least channels integers
+        """
+        head = self.head
+        low = self.low
+        high = self.high
+        for i in range(self.channels):
+            value = values[i]
+            self.data[i][head] = value
+            if value < low[i]:
+                low[i] = value
+            if value > high[i]:
+                high[i] = value
+        head += 1
+        if head == self.length:
+            head = 0
+        self.head = head
+        if self.count < self.length:
+            self.count += 1
+
+    def track(self, channel, value):
+        """ Include a value in a channel's lowest and highest without storing it
+        channel: Channel the value belongs to
+        value: Integer value
+        """
+        if value < self.low[channel]:
+            self.low[channel] = value
+        if value > self.high[channel]:
+            self.high[channel] = value
+
+    def reset_range(self):
+        """ Forget the lowest and highest values, the samples are kept"""
+        for i in range(self.channels):
+            self.low[i] = RANGE_EMPTY_LOW
+            self.high[i] = RANGE_EMPTY_HIGH
+
+    def clear(self):
+        """ Remove every sample and reset the range"""
+        self.head = 0
+        self.count = 0
+        self.reset_range()
+
+    def start(self):
+        """ Index in the channel arrays of the oldest sample, step forward
+        through count samples wrapping at length for chronological order"""
+        start = self.head - self.count
+        if start < 0:
+            start += self.length
+        return start
+
+    def get(self, channel, n):
+        """ Return a sample value in chronological order
+        channel: Channel to read
+        n: Position from the oldest sample, 0 to count - 1
+        """
+        index = self.head - self.count + n
+        if index < 0:
+            index += self.length
+        elif index >= self.length:
+            index -= self.length
+        return self.data[channel][index]
@@ -1,10 +1,156 @@
 # Vendor class for the QMI8658 6-axis sensor
+import struct
+from array import array
 from machine import Pin,I2C
+from fastpath import decode_xyz
+
+# I2C bus clocks, standard mode is the default and the faster modes are opt in
+I2C_STANDARD = 100_000
+I2C_FAST = 400_000
+I2C_FAST_PLUS = 1_000_000
+
+# First of the timestamp, temperature, accelerometer and gyroscope registers
+# (0x30 to 0x40), read in one burst
+REG_TIMESTAMP = 0x30
+BURST_LENGTH = 17
+BURST_XYZ = 5
+
+# Raw readings per g and per dps at the 8g and 512dps ranges Config_apply()
+# and Enable_FIFO() set, for working in raw integers
+ACC_LSB_PER_G = 4096
+GYRO_LSB_PER_DPS = 64
+LSB_PER_UNIT = (ACC_LSB_PER_G, ACC_LSB_PER_G, ACC_LSB_PER_G, GYRO_LSB_PER_DPS, GYRO_LSB_PER_DPS, GYRO_LSB_PER_DPS)
+
+# Control and FIFO registers
+REG_CTRL1 = 0x02
+REG_CTRL2 = 0x03
+REG_CTRL3 = 0x04
+REG_CTRL7 = 0x08
+REG_CTRL8 = 0x09
+REG_CTRL9 = 0x0A
+REG_CAL1_L = 0x0B
+REG_CAL1_H = 0x0C
+REG_CAL4_H = 0x12
+REG_FIFO_WTM_TH = 0x13
+REG_FIFO_CTRL = 0x14
+REG_FIFO_SMPL_CNT = 0x15
+REG_FIFO_STATUS = 0x16
+REG_FIFO_DATA = 0x17
+REG_STATUSINT = 0x2D
+REG_STATUS1 = 0x2F
+REG_TAP_STATUS = 0x59
+
+# CTRL9 commands
+CMD_ACK = 0x00
+CMD_RST_FIFO = 0x04
+CMD_REQ_FIFO = 0x05
+CMD_WRITE_WOM = 0x08
+CMD_CONFIGURE_TAP = 0x0C
+
+# Output data rates (low nibble of CTRL2/CTRL3) and their nominal rate in Hz
+ODR_1000HZ = 0x03
+ODR_500HZ = 0x04
+ODR_250HZ = 0x05
+ODR_125HZ = 0x06
+ODR_HZ = {ODR_1000HZ: 1000, ODR_500HZ: 500, ODR_250HZ: 250, ODR_125HZ: 125}
+
+# Accelerometer only low power rates, used to watch for motion
+ACC_ODR_LP_128HZ = 0x0C
+ACC_ODR_LP_21HZ = 0x0D
+ACC_ODR_LP_11HZ = 0x0E
+ACC_ODR_LP_3HZ = 0x0F
+
+# CTRL1 value from Config_apply() and its interrupt pin enables
+CTRL1_DEFAULT = 0x60
+CTRL1_INT1_EN = 0x08
+CTRL1_INT2_EN = 0x10
+
+# Wake on motion settings (CAL1_H): interrupt pin, its level before the first
+# motion and the samples ignored after enabling (0 to 63). The pin toggles on
+# every motion event.
+WOM_INT1 = 0x00
+WOM_INT2 = 0x80
+WOM_INITIAL_HIGH = 0x40
+WOM_BLANKING = 4
+STATUS1_WOM = 0x04
+
+# CTRL8: CTRL9 commands handshake through STATUSINT rather than INT1, and
+# the tap engine, which only the QMI8658A has
+CTRL8_HANDSHAKE = 0x80
+CTRL8_TAP_EN = 0x01
+
+# Tap engine settings (CAL registers, written a page at a time): the axis
+# order used when a tap shows on more than one, and the results in STATUS1
+# and TAP_STATUS
+TAP_PRIORITY_XYZ = 0x00
+STATUS1_TAP = 0x02
+TAP_NONE = 0
+TAP_SINGLE = 1
+TAP_DOUBLE = 2
+
+# FIFO_CTRL fields
+FIFO_MODE_BYPASS = 0x00
+FIFO_MODE_FIFO = 0x01
+FIFO_MODE_STREAM = 0x02
+FIFO_SIZE_16 = 0x00
+FIFO_SIZE_32 = 0x04
+FIFO_SIZE_64 = 0x08
+FIFO_SIZE_128 = 0x0C
+FIFO_RD_MODE = 0x80
+FIFO_SAMPLES = {FIFO_SIZE_16: 16, FIFO_SIZE_32: 32, FIFO_SIZE_64: 64, FIFO_SIZE_128: 128}
+
+# FIFO_STATUS flags
+FIFO_STATUS_FULL = 0x80
+FIFO_STATUS_OVERFLOW = 0x20
+
+# Polls of STATUSINT to wait for a CTRL9 command before giving up
+CTRL9_POLLS = 20
+
+class SampleBatch(object):
+    """Samples drained from the sensor FIFO. data holds six raw readings
+    per sample, accelerometer x, y, z then gyroscope x, y, z, oldest first.
+    timestamp is the chip sample counter read with the newest sample."""
+
+    def __init__(self, capacity=128):
+        self.capacity = capacity
+        self.data = array('h', [0] * (capacity * 6))
+        self.view = memoryview(self.data)
+        self.count = 0
+        self.timestamp = 0
+        self.overflow = False
+
+    def sample(self, index, out):
+        """Copy one sample into out, a list or array of six"""
+        base = index * 6
+        data = self.data
+        for i in range(6):
+            out[i] = data[base + i]
+        return out
+
+    def latest(self, out):
+        """Copy the newest sample into out, returns False if the batch is empty"""
+        if self.count == 0:
+            return False
+        self.sample(self.count - 1, out)
+        return True
 
 class QMI8658(object):
-    def __init__(self, I2C_SDA, I2C_SDL, address=0X6B):
+    def __init__(self, I2C_SDA, I2C_SDL, address=0X6B, freq=I2C_STANDARD):
         self._address = address
-        self._bus = I2C(id=1,scl=Pin(I2C_SDL),sda=Pin(I2C_SDA),freq=100_000)
+        self._bus = I2C(id=1,scl=Pin(I2C_SDL),sda=Pin(I2C_SDA),freq=freq)
+        self._burst = bytearray(BURST_LENGTH)
+        self._raw = array('h', [0, 0, 0, 0, 0, 0])
+        self._byte = bytearray(1)
+        self._fifo_count = bytearray(2)
+        self._stamp = bytearray(3)
+        self._fifo_ctrl = 0
+        self._fifo_watermark = 0
+        self.timestamp = 0
+        self.temperature = 0
+        self.odr = ODR_1000HZ
+        self.fifo = False
+        self.wom = False
+        self._ctrl8 = CTRL8_HANDSHAKE
         bRet=self.WhoAmI()
         if bRet :
             self.Read_Revision()
@@ -13,8 +159,8 @@ class QMI8658(object):
         self.Config_apply()
 
     def _read_byte(self,cmd):
-        rec=self._bus.readfrom_mem(int(self._address),int(cmd),1)
-        return rec[0]
+        self._bus.readfrom_mem_into(self._address, cmd, self._byte)
+        return self._byte[0]
     def _read_block(self, reg, length=1):
         rec=self._bus.readfrom_mem(int(self._address),int(reg),length)
         return rec
@@ -36,9 +182,9 @@ class QMI8658(object):
         # REG CTRL1
         self._write_byte(0x02,0x60)
         # REG CTRL2 : QMI8658AccRange_8g  and QMI8658AccOdr_1000Hz
-        self._write_byte(0x03,0x23)
+        self._write_byte(0x03,0x20 | self.odr)
         # REG CTRL3 : QMI8658GyrRange_512dps and QMI8658GyrOdr_1000Hz
-        self._write_byte(0x04,0x53)
+        self._write_byte(0x04,0x50 | self.odr)
         # REG CTRL4 : No
         self._write_byte(0x05,0x00)
         # REG CTRL5 : Enable Gyroscope And Accelerometer Low-Pass Filter
@@ -48,28 +194,190 @@ class QMI8658(object):
         # REG CTRL7 : Enable Gyroscope And Accelerometer
         self._write_byte(0x08,0x03)
 
+    def _read_burst(self):
+        """Read the timestamp, temperature and all six axes in one transaction"""
+        self._bus.readfrom_mem_into(self._address, REG_TIMESTAMP, self._burst)
+        burst = self._burst
+        self.timestamp = (burst[2] << 16) | (burst[1] << 8) | burst[0]
+        self.temperature = struct.unpack_from('<h', burst, 3)[0]
+        return burst
+
+    def Read_Raw_XYZ_into(self, out):
+        """Fill out (an array('h') of six) with the raw accelerometer and
+        gyroscope readings without allocating"""
+        decode_xyz(self._read_burst(), BURST_XYZ, out)
+        return out
+
     def Read_Raw_XYZ(self):
-        xyz=[0,0,0,0,0,0]
-        raw_timestamp = self._read_block(0x30,3)
-        raw_acc_xyz=self._read_block(0x35,6)
-        raw_gyro_xyz=self._read_block(0x3b,6)
-        raw_xyz=self._read_block(0x35,12)
-        timestamp = (raw_timestamp[2]<<16)|(raw_timestamp[1]<<8)|(raw_timestamp[0])
-        for i in range(6):
-            # xyz[i]=(raw_acc_xyz[(i*2)+1]<<8)|(raw_acc_xyz[i*2])
-            # xyz[i+3]=(raw_gyro_xyz[((i+3)*2)+1]<<8)|(raw_gyro_xyz[(i+3)*2])
-            xyz[i] = (raw_xyz[(i*2)+1]<<8)|(raw_xyz[i*2])
-            if xyz[i] >= 32767:
-                xyz[i] = xyz[i]-65535
-        return xyz
-    def Read_XYZ(self):
-        xyz=[0,0,0,0,0,0]
-        raw_xyz=self.Read_Raw_XYZ()
+        self._read_burst()
+        return list(struct.unpack_from('<6h', self._burst, BURST_XYZ))
+
+    def Read_XYZ(self, out=None):
+        """Readings in g and dps, into out if given or a new list"""
+        if out is None:
+            out = [0, 0, 0, 0, 0, 0]
+        return self.Convert_XYZ(self.Read_Raw_XYZ_into(self._raw), out)
+
+    def _ctrl9(self, cmd):
+        """Run a CTRL9 command: write it, wait for CmdDone, then acknowledge"""
+        self._write_byte(REG_CTRL9, cmd)
+        for _ in range(CTRL9_POLLS):
+            if self._read_byte(REG_STATUSINT) & 0x80:
+                break
+        self._write_byte(REG_CTRL9, CMD_ACK)
+        for _ in range(CTRL9_POLLS):
+            if not self._read_byte(REG_STATUSINT) & 0x80:
+                break
+
+    def Enable_FIFO(self, odr=ODR_1000HZ, size=FIFO_SIZE_128, watermark=16, mode=FIFO_MODE_STREAM):
+        """Buffer samples in the chip FIFO so Read_FIFO() gets every one
+        odr: Output data rate for both sensors, one of the ODR_ values
+        size: FIFO depth in samples, one of the FIFO_SIZE_ values
+        watermark: Samples waiting before the watermark flag is raised
+        mode: FIFO_MODE_STREAM drops the oldest samples when full,
+              FIFO_MODE_FIFO stops at full
+        """
+        self.odr = odr
+        self._fifo_ctrl = size | mode
+        self._fifo_watermark = watermark
+        # Sensors off while the FIFO is reconfigured
+        self._write_byte(REG_CTRL7, 0x00)
+        self._write_byte(REG_CTRL2, 0x20 | odr)
+        self._write_byte(REG_CTRL3, 0x50 | odr)
+        # CTRL9 handshake through STATUSINT rather than the INT1 pin
+        self._write_byte(REG_CTRL8, self._ctrl8)
+        self._write_byte(REG_FIFO_WTM_TH, watermark)
+        self._write_byte(REG_FIFO_CTRL, self._fifo_ctrl)
+        self._ctrl9(CMD_RST_FIFO)
+        self._write_byte(REG_CTRL7, 0x03)
+        self.fifo = True
+
+    def Disable_FIFO(self):
+        self._fifo_ctrl = FIFO_MODE_BYPASS
+        self._write_byte(REG_FIFO_CTRL, FIFO_MODE_BYPASS)
+        self.fifo = False
+
+    def FIFO_Capacity(self):
+        """Samples the FIFO can hold with the current settings"""
+        return FIFO_SAMPLES[self._fifo_ctrl & 0x0C]
+
+    def Sample_Rate(self):
+        """Nominal output data rate in Hz"""
+        return ODR_HZ[self.odr]
+
+    def Read_FIFO(self, batch):
+        """Drain every sample waiting in the FIFO into batch with one burst
+        read, returns the number of samples"""
+        self._ctrl9(CMD_REQ_FIFO)
+        self._bus.readfrom_mem_into(self._address, REG_FIFO_SMPL_CNT, self._fifo_count)
+        status = self._fifo_count[1]
+        # The count is in 16 bit words, six per accelerometer and gyroscope sample
+        words = ((status & 0x03) << 8) | self._fifo_count[0]
+        count = min(words // 6, batch.capacity)
+        if count:
+            self._bus.readfrom_mem_into(self._address, REG_FIFO_DATA, batch.view[:count * 6])
+        # Leave FIFO read mode
+        self._write_byte(REG_FIFO_CTRL, self._fifo_ctrl)
+
+        self._bus.readfrom_mem_into(self._address, REG_TIMESTAMP, self._stamp)
+        stamp = self._stamp
+        self.timestamp = (stamp[2] << 16) | (stamp[1] << 8) | stamp[0]
+        batch.timestamp = self.timestamp
+        batch.count = count
+        batch.overflow = bool(status & (FIFO_STATUS_FULL | FIFO_STATUS_OVERFLOW))
+        return count
+
+    def Enable_WoM(self, threshold, pin=WOM_INT1, odr=ACC_ODR_LP_128HZ, blanking=WOM_BLANKING):
+        """Stop sampling and watch for motion with the accelerometer alone in
+        low power mode, the interrupt pin toggles when it moves. Nothing needs
+        reading until then. The FIFO settings are kept for Disable_WoM().
+        threshold: Change in acceleration that counts as motion, in mg (1 to 255)
+        pin: WOM_INT1 or WOM_INT2, with WOM_INITIAL_HIGH if it should start high
+        odr: Accelerometer rate while watching, one of the ACC_ODR_LP_ values
+        blanking: Samples ignored after enabling so settling is not motion
+        """
+        self._write_byte(REG_CTRL7, 0x00)
+        self._write_byte(REG_FIFO_CTRL, FIFO_MODE_BYPASS)
+        self._write_byte(REG_CTRL2, 0x20 | odr)
+        self._write_byte(REG_CAL1_L, threshold)
+        self._write_byte(REG_CAL1_H, (pin & 0xC0) | (blanking & 0x3F))
+        self._write_byte(REG_CTRL8, CTRL8_HANDSHAKE)
+        self._ctrl9(CMD_WRITE_WOM)
+        self._write_byte(REG_CTRL1, CTRL1_DEFAULT | (CTRL1_INT2_EN if pin & WOM_INT2 else CTRL1_INT1_EN))
+        self._read_byte(REG_STATUS1)
+        self._write_byte(REG_CTRL7, 0x01)
+        self.wom = True
+
+    def Disable_WoM(self):
+        """Stop watching for motion and go back to sampling both sensors,
+        into the FIFO if it was enabled"""
+        self._write_byte(REG_CTRL7, 0x00)
+        self._write_byte(REG_CAL1_L, 0)
+        self._write_byte(REG_CAL1_H, 0)
+        self._ctrl9(CMD_WRITE_WOM)
+        self._write_byte(REG_CTRL1, CTRL1_DEFAULT)
+        self.wom = False
+        if self.fifo:
+            self.Enable_FIFO(self.odr, self._fifo_ctrl & 0x0C, self._fifo_watermark, self._fifo_ctrl & 0x03)
+        else:
+            self._write_byte(REG_CTRL2, 0x20 | self.odr)
+            self._write_byte(REG_CTRL8, self._ctrl8)
+            self._write_byte(REG_CTRL7, 0x03)
+
+    def WoM_Status(self):
+        """True if motion was seen since the last call, reading clears it"""
+        return bool(self._read_byte(REG_STATUS1) & STATUS1_WOM)
+
+    def Enable_Tap(self, priority=TAP_PRIORITY_XYZ, peak_window=20, tap_window=50, double_window=250,
+                   alpha=8, gamma=32, peak=819, quiet=409):
+        """Detect single and double taps on the chip, so they are not missed
+        between reads. Only the QMI8658A has the tap engine. Tap_Status()
+        reads the result. It is paused while Enable_WoM() is watching.
+        priority: Axis order used when a tap shows on more than one
+        peak_window: Samples a tap's peak can last
+        tap_window: Samples after a peak that have to be quiet
+        double_window: Samples a second tap can follow in for a double tap
+        alpha: Weight of the filter the peak is found with, in 128ths
+        gamma: Weight of the filter the quiet is checked with, in 128ths
+        peak: Peak acceleration squared that counts as a tap, g squared * 1024
+        quiet: Acceleration under which it counts as quiet, g * 1024
+        """
+        self._write_byte(REG_CTRL7, 0x00)
+        self._bus.writeto_mem(self._address, REG_CAL1_L, bytes([
+            peak_window, priority, tap_window & 0xFF, tap_window >> 8,
+            double_window & 0xFF, double_window >> 8, 0, 0x01]))
+        self._ctrl9(CMD_CONFIGURE_TAP)
+        self._bus.writeto_mem(self._address, REG_CAL1_L, bytes([
+            alpha, gamma, peak & 0xFF, peak >> 8, quiet & 0xFF, quiet >> 8, 0, 0x02]))
+        self._ctrl9(CMD_CONFIGURE_TAP)
+        self._ctrl8 |= CTRL8_TAP_EN
+        if self.wom:
+            self._write_byte(REG_CTRL7, 0x01)
+        else:
+            self._write_byte(REG_CTRL8, self._ctrl8)
+            self._write_byte(REG_CTRL7, 0x03)
+
+    def Disable_Tap(self):
+        """Turn the tap engine off"""
+        self._ctrl8 &= ~CTRL8_TAP_EN
+        self._write_byte(REG_CTRL8, self._ctrl8)
+
+    def Tap_Status(self):
+        """TAP_SINGLE or TAP_DOUBLE if the tap engine has seen a tap since
+        the last call, otherwise TAP_NONE. Reading STATUS1 clears it."""
+        if not self._read_byte(REG_STATUS1) & STATUS1_TAP:
+            return TAP_NONE
+        return self._read_byte(REG_TAP_STATUS) & 0x03
+
+    def Convert_XYZ(self, raw, out):
+        """Convert six raw readings to g and dps, each result is a float so
+        the raw readings are cheaper to work with where it matters"""
         #QMI8658AccRange_8g
-        acc_lsb_div=(1<<12)
+        acc_lsb_div=ACC_LSB_PER_G
         #QMI8658GyrRange_512dps
-        gyro_lsb_div = 64
+        gyro_lsb_div = GYRO_LSB_PER_DPS
         for i in range(3):
-            xyz[i]=raw_xyz[i]/acc_lsb_div#(acc_lsb_div/1000.0)
-            xyz[i+3]=raw_xyz[i+3]*1.0/gyro_lsb_div
-        return xyz
+            out[i]=raw[i]/acc_lsb_div
+            out[i+3]=raw[i+3]*1.0/gyro_lsb_div
+        return out
+
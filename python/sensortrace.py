@@ -0,0 +1,290 @@
+"""
+  ____  _           ____        _
+ |  _ \(_) ___ ___ | __ )  ___ | |_
+ | |_) | |/ __/ _ \|  _ \ / _ \| __|
+ |  __/| | (_| (_) | |_) | (_) | |_
+ |_|   |_|\___\___/|____/ \___/ \__|
+ The Pico Bot sensor traces, raw sample batches recorded to flash and
+ played back in place of the QMI8658
+
+ A trace file is a header then one record for each batch read, all little
+ endian:
+
+   header  "PBTR", version (2), sample rate Hz (2), channels (2), spare (2)
+   batch   ms since recording started (4), sample count (2), flags (2),
+           then count * six int16 raw readings, the FIFO's own bytes
+
+ A batch with FLAG_MOTION and no samples marks the wake on motion interrupt
+ firing while the FIFO was off.
+
+ By Matthew Page
+
+"""
+from array import array
+import struct
+import utime
+from sensors import QMI8658, ACC_LSB_PER_G, TAP_NONE
+
+MAGIC = b"PBTR"
+VERSION = 1
+CHANNELS = 6
+HEADER = "<4sHHHH"
+HEADER_SIZE = 12
+BATCH = "<IHH"
+BATCH_SIZE = 8
+
+FLAG_OVERFLOW = 0x01       # The FIFO filled up before it was read
+FLAG_MOTION = 0x02         # The wake on motion interrupt fired
+
+# Most bytes a recording may take, about 70 seconds awake at 250Hz
+TRACE_BYTES = 262144
+
+# Batches written between flushes to flash, so a trace survives a reset
+FLUSH_BATCHES = 50
+
+# Replay speed that hands back one recorded batch per read, whatever the
+# time, so a run does the same thing on any hardware
+SPEED_STEP = 0
+
+class TraceRecorder():
+    """ Class to record every sample batch read from the sensor to a file
+    in flash. The batches are written straight from their arrays with a
+    small header each, and recording stops once the file reaches its
+    limit."""
+
+    def __init__(self, path, rate, maxBytes=TRACE_BYTES):
+        """ Start a new recording, replacing any trace already there
+        path: File in flash
+        rate: Sensor sample rate in Hz
+        maxBytes: Most bytes the file may grow to
+        """
+        self.maxBytes = maxBytes
+        self.header = bytearray(BATCH_SIZE)
+        self.started = utime.ticks_ms()
+        self.batches = 0
+        self.file = open(path, "wb")
+        self.file.write(struct.pack(HEADER, MAGIC, VERSION, rate, CHANNELS, 0))
+        self.size = HEADER_SIZE
+        self.full = False
+
+    def add(self, batch):
+        """ Record a batch of samples
+        batch: SampleBatch read from the sensor FIFO
+        """
+        self._write(batch.count, FLAG_OVERFLOW if batch.overflow else 0, batch.view[:batch.count * CHANNELS])
+
+    def motion(self):
+        """ Record the wake on motion interrupt firing"""
+        self._write(0, FLAG_MOTION, None)
+
+    def _write(self, count, flags, samples):
+        """ Write one batch record, or stop recording if it would not fit
+        count: Samples in the batch
+        flags: FLAG_ values
+        samples: Raw readings, or None if there are none
+        """
+        if self.full:
+            return
+        size = BATCH_SIZE + (count * CHANNELS * 2)
+        if self.size + size > self.maxBytes:
+            self.close()
+            return
+        struct.pack_into(BATCH, self.header, 0, utime.ticks_diff(utime.ticks_ms(), self.started), count, flags)
+        self.file.write(self.header)
+        if count:
+            self.file.write(samples)
+        self.size += size
+        self.batches += 1
+        if self.batches % FLUSH_BATCHES == 0:
+            self.file.flush()
+
+    def close(self):
+        """ Finish the recording, nothing more is written"""
+        if not self.full:
+            self.full = True
+            self.file.close()
+
+class TraceReplay():
+    """ Class that stands in for the QMI8658, reading a recorded trace back
+    instead of the chip. Batches come back as the replay clock passes the
+    time they were recorded at, speed times faster than real time, or one a
+    read with SPEED_STEP. Wake on motion fires where the recording's did or
+    when a replayed reading moves past the threshold. The trace is streamed
+    from flash, nothing is allocated per read."""
+
+    def __init__(self, path, speed=1):
+        """ Open a trace to play back
+        path: File in flash
+        speed: How many times faster than it was recorded, or SPEED_STEP
+        """
+        self.file = open(path, "rb")
+        magic, version, rate, channels, spare = struct.unpack(HEADER, self.file.read(HEADER_SIZE))
+        if magic != MAGIC or version != VERSION or channels != CHANNELS:
+            raise ValueError("Not a sensor trace")
+        self.rate = rate
+        self.speed = speed
+        self.started = utime.ticks_ms()
+        self.header = bytearray(BATCH_SIZE)
+        self.next = None
+        self.nextCount = 0
+        self.nextFlags = 0
+        self.capacity = 128
+        self.replayed = 0
+        self.finished = False
+        self._sample = array('h', [0] * CHANNELS)
+        self._sampleView = memoryview(self._sample)
+        self._watching = False
+        self._wakeRaw = 0
+        self._wakeBase = None
+        self._moved = False
+        self.timestamp = 0
+        self.fifo = False
+        self.wom = False
+        self._read_header()
+
+    def _read_header(self):
+        """ Read ahead the next batch's header, or finish at the end"""
+        if self.file.readinto(self.header) != BATCH_SIZE:
+            self.next = None
+            self.finished = True
+            return
+        self.next, self.nextCount, self.nextFlags = struct.unpack_from(BATCH, self.header, 0)
+
+    def _due(self):
+        """ True if the next batch has been reached on the replay clock"""
+        if self.next is None:
+            return False
+        if self.speed == SPEED_STEP:
+            return True
+        return utime.ticks_diff(utime.ticks_ms(), self.started) * self.speed >= self.next
+
+    def _take(self, batch, offset):
+        """ Read the next batch's samples into batch at a sample offset,
+        any that do not fit are dropped as the FIFO would, returns the
+        number read
+        batch: SampleBatch to fill
+        offset: Samples already in batch
+        """
+        count = min(self.nextCount, batch.capacity - offset)
+        if count:
+            self.file.readinto(batch.view[offset * CHANNELS:(offset + count) * CHANNELS])
+            batch.sample(offset + count - 1, self._sample)
+        for i in range(self.nextCount - count):
+            self.file.readinto(self._sampleView)
+        self._passed()
+        return count
+
+    def _skip(self):
+        """ Pass over the next batch while the FIFO is off, watching it for
+        motion as the chip would"""
+        for i in range(self.nextCount):
+            self.file.readinto(self._sampleView)
+            if self._watching:
+                self._watch(self._sample)
+        self._passed()
+
+    def _passed(self):
+        """ Finish with the next batch and read ahead to the one after"""
+        self.replayed += self.nextCount
+        if self.nextFlags & FLAG_MOTION:
+            self._moved = True
+        self._read_header()
+
+    def _watch(self, data):
+        """ Compare an accelerometer reading with the one wake on motion
+        started from
+        data: Six raw readings
+        """
+        if self._wakeBase is None:
+            self._wakeBase = array('h', [data[0], data[1], data[2]])
+            return
+        for c in range(3):
+            if abs(data[c] - self._wakeBase[c]) > self._wakeRaw:
+                self._moved = True
+
+    def Enable_FIFO(self, odr=None, size=None, watermark=16, mode=None):
+        """ As QMI8658.Enable_FIFO, the rate is the recorded one"""
+        self.fifo = True
+
+    def Disable_FIFO(self):
+        self.fifo = False
+
+    def FIFO_Capacity(self):
+        """ Samples a read can return"""
+        return self.capacity
+
+    def Sample_Rate(self):
+        """ Rate the trace was recorded at in Hz"""
+        return self.rate
+
+    def Read_FIFO(self, batch):
+        """ Fill batch with the recorded samples now due, whole batches only
+        and no more than it holds, returns the number of samples"""
+        count = 0
+        overflow = False
+        while self._due() and (count == 0 or count + self.nextCount <= batch.capacity):
+            overflow = overflow or bool(self.nextFlags & FLAG_OVERFLOW) or self.nextCount > batch.capacity
+            count += self._take(batch, count)
+            if self.speed == SPEED_STEP and count:
+                break
+        batch.count = count
+        batch.overflow = overflow
+        self.timestamp = self.replayed & 0xFFFFFF
+        batch.timestamp = self.timestamp
+        return count
+
+    def Read_Raw_XYZ_into(self, out):
+        """ The newest replayed reading, into out"""
+        while self._due():
+            self._skip()
+            if self.speed == SPEED_STEP:
+                break
+        for i in range(CHANNELS):
+            out[i] = self._sample[i]
+        return out
+
+    def Read_Raw_XYZ(self):
+        return self.Read_Raw_XYZ_into([0, 0, 0, 0, 0, 0])
+
+    def Read_XYZ(self, out=None):
+        """ Readings in g and dps, into out if given or a new list"""
+        if out is None:
+            out = [0, 0, 0, 0, 0, 0]
+        return self.Convert_XYZ(self.Read_Raw_XYZ_into([0, 0, 0, 0, 0, 0]), out)
+
+    def Convert_XYZ(self, raw, out):
+        return QMI8658.Convert_XYZ(self, raw, out)
+
+    def Enable_WoM(self, threshold, pin=None, odr=None, blanking=None):
+        """ Watch the replayed readings for motion
+        threshold: Change in acceleration that counts as motion, in mg
+        """
+        self._wakeRaw = (threshold * ACC_LSB_PER_G) // 1000
+        self._wakeBase = None
+        self._moved = False
+        self._watching = True
+        self.wom = True
+
+    def Disable_WoM(self):
+        self._watching = False
+        self.wom = False
+
+    def WoM_Status(self):
+        """ True if motion was replayed since the last call"""
+        while self._due():
+            self._skip()
+            if self.speed == SPEED_STEP:
+                break
+        moved = self._moved
+        self._moved = False
+        return moved
+
+    def Enable_Tap(self, *args, **kwargs):
+        """ Traces hold no tap engine results, taps come from the readings"""
+        pass
+
+    def Disable_Tap(self):
+        pass
+
+    def Tap_Status(self):
+        return TAP_NONE
@@ -0,0 +1,28 @@
+"""
+  ____  _           ____        _
+ |  _ \(_) ___ ___ | __ )  ___ | |_
+ | |_) | |/ __/ _ \|  _ \ / _ \| __|
+ |  __/| | (_| (_) | |_) | (_) | |_
+ |_|   |_|\___\___/|____/ \___/ \__|
+ The Pico Bot sprite helpers, shared by the sprites that are rendered once
+ and blitted
+
+ By Matthew Page
+
+"""
+import framebuf
+
+# Sprite pixels left out when a sprite is drawn onto the display
+TRANSPARENT = 0xF81F
+
+def buffer_size(width, height, format):
+    """ Bytes of pixel memory a frame buffer needs
+    width: Width in pixels
+    height: Height in pixels
+    format: framebuf.RGB565, GS8 or GS4_HMSB
+    """
+    if format == framebuf.GS8:
+        return width * height
+    if format == framebuf.GS4_HMSB:
+        return ((width + 1) // 2) * height
+    return width * height * 2
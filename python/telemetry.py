@@ -0,0 +1,204 @@
+"""
+  ____  _           ____        _
+ |  _ \(_) ___ ___ | __ )  ___ | |_
+ | |_) | |/ __/ _ \|  _ \ / _ \| __|
+ |  __/| | (_| (_) | |_) | (_) | |_
+ |_|   |_|\___\___/|____/ \___/ \__|
+ The Pico Bot telemetry, binary records streamed over the USB serial
+
+ Every record is framed the same way, all little endian:
+
+   sync 0xA5 0x5A, type (1), sequence (2), payload length (2), payload, CRC (2)
+
+ The CRC is CRC-16/CCITT-FALSE over the type, sequence, length and payload.
+ The sequence counts every record made, so a gap means records were dropped
+ because the PC was not reading. host/telemetry_recorder.py decodes and
+ records them.
+
+ By Matthew Page
+
+"""
+from array import array
+import select
+import struct
+import utime
+from fastpath import encode_int16, crc16
+
+SYNC = b"\xA5\x5A"
+HEADER = "<2sBHH"
+HEADER_SIZE = 7
+CRC_SIZE = 2
+
+# Record types and their payloads
+RECORD_SAMPLES = 1         # ms, chip sample counter, rate Hz, count, then count * six int16 raw readings
+RECORD_BATTERY = 2         # ms, battery hundredths of a volt
+RECORD_HEART = 3           # ms, heart rate bpm
+RECORD_STATE = 4           # ms, bot state, display mode
+RECORD_EVENT = 5           # ms, motion event
+
+SAMPLES_HEADER = "<IIHB"
+SAMPLES_HEADER_SIZE = 11
+VALUE = "<IH"
+VALUE_SIZE = 6
+STATE = "<IBB"
+STATE_SIZE = 6
+
+# Most samples in one record, bigger batches are split
+MAX_SAMPLES = 32
+
+# Records wait here until the serial port can take them, when it is full new
+# records are dropped
+BUFFER_BYTES = 8192
+
+# Bytes written each time the port says it has room, no more than the USB
+# serial FIFO holds so a write never waits on the PC
+WRITE_BYTES = 64
+
+# Most bytes written a frame, about 60KB a second at 20 frames a second
+FRAME_BYTES = 3072
+
+class Telemetry():
+    """ Class to stream samples and state to a PC as framed binary records.
+    Records are built in a fixed buffer and queued in a ring buffer, which
+    flush() drains only as fast as the serial port accepts without
+    blocking, so the frame never waits on the PC. Nothing is allocated per
+    record."""
+
+    def __init__(self, stream, size=BUFFER_BYTES):
+        """ Initialise the stream
+        stream: Binary stream to write to, sys.stdout.buffer for the USB serial
+        size: Bytes of records that can wait to be sent
+        """
+        self.stream = stream
+        self.poller = select.poll()
+        self.poller.register(stream, select.POLLOUT)
+
+        # ipoll() reuses one result tuple where poll() builds a list each
+        # call, CPython on the host only has poll()
+        self.ready = getattr(self.poller, "ipoll", self.poller.poll)
+        self.queue = bytearray(size)
+        self.queueView = memoryview(self.queue)
+        self.head = 0
+        self.tail = 0
+        self.used = 0
+        self.record = bytearray(HEADER_SIZE + SAMPLES_HEADER_SIZE + (MAX_SAMPLES * 12) + CRC_SIZE)
+        self.recordView = memoryview(self.record)
+        self.sequence = 0
+        self.sent = 0
+        self.dropped = 0
+
+        # Last state sent, so only changes are queued
+        self.shown = array('h', [-1, -1, -1, -1])
+
+    def samples(self, batch, rate):
+        """ Queue every sample in a batch
+        batch: SampleBatch read from the sensor FIFO
+        rate: Sensor sample rate in Hz
+        """
+        now = utime.ticks_ms()
+        record = self.record
+        for start in range(0, batch.count, MAX_SAMPLES):
+            count = min(MAX_SAMPLES, batch.count - start)
+
+            # The chip counter is for the newest sample of the batch, each
+            # record gets the counter of its own newest sample and the PC
+            # counts back from that
+            stamp = (batch.timestamp - (batch.count - start - count)) & 0xFFFFFF
+            struct.pack_into(SAMPLES_HEADER, record, HEADER_SIZE, now, stamp, rate, count)
+            encode_int16(batch.data, start * 6, count * 6, record, HEADER_SIZE + SAMPLES_HEADER_SIZE)
+            self._finish(RECORD_SAMPLES, SAMPLES_HEADER_SIZE + (count * 12))
+
+    def status(self, state, mode, rate, centivolts):
+        """ Queue whichever of the bot's state, heart rate and battery reading
+        have changed since they were last queued
+        state: One of the STATE_ constants in main.py
+        mode: One of the MODE_ constants in main.py
+        rate: Heart rate in beats a minute
+        centivolts: Battery voltage in hundredths of a volt
+        """
+        shown = self.shown
+        if state != shown[0] or mode != shown[1]:
+            shown[0] = state
+            shown[1] = mode
+            self.state(state, mode)
+        if rate != shown[2]:
+            shown[2] = rate
+            self.heart(rate)
+        if centivolts != shown[3]:
+            shown[3] = centivolts
+            self.battery(centivolts)
+
+    def battery(self, centivolts):
+        """ Queue a battery reading
+        centivolts: Battery voltage in hundredths of a volt
+        """
+        struct.pack_into(VALUE, self.record, HEADER_SIZE, utime.ticks_ms(), centivolts)
+        self._finish(RECORD_BATTERY, VALUE_SIZE)
+
+    def heart(self, rate):
+        """ Queue the heart rate
+        rate: Beats a minute
+        """
+        struct.pack_into(VALUE, self.record, HEADER_SIZE, utime.ticks_ms(), rate)
+        self._finish(RECORD_HEART, VALUE_SIZE)
+
+    def state(self, state, mode):
+        """ Queue a change of state
+        state: One of the STATE_ constants in main.py
+        mode: One of the MODE_ constants in main.py
+        """
+        struct.pack_into(STATE, self.record, HEADER_SIZE, utime.ticks_ms(), state, mode)
+        self._finish(RECORD_STATE, STATE_SIZE)
+
+    def event(self, kind):
+        """ Queue a motion event
+        kind: One of the EVENT_ constants in events.py
+        """
+        struct.pack_into(VALUE, self.record, HEADER_SIZE, utime.ticks_ms(), kind)
+        self._finish(RECORD_EVENT, VALUE_SIZE)
+
+    def _finish(self, kind, length):
+        """ Frame the payload in the record buffer and queue it
+        kind: One of the RECORD_ constants
+        length: Payload bytes
+        """
+        record = self.record
+        struct.pack_into(HEADER, record, 0, SYNC, kind, self.sequence, length)
+        self.sequence = (self.sequence + 1) & 0xFFFF
+        end = HEADER_SIZE + length
+        struct.pack_into("<H", record, end, crc16(record, 2, end - 2, 0xFFFF))
+        size = end + CRC_SIZE
+        if self.used + size > len(self.queue):
+            self.dropped += 1
+            return
+
+        # Copy in, in two parts when it wraps round the end
+        first = min(size, len(self.queue) - self.head)
+        self.queueView[self.head:self.head + first] = self.recordView[:first]
+        if first < size:
+            self.queueView[:size - first] = self.recordView[first:size]
+        self.head = (self.head + size) % len(self.queue)
+        self.used += size
+
+    def flush(self, limit=FRAME_BYTES):
+        """ Write queued records while the serial port has room, returns
+        straight away once it has none
+        limit: Most bytes to write this time
+        """
+        written = 0
+        while self.used and written < limit and self._writable():
+            count = min(self.used, WRITE_BYTES, len(self.queue) - self.tail)
+            count = self.stream.write(self.queueView[self.tail:self.tail + count]) or 0
+            if count == 0:
+                break
+            self.tail = (self.tail + count) % len(self.queue)
+            self.used -= count
+            written += count
+        self.sent += written
+        return written
+
+    def _writable(self):
+        """ Non zero if the serial port can take more bytes now"""
+        for stream, events in self.ready(0):
+            return events & select.POLLOUT
+        return 0
@@ -0,0 +1,145 @@
+"""
+  ____  _           ____        _
+ |  _ \(_) ___ ___ | __ )  ___ | |_
+ | |_) | |/ __/ _ \|  _ \ / _ \| __|
+ |  __/| | (_| (_) | |_) | (_) | |_
+ |_|   |_|\___\___/|____/ \___/ \__|
+ The Pico Bot widgets, a retained scene that only redraws what changed
+
+ By Matthew Page
+
+"""
+from array import array
+import framebuf
+
+class Widget():
+    """ Base class for something on the display. A widget has a bounding
+    box, a depth in its scene and a dirty flag it sets when it looks different. The
+    scene clears and redraws the boxes of dirty widgets, so anything that
+    changes how a widget looks must call invalidate() or place()."""
+
+    def __init__(self):
+        """ Initialise the widget with an empty box"""
+        self.z = 0
+        self.box = array('h', [0, 0, 0, 0])
+        self.shownBox = array('h', [0, 0, 0, 0])
+        self.visible = True
+        self.shownVisible = False
+        self.dirty = True
+
+    def attach(self, display):
+        """ Called when added to a scene, to look up colours and the like
+        display: The display the scene draws on
+        """
+        pass
+
+    def place(self, x, y, width, height):
+        """ Move or resize the box, the widget is dirty if it changed
+        x: Left edge
+        y: Top edge
+        width: Width in pixels
+        height: Height in pixels
+        """
+        box = self.box
+        if box[0] != x or box[1] != y or box[2] != width or box[3] != height:
+            box[0] = x
+            box[1] = y
+            box[2] = width
+            box[3] = height
+            self.dirty = True
+
+    def show(self, visible):
+        """ Show or hide the widget, a hidden widget's box is cleared
+        visible: True to draw it
+        """
+        if visible != self.visible:
+            self.visible = visible
+            self.dirty = True
+
+    def invalidate(self):
+        """ Draw the widget again on the next render"""
+        self.dirty = True
+
+    def draw(self, target, dx, dy):
+        """ Draw the widget, subclasses override this
+        target: Frame buffer to draw on, clipped to the area being redrawn
+        dx: Add to x positions on the display to get positions on target
+        dy: Add to y positions on the display to get positions on target
+        """
+        pass
+
+class Scene():
+    """ Class to keep the widgets on the display and redraw them when they
+    change. Each render the boxes of dirty widgets, where they were and
+    where they are now, are marked dirty on the display, which merges them.
+    Each of those areas is cleared and every visible widget touching it is
+    drawn again in z order, clipped to the area through a view of the frame
+    buffer, so untouched areas cost nothing. show_dirty() then sends them."""
+
+    def __init__(self, display):
+        """ Initialise an empty scene
+        display: The display to draw on
+        """
+        self.display = display
+        self.widgets = []
+        self.redrawn = 0
+
+        # Areas in the GS4 format start and end on whole bytes
+        self.align = 1 if display.format == framebuf.GS4_HMSB else 0
+
+    def add(self, widget, z=0):
+        """ Add a widget, in front of any others at the same depth
+        widget: The Widget to add
+        z: Depth, widgets with a higher z are drawn over lower ones
+        """
+        widget.z = z
+        widget.attach(self.display)
+        index = len(self.widgets)
+        while index > 0 and self.widgets[index - 1].z > widget.z:
+            index -= 1
+        self.widgets.insert(index, widget)
+        return widget
+
+    def invalidate(self):
+        """ Redraw the whole display on the next render"""
+        self.display.mark_dirty(0, 0, self.display.width, self.display.height)
+
+    def render(self, hold=None):
+        """ Redraw every area that changed, the areas are left marked dirty
+        on the display for show_dirty()
+        hold: A widget to leave dirty until the next render, or None
+        """
+        display = self.display
+        widgets = self.widgets
+        for widget in widgets:
+            if not widget.dirty or widget is hold:
+                continue
+            shown = widget.shownBox
+            box = widget.box
+            if widget.shownVisible:
+                display.mark_dirty(shown[0], shown[1], shown[2], shown[3])
+            if widget.visible:
+                display.mark_dirty(box[0], box[1], box[2], box[3])
+            for i in range(4):
+                shown[i] = box[i]
+            widget.shownVisible = widget.visible
+            widget.dirty = False
+
+        rects = display.dirty
+        align = self.align
+        self.redrawn = 0
+        for i in range(0, display.dirty_count * 4, 4):
+            x0 = rects[i] & ~align
+            x1 = min(display.width, (rects[i + 2] + align) & ~align)
+            rects[i] = x0
+            rects[i + 2] = x1
+            y0 = rects[i + 1]
+            y1 = rects[i + 3]
+            view = display.view(x0, y0, x1 - x0, y1 - y0)
+            view.fill(display.black)
+            for widget in widgets:
+                box = widget.box
+                if (widget.visible and box[0] < x1 and x0 < box[0] + box[2]
+                        and box[1] < y1 and y0 < box[1] + box[3]):
+                    widget.draw(view, -x0, -y0)
+            self.redrawn += (x1 - x0) * (y1 - y0)